@@ -0,0 +1,311 @@
+'''
+    Benchmark of the author field parsing, single-pass tokenizer against the former find/slice 
+    parsers, with an optional check of their equivalence over cached CRAN/rOpenSci records.
+
+    The expected values of software_kb/test/resources/author_fields_expected.json are the outputs of
+    the former parsers below.
+
+    Usage:
+
+        python3 -m software_kb.benchmark.author_fields --corpus data/ --repeat 20
+'''
+
+import os
+import json
+import time
+import argparse
+
+from software_kb.importing.import_common import process_r_author_field, process_author_field, clean_field, clean_person_field, regex_orcid
+from software_kb.importing.cran_parser import extract_package_record
+from software_kb.importing.local_cache import open_cached_file
+from software_kb.test.test_author_fields import load_expected, normalize_persons
+
+def legacy_process_r_author_field(author_field):
+    '''
+    former find/slice implementation of process_r_author_field(), kept as reference
+    '''
+
+    # first get each person clause
+    author_field = author_field.replace("\n", " ")
+    if author_field.startswith("c(") and author_field.endswith(")"):
+        author_field = author_field[2:-1]
+
+    #print(author_field)
+
+    person_strings = []
+    while len(author_field)>0:
+        pos2 = author_field.find('person(')
+        if pos2 == -1:
+            break;
+
+        pos3 = author_field.find('person(', pos2+1)
+        if pos3 == -1:
+            pos3 = len(author_field)-1
+
+        local_string = author_field[pos2:pos3]
+        local_string = local_string.replace("person(", "")
+        if local_string.endswith("), "):
+            local_string = local_string[:-3]
+
+        person_strings.append(local_string)
+        author_field = author_field[pos3:]
+
+    persons = []
+    for person_string in person_strings:
+        #print("\nPerson")
+        person = {}
+        person_string = person_string.strip()
+        #print(person_string)
+        ind = 0
+        while ind != -1:
+            if len(person_string) <= 1:
+                break
+
+            if person_string.startswith("\""):
+                # we don't have a known attribute, but directly a person name component
+                attribute = 'given'
+            else:
+                ind = person_string.find("=")
+                attribute = None
+
+            if ind != -1:
+                if attribute is None:
+                    attribute = person_string[0:ind].strip(", ")
+            
+                # do we have a list as value?
+                if person_string[ind:].strip().startswith('=c(') or person_string[ind:].strip().startswith('= c('):
+                    ind2 = person_string.find("),", ind)
+                else:
+                    if attribute == 'comment':
+                        ind_com = person_string.find("\"", ind)
+                        ind2 = person_string.find("\"", ind_com+1)
+                        if ind2 != -1:
+                            # shift the last "
+                            ind2 += 1
+                    else:
+                        ind2 = person_string.find(", ", ind)
+                
+                if ind2 == -1:
+                    ind2 = len(person_string)
+
+                value = person_string[ind:ind2].strip(" =\"")
+
+                if value.startswith("c("):
+                    # this is an array
+                    value = value[2:].strip()
+                    pieces = value.split(",")
+                    values = []
+                    for piece in pieces:
+                        values.append(piece.strip(" \""))
+                    value = values
+
+                if attribute == 'comment':
+                    # we extract the orcid if present
+                    # normally the value is a list, but not sure
+                    orcid = None
+                    if isinstance(value, str):
+                        result_match = regex_orcid.search(value)
+                        if not result_match is None:
+                            orcid = result_match.group(1)
+                    else:
+                        for val in value:
+                            result_match = regex_orcid.search(val)
+                            if not result_match is None:
+                                orcid = result_match.group(1)
+                                break
+                    if orcid != None:
+                        person['orcid'] = orcid
+                
+                if attribute == 'given' and isinstance(value, str) and value.find("@") != -1:
+                    # it happens that we have an email address directly after the name
+                    person["email"] = value
+                elif attribute in person:
+                    person[attribute] = person[attribute] + ' ' + value
+                else:
+                    person[attribute] = value
+
+                person_string = person_string[ind2:]
+                person_string = person_string.strip(" ,)")
+
+        persons.append(person)
+
+    persons = [ pers for pers in persons if not len(pers) == 0 ]
+    return clean_person_field(persons)
+
+
+def legacy_process_author_field(author_field):
+    '''
+    former find/slice implementation of process_author_field(), kept as reference
+    '''
+
+    # first get each person clause
+    author_field = author_field.replace("\n", " ")
+
+    persons = []
+
+    pos = 0
+    pieces = []
+    while pos != -1:
+        new_pos = author_field.find("],", pos)
+        if new_pos != -1:
+            local_subfield = author_field[pos:new_pos+2]
+            # try sub-segment for ")," boundaries
+            extra_pos = local_subfield.find("),")
+            if extra_pos != -1:
+                pieces.append(local_subfield[:extra_pos+2].strip())
+                pieces.append(local_subfield[extra_pos+2:].strip())
+            else:
+                pieces.append(local_subfield.strip())
+            pos = new_pos+2
+        else:
+            # last piece
+            pieces.append(author_field[pos:].strip())
+            pos = -1
+
+    for piece in pieces:
+        #print(piece)
+        person = {}
+        last_pos = len(piece)
+        pos = piece.find("<");
+        orcid = None
+        if pos != -1:
+            # find last occuring > in this piece
+            pos2 = piece.find(">");
+            # try to fish an orcid there 
+            result_match = regex_orcid.search(piece[pos:pos2])
+            if not result_match is None:
+                orcid = result_match.group(1)
+            if pos < last_pos:
+                last_pos = pos
+        if orcid != None:
+            person['orcid'] = orcid
+
+        pos = piece.find("[");
+        if pos != -1:
+            pos2 = piece.find("]", pos);
+            if pos2 != -1:
+                # roles are there
+                subpieces = piece[pos+1:pos2].split(",")
+                roles = []
+                for subpiece in subpieces:
+                    if subpiece.endswith(")"):
+                        subpiece = subpiece[:-1]
+                    roles.append(subpiece.strip(" \""))
+                if len(roles)>0:
+                    person["roles"] = roles
+
+            if pos < last_pos:
+                last_pos = pos
+
+        pos = piece.find("(");
+        if pos != -1:
+            pos2 = piece.find(")", pos);
+            if pos2 != -1:
+                # comment
+                person["comment"] = clean_field(piece[pos+1:pos2])
+            if pos < last_pos:
+                last_pos = pos
+
+        # full name - but still the rare possibility of several names separated by a colon
+        final_name = piece[:last_pos].strip()
+        pos3 = final_name.find(",")
+        if pos3 != -1:
+            last_pos = 0
+            subnames = final_name.split(",")
+            for subname in subnames:
+                person = {}
+                person["full_name"] = subname.strip()
+                persons.append(person)
+        else:
+            person["full_name"] = final_name
+            persons.append(person)
+        
+    persons = [ pers for pers in persons if not len(pers) == 0 ]
+    
+    return clean_person_field(persons)
+
+def load_corpus(corpus_path):
+    '''
+    Author fields of the cached rOpenSci package records (JSON) and CRAN package pages (html) under a
+    directory, e.g. data/, return the list of Authors@R fields and the list of Author fields
+    '''
+    r_fields = []
+    fields = []
+    for root, dirs, files in os.walk(corpus_path):
+        for name in files:
+            path = os.path.join(root, name)
+            try:
+                if name.endswith(".json") or name.endswith(".json.gz") or name.endswith(".json.zst"):
+                    with open_cached_file(path, "rt") as the_file:
+                        records = json.load(the_file)
+                    if not isinstance(records, list):
+                        continue
+                    for record in records:
+                        if isinstance(record, dict) and isinstance(record.get("Authors@R"), str):
+                            r_fields.append(record["Authors@R"])
+                        if isinstance(record, dict) and isinstance(record.get("Author"), str):
+                            fields.append(record["Author"])
+                elif name.endswith(".html") or name.endswith(".html.gz") or name.endswith(".html.zst"):
+                    with open_cached_file(path, "rb") as the_file:
+                        record = extract_package_record(the_file.read())
+                    if record is None:
+                        continue
+                    for field, value in record["fields"]:
+                        if field == "Author:":
+                            fields.append(clean_field(value))
+            except Exception as e:
+                print("invalid cached file", path, e)
+    return r_fields, fields
+
+def check_corpus_equivalence(r_fields, fields):
+    nb_differences = 0
+    for parser, legacy_parser, corpus in [(process_r_author_field, legacy_process_r_author_field, r_fields), 
+                                          (process_author_field, legacy_process_author_field, fields)]:
+        for field in corpus:
+            try:
+                expected = normalize_persons(legacy_parser(field))
+            except Exception:
+                # the former parser fails on some malformed fields
+                continue
+            if normalize_persons(parser(field)) != expected:
+                # to be reviewed, normally fields where the former parser failed
+                nb_differences += 1
+                print("different result for:", field)
+    return nb_differences
+
+def benchmark(r_fields, fields, repeat):
+    for label, corpus, parsers in [("Authors@R", r_fields, [("former", legacy_process_r_author_field), ("tokenizer", process_r_author_field)]),
+                                   ("Author", fields, [("former", legacy_process_author_field), ("tokenizer", process_author_field)])]:
+        if len(corpus) == 0:
+            continue
+        print(label + ":", len(corpus), "fields,", sum([ len(field) for field in corpus ]) // len(corpus), "characters on average")
+        for name, parser in parsers:
+            start = time.time()
+            for _ in range(repeat):
+                for field in corpus:
+                    parser(field)
+            runtime = time.time() - start
+            print("%s: %.1f fields/s" % (name, len(corpus) * repeat / runtime))
+
+        # long fields, e.g. packages with hundreds of contributors
+        long_field = ", ".join(corpus * max(1, 20000 // len(corpus))) if label == "Author" else "c(" + ", ".join([ field[2:-1] if field.startswith("c(") else field for field in corpus ] * max(1, 20000 // len(corpus))) + ")"
+        for name, parser in parsers:
+            start = time.time()
+            parser(long_field)
+            print("%s, one field of %d characters: %.3f s" % (name, len(long_field), time.time() - start))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Equivalence and benchmark of the author field parsing over cached CRAN/rOpenSci records")
+    parser.add_argument("--corpus", default=None, help="directory of cached CRAN pages and rOpenSci records, e.g. data/, default are the test samples")
+    parser.add_argument("--repeat", type=int, default=20, help="number of times the corpus is parsed")
+
+    args = parser.parse_args()
+
+    if args.corpus is not None:
+        r_fields, fields = load_corpus(args.corpus)
+        print("differences with the former parsers:", check_corpus_equivalence(r_fields, fields))
+    else:
+        expected = load_expected()
+        r_fields = [ case["field"] for case in expected if case["type"] == "Authors@R" ]
+        fields = [ case["field"] for case in expected if case["type"] == "Author" ]
+    benchmark(r_fields, fields, args.repeat)
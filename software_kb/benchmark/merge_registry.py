@@ -0,0 +1,80 @@
+'''
+    Benchmark of the merging decisions, union-find merge registry against the former 
+    StagingArea.register_merging() logic (in memory, without its database round trips).
+
+    The expected lists of software_kb/test/resources/merge_registry_expected.json are the outputs of
+    the former logic below for the decisions of random_decisions() with the sizes (10, 5), (100, 80),
+    (1000, 1500) and (1000, 200).
+
+    Usage:
+
+        python3 -m software_kb.benchmark.merge_registry --nb-entities 100000 --nb-decisions 50000
+'''
+
+import time
+import random
+import argparse
+
+from software_kb.common.merge_registry import MergeRegistry
+
+def legacy_register_merging(lists, index, entity_id1, entity_id2):
+    '''
+    Former StagingArea.register_merging() logic, with dicts in place of the merging_lists and
+    merging_entities collections
+    '''
+    list1_id = index.get(entity_id1)
+    list2_id = index.get(entity_id2)
+    if list1_id != None and list1_id == list2_id:
+        return True
+    if list1_id != None and list2_id != None:
+        for local_id in lists[list2_id]:
+            if not local_id in lists[list1_id]:
+                lists[list1_id].append(local_id)
+            index[local_id] = list1_id
+        del lists[list2_id]
+    elif list1_id != None:
+        lists[list1_id].append(entity_id2)
+        index[entity_id2] = list1_id
+    elif list2_id != None:
+        lists[list2_id].append(entity_id1)
+        index[entity_id1] = list2_id
+    else:
+        list_id = len(index)
+        lists[list_id] = [entity_id1, entity_id2]
+        index[entity_id1] = list_id
+        index[entity_id2] = list_id
+    return True
+
+def random_decisions(nb_entities, nb_decisions, seed=7):
+    local_random = random.Random(seed)
+    decisions = []
+    for _ in range(nb_decisions):
+        entity1 = local_random.randrange(nb_entities)
+        entity2 = local_random.randrange(nb_entities)
+        if entity1 != entity2:
+            decisions.append(("software/" + str(entity1), "software/" + str(entity2)))
+    return decisions
+
+def benchmark(nb_entities, nb_decisions):
+    decisions = random_decisions(nb_entities, nb_decisions)
+    start = time.time()
+    lists = {}
+    index = {}
+    for entity_id1, entity_id2 in decisions:
+        legacy_register_merging(lists, index, entity_id1, entity_id2)
+    print("former logic (in memory, without the database round trips): %.2f s" % (time.time() - start))
+    start = time.time()
+    registry = MergeRegistry()
+    for entity_id1, entity_id2 in decisions:
+        registry.union(entity_id1, entity_id2)
+    print("union-find registry: %.2f s, %d merging lists" % (time.time() - start, len(registry)))
+    print("same lists as the former logic:", sorted([ members for _, members in registry.lists() ]) == sorted(lists.values()))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Benchmark of the merge registry")
+    parser.add_argument("--nb-entities", type=int, default=100000, help="number of entities for the benchmark")
+    parser.add_argument("--nb-decisions", type=int, default=50000, help="number of merging decisions for the benchmark")
+
+    args = parser.parse_args()
+
+    benchmark(args.nb_entities, args.nb_decisions)
@@ -0,0 +1,187 @@
+'''
+    Benchmark of the TEI bibliographical reference conversion, precompiled converter against the 
+    former StagingArea.tei2json() conversion, with an optional check of their equivalence over a 
+    corpus of references.
+
+    The expected values of software_kb/test/resources/tei_converter_expected.json are the outputs of
+    the former conversion below.
+
+    Usage:
+
+        python3 -m software_kb.benchmark.tei_converter --corpus references.jsonl --nb-workers 4
+'''
+
+import json
+import time
+import argparse
+import multiprocessing
+from lxml import etree
+
+from software_kb.common.tei_converter import tei_to_json, convert_teis
+from software_kb.test.test_tei_converter import load_expected
+
+# former StagingArea.tei2json() conversion (without the DOI lookup), with the XPath expressions evaluated for each reference
+def legacy_tei2json(tei):
+    json_bib = {}
+    root = etree.fromstring(tei)
+
+    x_title = '/biblStruct/analytic/title[@level="a"]'
+    x_doi = '/biblStruct/analytic/idno[@type="DOI"]'
+    x_pmid = '/biblStruct/analytic/idno[@type="PMID"]'
+    x_pmcid = '/biblStruct/analytic/idno[@type="PMCID"]'
+    x_oa_link = '/biblStruct/analytic/ptr[@type="open-access"]/@target'
+    x_publisher = '/biblStruct/monogr/imprint/publisher'
+    x_journal = '/biblStruct/monogr/title[@level="j"]'
+    x_monograph = '/biblStruct/monogr/title[@level="m"]'
+    x_volume = '/biblStruct/monogr/imprint/biblScope[@unit="volume"]'
+    x_issue = '/biblStruct/monogr/imprint/biblScope[@unit="issue"]'
+    x_page_from = '/biblStruct/monogr/imprint/biblScope[@unit="page"]/@from'
+    x_page_to = '/biblStruct/monogr/imprint/biblScope[@unit="page"]/@to'
+    x_pages = '/biblStruct/monogr/imprint/biblScope[@unit="page"]'
+    x_issn = '/biblStruct/monogr/idno[@type="ISSN"]'
+    x_isbn = '/biblStruct/monogr/idno[@type="ISBN"]'
+    x_date = '/biblStruct/monogr/imprint/date[@type="published"]'
+    x_url = '/biblStruct/analytic/ptr[not(@type)]'
+    x_meeting_title = '/biblStruct/monogr/meeting/title'
+    x_author_persons = '/biblStruct/analytic/author/persName'
+
+    local_doi = _get_first_value_xpath(root, x_doi)
+    if local_doi != None:
+        json_bib['DOI'] = local_doi
+    local_pmid = _get_first_value_xpath(root, x_pmid)
+    if local_pmid != None:
+        json_bib["pmid"] = local_pmid
+    local_pmcid = _get_first_value_xpath(root, x_pmcid)
+    if local_pmcid != None:
+        json_bib["pmcid"] = local_pmcid
+    local_url = _get_first_value_xpath(root, x_url)
+    if local_url != None:
+        json_bib['URL'] = local_url
+    json_bib['author'] = _get_all_values_authors_xpath(root, x_author_persons)
+    local_volume = _get_first_value_xpath(root, x_volume)
+    if local_volume != None:
+        json_bib["volume"] = local_volume
+    local_issn = _get_first_value_xpath(root, x_issn)
+    if local_issn != None:
+        json_bib["ISSN"] = local_issn
+    local_isbn = _get_first_value_xpath(root, x_isbn)
+    if local_isbn != None:
+        json_bib["ISBN"] = local_isbn
+    local_issue = _get_first_value_xpath(root, x_issue)
+    if local_issue != None:
+        json_bib["issue"] = local_issue
+    local_oa_link = _get_first_attribute_value_xpath(root, x_oa_link)
+    if local_oa_link != None:
+        json_bib["oaLink"] = local_oa_link
+    json_bib["title"] = []
+    local_title = _get_first_value_xpath(root, x_title)
+    if local_title != None:
+        json_bib["title"].append(local_title)
+    local_publisher = _get_first_value_xpath(root, x_publisher)
+    if local_publisher != None:
+        json_bib["publisher"] = local_publisher
+    local_date = _get_date_xpath(root, x_date)
+    if local_date != None:
+        json_bib["date"] = local_date
+        parts = []
+        date_parts = local_date.split("-")
+        if len(date_parts) > 0:
+            parts.append(date_parts[0])
+        if len(date_parts) > 1:
+            parts.append(date_parts[1])
+        if len(date_parts) > 2:
+            parts.append(date_parts[2])
+        json_bib["published-online"] = { "date-parts": [ parts ] }
+    page_from = _get_first_attribute_value_xpath(root, x_page_from)
+    page_to =  _get_first_attribute_value_xpath(root, x_page_to)
+    if page_from is not None and page_to is not None:
+        json_bib["page"] = page_from + '-' + page_to
+    else:
+        local_page_range = _get_first_value_xpath(root, x_pages)
+        if local_page_range != None:
+            json_bib["page"] = local_page_range
+    json_bib["container-title"] = []
+    title_journal = _get_first_value_xpath(root, x_journal)
+    if title_journal != None and len(title_journal) > 0:
+        json_bib["container-title"].append(title_journal)
+    title_monograph = _get_first_value_xpath(root, x_monograph)
+    if title_monograph != None and len(title_monograph) > 0:
+        json_bib["container-title"].append(title_monograph)
+    event_title = _get_first_value_xpath(root, x_meeting_title)
+    if event_title != None and len(event_title) > 0:
+        json_bib["event"] = { "name": event_title }
+    return json_bib
+
+def _get_first_value_xpath(node, xpath_exp):
+    values = node.xpath(xpath_exp)
+    value = None
+    if values is not None and len(values)>0:
+        value = values[0].text
+    return value
+
+def _get_first_attribute_value_xpath(node, xpath_exp):
+    values = node.xpath(xpath_exp)
+    value = None
+    if values is not None and len(values)>0:
+        value = values[0]
+    return value
+
+def _get_date_xpath(node, xpath_exp):
+    dates = node.xpath(xpath_exp)
+    date = None
+    if dates is not None and len(dates)>0:
+        date = dates[0].get("when")
+    return date
+
+def _get_all_values_authors_xpath(node, xpath_exp):
+    values = node.xpath(xpath_exp)
+    result = []
+    if values is not None and len(values)>0:
+        for val in values:
+            person = {}
+            fornames = val.xpath('./forename')
+            surname = val.xpath('./surname')
+            if surname != None and len(surname)>0 and surname[0].text != None:
+                person['family'] = surname[0].text.strip()
+            if fornames != None:
+                for forname in fornames:
+                    if forname.text != None:
+                        if not 'given' in person:
+                            person['given'] = forname.text.strip()
+                        else:
+                            person['given'] += " " + forname.text
+            result.append(person)
+    return result
+
+def benchmark(teis, repeat, nb_workers):
+    print(len(teis), "references,", sum([ len(tei) for tei in teis ]) // len(teis), "characters on average")
+    for name, converter in [("former", legacy_tei2json), ("precompiled", tei_to_json)]:
+        start = time.time()
+        for _ in range(repeat):
+            for tei in teis:
+                converter(tei)
+        runtime = time.time() - start
+        print("%s: %.1f references/s" % (name, len(teis) * repeat / runtime))
+
+    if nb_workers > 1:
+        with multiprocessing.Pool(nb_workers) as pool:
+            start = time.time()
+            convert_teis(teis * repeat, pool=pool)
+            runtime = time.time() - start
+        print("batch, %d processes: %.1f references/s" % (nb_workers, len(teis) * repeat / runtime))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Equivalence and benchmark of the TEI bibliographical reference conversion")
+    parser.add_argument("--corpus", default=None, help="file with one TEI biblStruct per line (JSON string), default are the test samples")
+    parser.add_argument("--repeat", type=int, default=1000, help="number of times the references are converted")
+    parser.add_argument("--nb-workers", type=int, default=1, help="number of processes for the batch conversion")
+
+    args = parser.parse_args()
+
+    teis = [ case["tei"] for case in load_expected() ]
+    if args.corpus is not None:
+        with open(args.corpus) as corpus_file:
+            teis = [ json.loads(line) for line in corpus_file if len(line.strip()) > 0 ]
+        differences = len([ tei for tei in teis if tei_to_json(tei) != legacy_tei2json(tei) ])
+        print("differences with the former conversion:", differences)
+    benchmark(teis, args.repeat, args.nb_workers)
@@ -7,10 +7,10 @@ import json
 import yaml
 from arango import ArangoClient
 import copy
-import requests
-from requests.exceptions import HTTPError
 import logging
 import logging.handlers
+from software_kb.common.naming_cache import NamingCache, write_naming_snapshot
+from software_kb.common.naming_loader import NamingBulkLoader, default_naming_batch_size
 
 logging.getLogger("urllib3").setLevel(logging.WARNING)
 
@@ -27,6 +27,27 @@ class CommonArangoDB(object):
     # for readability purposes 
     naming_wikidata = None
 
+    # optional in-process read-only copy of the naming collection, see load_naming_cache()
+    naming_cache = None
+
+    # batched Wikidata fetcher (pooled HTTP session), created on first use
+    wikidata_fetcher = None
+
+    def get_wikidata_fetcher(self):
+        '''
+        Batched Wikidata fetcher, created with the optional "wikidata" settings of the config
+        '''
+        if self.wikidata_fetcher == None:
+            # imported here because the fetcher module uses simplify_entity from this module
+            from software_kb.common.wikidata_fetcher import WikidataEntityFetcher, default_api_url, max_batch_size
+            wikidata_config = {}
+            if "wikidata" in self.config and self.config["wikidata"] != None:
+                wikidata_config = self.config["wikidata"]
+            self.wikidata_fetcher = WikidataEntityFetcher(api_url=wikidata_config.get("wikidata_api_url", default_api_url),
+                                                          batch_size=wikidata_config.get("batch_size", max_batch_size),
+                                                          max_concurrency=wikidata_config.get("max_concurrency", 4))
+        return self.wikidata_fetcher
+
     def load_config(self, config_file='./config.yaml'):
         """
         Load the json configuration 
@@ -139,29 +160,99 @@ class CommonArangoDB(object):
         else:
             self.naming_wikidata = self.naming_db.collection('naming_wikidata')
 
+    def load_naming_cache(self, path=None, rebuild=False):
+        '''
+        Load the naming collection in memory as a memory-mapped snapshot file, shared by the processes 
+        using the same file. The snapshot is (re)built from the collection if it does not exist or if
+        the collection has been modified since the snapshot (revision of the collection). 
+        '''
+        if path == None:
+            path = self.naming_snapshot_path()
+
+        revision = self.naming_wikidata.revision()
+        if not rebuild and os.path.isfile(path):
+            try:
+                self.naming_cache = NamingCache(path)
+                if self.naming_cache.revision == revision:
+                    return self.naming_cache
+                self.naming_cache.close()
+            except Exception:
+                # snapshot of a former format
+                self.naming_cache = None
+
+        print("building naming snapshot", path, "for", self.naming_wikidata.count(), "names")
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        cursor = self.naming_db.aql.execute("FOR doc IN naming_wikidata RETURN [doc._key, doc.value]", 
+            batch_size=10000, stream=True, ttl=3600)
+        write_naming_snapshot(path, cursor, revision=revision)
+        self.naming_cache = NamingCache(path)
+        return self.naming_cache
+
+    def naming_snapshot_path(self):
+        return self.config.get("naming_cache_path", os.path.join("data", "naming", "naming_wikidata.snapshot"))
+
+    def remove_naming_snapshot(self):
+        '''
+        Remove the naming snapshot file after a naming import, it is rebuilt by the next load_naming_cache()
+        '''
+        path = self.naming_snapshot_path()
+        if os.path.isfile(path):
+            os.remove(path)
+
     def naming_wikidata_string(self, wikidata_id):
         # wikidata id -> canonical string
         if not wikidata_id.startswith("P") and not wikidata_id.startswith("Q"):
             return None
 
+        if self.naming_cache != None:
+            name = self.naming_cache.get(wikidata_id)
+            if name != None or wikidata_id in self.naming_cache.lru:
+                return name
+
         name = None
         try:
-            if wikidata_id in self.naming_wikidata:
-                return self.naming_wikidata[wikidata_id]["value"]
+            document = self.naming_wikidata.get(wikidata_id)
+            if document != None:
+                name = document["value"]
         except:
             name = None
 
         if name == None:
             # we have no corresponding stored name yet, we need to request Wikidata API to access and cache the name
-            entity_json = _get_entity_from_wikidata(wikidata_id, simplify=False)
-            if entity_json != None:
-                # get the canonical name
-                local_labels = entity_json["labels"]
-                if "en" in local_labels:
-                    name = local_labels["en"]["value"]
-                    self.add_naming_wikidata(wikidata_id, name)
+            labels = self.get_wikidata_fetcher().fetch_labels([wikidata_id])
+            if not wikidata_id in labels:
+                # failed request, the missing name is not cached so that it is requested again later
+                return None
+            name = labels[wikidata_id]
+            if name != None:
+                self.add_naming_wikidata(wikidata_id, name)
+
+        if self.naming_cache != None:
+            self.naming_cache.put(wikidata_id, name)
         return name
 
+    def prefetch_naming_wikidata(self, wikidata_ids):
+        '''
+        Fetch and store the canonical names of the given identifiers not yet in the naming collection, 
+        with batched Wikidata requests instead of one request per missing name
+        '''
+        wikidata_ids = list(set(wikidata_id for wikidata_id in wikidata_ids 
+            if isinstance(wikidata_id, str) and (wikidata_id.startswith("P") or wikidata_id.startswith("Q")) and wikidata_id[1:].isdigit()))
+        if self.naming_cache != None:
+            wikidata_ids = [ wikidata_id for wikidata_id in wikidata_ids if not self.naming_cache.contains(wikidata_id) ]
+        if len(wikidata_ids) == 0:
+            return
+        cursor = self.naming_db.aql.execute("FOR doc IN naming_wikidata FILTER doc._key IN @keys RETURN doc._key", 
+            bind_vars={ "keys": wikidata_ids })
+        known = set(cursor)
+        missing = [ wikidata_id for wikidata_id in wikidata_ids if not wikidata_id in known ]
+        if len(missing) == 0:
+            return
+        labels = self.get_wikidata_fetcher().fetch_labels(missing)
+        for wikidata_id, name in labels.items():
+            if name != None:
+                self.add_naming_wikidata(wikidata_id, name)
+
     def naming_wikidata_id(self, string):
         # canonical string -> wikidata id
         cursor = self.naming_wikidata.find({'value': string}, skip=0, limit=1)
@@ -192,8 +283,24 @@ class CommonArangoDB(object):
                 self.naming_wikidata.insert({ "_key": wikidata_id, "value": string })
             except:
                 logging.warning("Invalid key: " + wikidata_id + " with value " + string)
+                return
+
+        # the cache is updated only once the name is stored
+        if self.naming_cache != None:
+            self.naming_cache.put(wikidata_id, string)
   
+    def naming_bulk_loader(self, batch_size=default_naming_batch_size):
+        '''
+        Return a loader for adding many names with bulk writes, the existing names are loaded in memory
+        '''
+        cursor = self.naming_db.aql.execute("FOR doc IN naming_wikidata RETURN [doc._key, doc.value]", 
+            batch_size=10000, stream=True, ttl=3600)
+        return NamingBulkLoader(self.naming_wikidata, existing=cursor, batch_size=batch_size)
+
     def remove_naming_wikidata(self, wikidata_id):
+        if self.naming_cache != None:
+            self.naming_cache.put(wikidata_id, None)
+
         if not wikidata_id in self.naming_wikidata:
             # do nothing
             return
@@ -510,34 +617,3 @@ def _replace_element(jsonEntity, element, lang):
             en_lab[lang] = en_lab_val
             jsonEntity[element] = en_lab
     return jsonEntity
-
-def _get_entity_from_wikidata(entity_id, simplify=True):
-    wikidata_url = 'https://www.wikidata.org/w/api.php?action=wbgetentities&ids=' + entity_id + '&format=json'
-
-    result_json = None
-    try:
-        response = requests.get(wikidata_url)
-        response.raise_for_status()
-        result_json = response.json()
-    except HTTPError as http_err:
-        logging.error('HTTP error occurred:', http_err)
-    except Exception as err:
-        logging.error('Error occurred:', err)
-
-    if result_json == None or not "entities" in result_json:
-        return None
-
-    if "labels" not in result_json:
-        result_json = result_json["entities"]
-        if "labels" not in result_json:
-            result_json = result_json[entity_id]
-            if "labels" not in result_json:
-                return None
-
-    if "id" not in result_json:
-        result_json["id"] = entity_id
-
-    if simplify:
-        result_json = simplify_entity(result_json)
-
-    return result_json
@@ -0,0 +1,79 @@
+'''
+    Buffered bulk writer for ArangoDB collections
+
+    Documents are accumulated per collection and written with one import_bulk call per batch,
+    instead of a has() then an insert() HTTP round trip per document. With the default
+    on_duplicate="ignore", a document with an already existing key is skipped, which is the
+    same behavior as the usual "if not collection.has(key): collection.insert(doc)" pattern:
+    the first version of a document wins.
+
+    Usage:
+
+        writer = BulkWriter(batch_size=1000)
+        for document in documents:
+            writer.add(collection, document)
+        writer.flush()
+'''
+
+import logging
+
+default_batch_size = 1000
+
+class BulkWriter(object):
+
+    def __init__(self, batch_size=default_batch_size, on_duplicate="ignore"):
+        self.batch_size = batch_size
+        self.on_duplicate = on_duplicate
+        # collection name -> (collection, list of buffered documents)
+        self.buffers = {}
+        # import counters as returned by ArangoDB
+        self.created = 0
+        self.ignored = 0
+        self.errors = 0
+
+    def add(self, collection, document):
+        '''
+        Buffer a document for the collection, the buffer is written when the batch size is reached.
+        The document must have a "_key" or "_id" field for the duplicate detection.
+        '''
+        if not collection.name in self.buffers:
+            self.buffers[collection.name] = (collection, [])
+        documents = self.buffers[collection.name][1]
+        documents.append(document)
+        if len(documents) >= self.batch_size:
+            self.flush(collection)
+
+    def flush(self, collection=None):
+        '''
+        Write the buffered documents of the given collection, or of all the collections by default
+        '''
+        if collection is None:
+            names = list(self.buffers.keys())
+        else:
+            names = [collection.name]
+
+        for name in names:
+            if not name in self.buffers:
+                continue
+            the_collection, documents = self.buffers[name]
+            if len(documents) == 0:
+                continue
+            result = the_collection.import_bulk(documents, halt_on_error=False, details=True, on_duplicate=self.on_duplicate)
+            self.buffers[name] = (the_collection, [])
+            if result is None:
+                continue
+            self.created += result.get("created", 0)
+            self.ignored += result.get("ignored", 0)
+            self.errors += result.get("errors", 0)
+            if result.get("errors", 0) > 0 and "details" in result:
+                for detail in result["details"]:
+                    logging.warning("bulk import in " + name + ": " + str(detail))
+
+    def __len__(self):
+        return sum(len(documents) for _, documents in self.buffers.values())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.flush()
@@ -0,0 +1,81 @@
+'''
+    Set of Wikidata entity identifiers with constant-time membership test
+
+    The entity lists used to filter the Wikidata dump (software, persons, licenses, organizations,
+    publications) are persisted as plain text files under data/resources/ with one identifier per
+    line, e.g. data/resources/software.wikidata.entities. Membership tests are done for every line
+    of the dump (~100M lines), so the lists are loaded as hash sets rather than python lists.
+'''
+
+import os
+
+resources_path = os.path.join("data", "resources")
+
+def entity_set_path(name):
+    '''
+    Return the path of the persisted entity list for a given name, e.g. "software" or "persons"
+    '''
+    return os.path.join(resources_path, name + ".wikidata.entities")
+
+class WikidataEntitySet(object):
+
+    def __init__(self, path=None):
+        # the identifiers are kept in insertion order (a dict is an ordered hash set), so that
+        # the written entity lists remain stable and diffable from one import to another
+        self.entities = {}
+        self.path = path
+        if path != None and os.path.isfile(path):
+            self.load(path)
+
+    def load(self, path=None):
+        '''
+        Add the identifiers of a persisted entity list, one identifier per line
+        '''
+        if path == None:
+            path = self.path
+        with open(path, "rt") as fp:
+            for line in fp:
+                line = line.strip()
+                if len(line) > 0:
+                    self.entities[line] = None
+        return self
+
+    def save(self, path=None):
+        '''
+        Write the entity list, by default at the location it has been loaded from
+        '''
+        if path == None:
+            path = self.path
+        with open(path, "wt") as fp:
+            for entity_id in self.entities:
+                fp.write(entity_id)
+                fp.write("\n")
+
+    def add(self, entity_id):
+        '''
+        Add an identifier, return True if the identifier was not already present
+        '''
+        if entity_id in self.entities:
+            return False
+        self.entities[entity_id] = None
+        return True
+
+    def update(self, entity_ids):
+        for entity_id in entity_ids:
+            self.entities[entity_id] = None
+
+    def __contains__(self, entity_id):
+        return entity_id in self.entities
+
+    def __iter__(self):
+        return iter(self.entities)
+
+    def __len__(self):
+        return len(self.entities)
+
+def load_entity_set(name):
+    '''
+    Load the persisted entity list for a given name, an empty set is returned if the list does not
+    exist yet
+    '''
+    return WikidataEntitySet(entity_set_path(name))
@@ -0,0 +1,122 @@
+'''
+    In-memory registry of the merging decisions (disjoint-set / union-find)
+
+    The merging decisions of the merge passes are kept in memory instead of being written one by one
+    in the merging_lists/merging_entities collections of the staging area: finding the merging list
+    of an entity is a lookup with path compression, and when two lists meet, only the members of the
+    smallest one are moved (union by size). The lists are written in one bulk flush at the end of the
+    merging (see StagingArea.flush_merging()).
+
+    The order of the entities in a merging list is the same as when the decisions were written one by
+    one: the first entity of a list is the host of the merging. When merging the lists of entity1 and
+    entity2, the list of entity2 is appended to the list of entity1, except if only entity2 was already
+    in a list, entity1 is then appended to it.
+
+    Usage:
+
+        registry = MergeRegistry()
+        registry.union(entity1['_id'], entity2['_id'])
+        for list_key, members in registry.lists():
+            ...
+'''
+
+from collections import deque
+
+class MergeRegistry(object):
+
+    def __init__(self):
+        # entity _id -> parent entity _id, the roots are their own parent
+        self.parent = {}
+        # root -> deque of the entity _id of the merging list, in merging order
+        self.members = {}
+        # root -> _key of the stored merging list, for the lists loaded from the staging area
+        self.list_keys = {}
+        # _key of all the loaded lists, some of them are merged into other lists by new decisions
+        self.loaded_keys = set()
+
+    def find(self, entity_id):
+        '''
+        Root of the merging list of an entity, the entity is added as a single entity list if unknown
+        '''
+        if not entity_id in self.parent:
+            self.parent[entity_id] = entity_id
+            self.members[entity_id] = deque([entity_id])
+            return entity_id
+
+        root = entity_id
+        while self.parent[root] != root:
+            root = self.parent[root]
+        # path compression
+        while self.parent[entity_id] != root:
+            self.parent[entity_id], entity_id = root, self.parent[entity_id]
+        return root
+
+    def union(self, entity_id1, entity_id2):
+        '''
+        Register the merging of two entities, return True
+        '''
+        root1 = self.find(entity_id1)
+        root2 = self.find(entity_id2)
+        if root1 == root2:
+            # entities already registered for merging, nothing to do...
+            return True
+
+        members1 = self.members[root1]
+        members2 = self.members[root2]
+        if len(members1) == 1 and len(members2) > 1:
+            # entity1 is added at the end of the list of entity2
+            members1, members2 = members2, members1
+            root1, root2 = root2, root1
+
+        # the merged list is members1 followed by members2, only the entities of the smallest list
+        # are moved and the root of the largest one becomes the root of the merged list (union by size)
+        if len(members1) >= len(members2):
+            members1.extend(members2)
+            new_root, old_root = root1, root2
+        else:
+            members2.extendleft(reversed(members1))
+            new_root, old_root = root2, root1
+        self.parent[old_root] = new_root
+        del self.members[old_root]
+
+        # the list keeps the key of the host list
+        list_key = self.list_keys.pop(root1, None)
+        other_list_key = self.list_keys.pop(root2, None)
+        if list_key is None:
+            list_key = other_list_key
+        if list_key is not None:
+            self.list_keys[new_root] = list_key
+        return True
+
+    def load(self, list_key, members):
+        '''
+        Add a merging list already stored in the staging area
+        '''
+        if len(members) == 0:
+            return
+        self.loaded_keys.add(list_key)
+        for entity_id in members[1:]:
+            self.union(members[0], entity_id)
+        root = self.find(members[0])
+        if not root in self.list_keys:
+            self.list_keys[root] = list_key
+
+    def lists(self):
+        '''
+        Yield (list key or None for a new list, list of entity _id) for all the merging lists
+        '''
+        for root, members in self.members.items():
+            if len(members) > 1:
+                yield self.list_keys.get(root), list(members)
+
+    def stale_keys(self):
+        '''
+        _key of the loaded lists which have been merged into another list
+        '''
+        return self.loaded_keys - set(self.list_keys.values())
+
+    def __len__(self):
+        '''
+        number of merging lists
+        '''
+        return sum(1 for members in self.members.values() if len(members) > 1)
@@ -0,0 +1,177 @@
+'''
+    In-process cache of the Wikidata naming (identifier -> canonical string)
+
+    The whole naming_wikidata collection is exported once into a compact read-only snapshot file,
+    which is then memory-mapped, so that several processes (e.g. API workers) share the same pages
+    and a name resolution is a binary search in memory instead of ArangoDB round trips.
+
+    Snapshot layout (little-endian):
+    - 8 bytes magic "WDNAMES2", then 4 uint64: number of entries, size of the string blob, size of
+      the extra JSON block, size of the revision string
+    - the sorted keys as uint64, a Q identifier Qn is encoded as n, a P identifier Pn as n + 2^40
+    - number of entries + 1 uint64 offsets of the names in the blob
+    - the UTF-8 string blob
+    - a JSON object for the few keys which are not Wikidata identifiers (e.g. custom properties)
+    - the revision of the naming collection the snapshot was built from (UTF-8), to detect a stale
+      snapshot
+
+    Lookups missing from the snapshot (new names added after the snapshot) go to a bounded LRU
+    dict filled by the caller.
+'''
+
+import os
+import json
+import mmap
+import struct
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+
+magic = b"WDNAMES2"
+header_format = "<8sQQQQ"
+header_size = struct.calcsize(header_format)
+
+property_flag = 1 << 40
+
+# number of entries of the LRU dict for the names not in the snapshot
+default_lru_size = 100000
+
+def encode_wikidata_id(wikidata_id):
+    '''
+    Integer key of a Wikidata identifier, None for other keys
+    '''
+    if len(wikidata_id) < 2 or not wikidata_id[1:].isdigit():
+        return None
+    if wikidata_id[0] == "Q":
+        return int(wikidata_id[1:])
+    if wikidata_id[0] == "P":
+        return int(wikidata_id[1:]) + property_flag
+    return None
+
+def write_naming_snapshot(path, entries, revision=None):
+    '''
+    Write a snapshot file from an iterable of (identifier, name) pairs, the last name is kept for
+    an identifier present several times. revision identifies the state of the source collection.
+    '''
+    numeric = {}
+    extra = {}
+    for wikidata_id, name in entries:
+        key = encode_wikidata_id(wikidata_id)
+        if key is None:
+            extra[wikidata_id] = name
+        else:
+            numeric[key] = name
+
+    keys = array('Q')
+    offsets = array('Q', [0])
+    blob = bytearray()
+    for key, name in sorted(numeric.items()):
+        keys.append(key)
+        blob += name.encode("utf-8")
+        offsets.append(len(blob))
+    extra_json = json.dumps(extra).encode("utf-8")
+    revision_bytes = (revision or "").encode("utf-8")
+
+    # written under a temporary name then renamed, so that a process never maps a partial file
+    tmp_path = path + ".tmp" + str(os.getpid())
+    with open(tmp_path, "wb") as snapshot_file:
+        snapshot_file.write(struct.pack(header_format, magic, len(keys), len(blob), len(extra_json), len(revision_bytes)))
+        snapshot_file.write(keys.tobytes())
+        snapshot_file.write(offsets.tobytes())
+        snapshot_file.write(blob)
+        snapshot_file.write(extra_json)
+        snapshot_file.write(revision_bytes)
+    os.replace(tmp_path, path)
+    return len(keys) + len(extra)
+
+class NamingCache(object):
+
+    def __init__(self, path=None, lru_size=default_lru_size):
+        self.path = path
+        self.mapped = None
+        self.keys = None
+        self.offsets = None
+        self.blob_start = 0
+        self.extra = {}
+        self.revision = None
+        self.lru = OrderedDict()
+        self.lru_size = lru_size
+        if path is not None:
+            self.open(path)
+
+    def open(self, path):
+        '''
+        Memory-map a snapshot file
+        '''
+        with open(path, "rb") as snapshot_file:
+            self.mapped = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.mapped) < header_size or self.mapped[:len(magic)] != magic:
+            self.mapped.close()
+            self.mapped = None
+            raise Exception("Invalid naming snapshot file: " + path)
+        _, nb_entries, blob_size, extra_size, revision_size = struct.unpack_from(header_format, self.mapped, 0)
+        view = memoryview(self.mapped)
+        keys_start = header_size
+        offsets_start = keys_start + nb_entries * 8
+        self.blob_start = offsets_start + (nb_entries + 1) * 8
+        self.keys = view[keys_start:offsets_start].cast('Q')
+        self.offsets = view[offsets_start:self.blob_start].cast('Q')
+        extra_start = self.blob_start + blob_size
+        self.extra = json.loads(bytes(self.mapped[extra_start:extra_start + extra_size]).decode("utf-8"))
+        revision_start = extra_start + extra_size
+        self.revision = bytes(self.mapped[revision_start:revision_start + revision_size]).decode("utf-8")
+        self.path = path
+        return self
+
+    def close(self):
+        if self.mapped is not None:
+            self.keys.release()
+            self.offsets.release()
+            self.keys = None
+            self.offsets = None
+            self.mapped.close()
+            self.mapped = None
+
+    def __len__(self):
+        nb_entries = len(self.keys) if self.keys is not None else 0
+        return nb_entries + len(self.extra)
+
+    def get(self, wikidata_id):
+        '''
+        Return the name of the identifier in the snapshot or in the LRU dict, None if unknown
+        '''
+        if wikidata_id in self.lru:
+            self.lru.move_to_end(wikidata_id)
+            return self.lru[wikidata_id]
+        return self.get_snapshot(wikidata_id)
+
+    def get_snapshot(self, wikidata_id):
+        if wikidata_id in self.extra:
+            return self.extra[wikidata_id]
+        if self.keys is None:
+            return None
+        key = encode_wikidata_id(wikidata_id)
+        if key is None:
+            return None
+        index = bisect_left(self.keys, key)
+        if index == len(self.keys) or self.keys[index] != key:
+            return None
+        start = self.blob_start + self.offsets[index]
+        end = self.blob_start + self.offsets[index+1]
+        return self.mapped[start:end].decode("utf-8")
+
+    def contains(self, wikidata_id):
+        '''
+        True if the identifier has been resolved, including identifiers without name in the LRU dict
+        '''
+        return wikidata_id in self.lru or self.get_snapshot(wikidata_id) is not None
+
+    def put(self, wikidata_id, name):
+        '''
+        Add a name resolved outside the snapshot, None is stored as well to avoid repeating
+        lookups of identifiers without name
+        '''
+        self.lru[wikidata_id] = name
+        self.lru.move_to_end(wikidata_id)
+        while len(self.lru) > self.lru_size:
+            self.lru.popitem(last=False)
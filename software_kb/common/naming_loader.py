@@ -0,0 +1,71 @@
+'''
+    Bulk loader for the Wikidata naming collection
+
+    add_naming_wikidata() needs up to four round trips per name (existence, current value,
+    uniqueness of the string, then insert or replace). For (re)building the naming database from the
+    Wikidata dump, the existing names are loaded once in memory, the uniqueness of the canonical
+    strings is checked in memory and the new names are written with large import_bulk batches.
+
+    The behavior is the same as add_naming_wikidata(): a name already used by another identifier
+    is not added (the naming collection has a unique index on the string) and a name changing for
+    an identifier replaces the previous one.
+'''
+
+import logging
+from software_kb.common.bulk_writer import BulkWriter
+
+default_naming_batch_size = 10000
+
+class NamingBulkLoader(object):
+
+    def __init__(self, naming_collection, existing=None, batch_size=default_naming_batch_size):
+        '''
+        existing is an iterable of the (identifier, name) pairs already in the collection
+        '''
+        self.naming_collection = naming_collection
+        # identifier -> name and name -> identifier
+        self.names = {}
+        self.identifiers = {}
+        if existing is not None:
+            for wikidata_id, name in existing:
+                self.names[wikidata_id] = name
+                self.identifiers[name] = wikidata_id
+        self.writer = BulkWriter(batch_size=batch_size, on_duplicate="replace")
+        self.nb_added = 0
+        self.nb_not_unique = 0
+
+    def add(self, wikidata_id, name):
+        '''
+        Buffer a name, return True if it will be written
+        '''
+        current = self.names.get(wikidata_id)
+        if current == name:
+            # nothing to do
+            return False
+
+        owner = self.identifiers.get(name)
+        if owner is not None and owner != wikidata_id:
+            logging.warning("warning adding Wikidata ID mapping: the target string is not unique, so the key will remain as it is: "
+                + wikidata_id + " " + name)
+            self.nb_not_unique += 1
+            return False
+
+        if current is not None:
+            del self.identifiers[current]
+        self.names[wikidata_id] = name
+        self.identifiers[name] = wikidata_id
+        self.writer.add(self.naming_collection, { "_key": wikidata_id, "value": name })
+        self.nb_added += 1
+        return True
+
+    def flush(self):
+        self.writer.flush()
+
+    def __contains__(self, wikidata_id):
+        return wikidata_id in self.names
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.flush()
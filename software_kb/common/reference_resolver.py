@@ -0,0 +1,118 @@
+'''
+    Concurrent resolution of bibliographical references (biblio-glutton/Crossref lookups)
+
+    The populate scripts submit lookup jobs (the keyword arguments of the lookup function, e.g.
+    StagingArea.biblio_glutton_lookup) as they go through the imported records, instead of waiting
+    for each lookup. The jobs are resolved by a bounded pool of threads, and the results are handed
+    back in submission order with the context given at submission time (e.g. the citing entity).
+
+    Jobs are identified by a signature of their query (alphanumeric characters of the query values),
+    a job with the same signature as a job still in progress is not looked up a second time. Across
+    the whole run, the caller can also keep the signatures already resolved (see StagingArea), and
+    prefetch() skips the queries already prefetched.
+
+    Usage:
+
+        resolver = ReferenceResolver(stagingArea.biblio_glutton_lookup, max_workers=8)
+        resolver.submit({"raw_ref": raw_ref}, context=entity_id)
+        ...
+        for signature, entity_id, result in resolver.completed(wait=True):
+            ...
+'''
+
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+def query_signature(query):
+    '''
+    Signature of a lookup query, ignoring case, spaces and punctuation in the query values
+    '''
+    pieces = []
+    for key in sorted(query):
+        value = query[key]
+        if value is None:
+            continue
+        pieces.append(key + "=" + ''.join(e for e in str(value) if e.isalnum()).lower())
+    return "|".join(pieces)
+
+class ReferenceResolver(object):
+
+    def __init__(self, lookup, max_workers=8, max_pending=1000):
+        self.lookup = lookup
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        # above this number of jobs waiting to be handed back, completed() waits for the oldest ones
+        self.max_pending = max_pending
+
+        # signature -> [future, number of submissions not yet handed back]
+        self.jobs = {}
+        # (signature, context) in submission order
+        self.pending = deque()
+        # signatures of the prefetched queries
+        self.prefetched = set()
+
+        # counters, for information
+        self.nb_lookups = 0
+        self.nb_deduplicated = 0
+
+    def submit(self, query, context=None):
+        '''
+        Add a lookup job, return its signature
+        '''
+        signature = query_signature(query)
+        job = self.jobs.get(signature)
+        if job is None:
+            job = [self.executor.submit(self._lookup, query), 0]
+            self.jobs[signature] = job
+            self.nb_lookups += 1
+        else:
+            self.nb_deduplicated += 1
+        job[1] += 1
+        self.pending.append((signature, context))
+        return signature
+
+    def completed(self, wait=False):
+        '''
+        Yield (signature, context, result) for the submitted jobs, in submission order. Without wait, stop
+        at the first job still in progress, unless too many jobs are pending.
+        '''
+        while len(self.pending) > 0:
+            signature, context = self.pending[0]
+            job = self.jobs[signature]
+            if not wait and not job[0].done() and len(self.pending) <= self.max_pending:
+                break
+            self.pending.popleft()
+            result = job[0].result()
+            job[1] -= 1
+            if job[1] == 0:
+                # the result is released, the caller keeps what it needs
+                del self.jobs[signature]
+            yield signature, context, result
+
+    def prefetch(self, queries):
+        '''
+        Run concurrently the lookups of the queries not prefetched before and wait for them, so that
+        the results are then available from the web client cache
+        '''
+        new_queries = []
+        for query in queries:
+            signature = query_signature(query)
+            if signature in self.prefetched:
+                self.nb_deduplicated += 1
+                continue
+            self.prefetched.add(signature)
+            new_queries.append(query)
+        self.nb_lookups += len(new_queries)
+        for _ in self.executor.map(self._lookup, new_queries):
+            pass
+
+    def _lookup(self, query):
+        try:
+            return self.lookup(**query)
+        except Exception as e:
+            # a failed lookup is an unresolved reference, it should not stop the population
+            logging.warning("reference lookup failed for " + str(query) + ": " + str(e))
+            return None
+
+    def close(self):
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,198 @@
+'''
+    Conversion of TEI bibliographical references (biblStruct, as produced by GROBID) into JSON, similar
+    to CrossRef JSON format (but simplified)
+
+    The XPath expressions are compiled once at import time and the XML parser is shared, instead of
+    compiling about 25 expressions for each converted reference. Many references can be converted at
+    once with convert_teis(), with a multiprocessing pool if given.
+
+    Note that lxml parsers must not be used by several threads at the same time: the conversion should
+    be called from a single thread per process (a pool of processes is fine).
+
+    Usage:
+
+        json_bib = tei_to_json(tei)
+        json_bibs = convert_teis(teis, pool=multiprocessing.Pool())
+'''
+
+import logging
+from lxml import etree
+
+tei_parser = etree.XMLParser()
+
+x_title = etree.XPath('/biblStruct/analytic/title[@level="a"]')
+x_doi = etree.XPath('/biblStruct/analytic/idno[@type="DOI"]')
+x_pmid = etree.XPath('/biblStruct/analytic/idno[@type="PMID"]')
+x_pmcid = etree.XPath('/biblStruct/analytic/idno[@type="PMCID"]')
+x_oa_link = etree.XPath('/biblStruct/analytic/ptr[@type="open-access"]/@target')
+
+x_publisher = etree.XPath('/biblStruct/monogr/imprint/publisher')
+x_journal = etree.XPath('/biblStruct/monogr/title[@level="j"]')
+x_monograph = etree.XPath('/biblStruct/monogr/title[@level="m"]')
+
+x_volume = etree.XPath('/biblStruct/monogr/imprint/biblScope[@unit="volume"]')
+x_issue = etree.XPath('/biblStruct/monogr/imprint/biblScope[@unit="issue"]')
+x_page_from = etree.XPath('/biblStruct/monogr/imprint/biblScope[@unit="page"]/@from')
+x_page_to = etree.XPath('/biblStruct/monogr/imprint/biblScope[@unit="page"]/@to')
+x_pages = etree.XPath('/biblStruct/monogr/imprint/biblScope[@unit="page"]')
+x_issn = etree.XPath('/biblStruct/monogr/idno[@type="ISSN"]')
+x_isbn = etree.XPath('/biblStruct/monogr/idno[@type="ISBN"]')
+
+x_date = etree.XPath('/biblStruct/monogr/imprint/date[@type="published"]')
+x_url = etree.XPath('/biblStruct/analytic/ptr[not(@type)]')
+
+x_meeting_title = etree.XPath('/biblStruct/monogr/meeting/title')
+
+# authorship
+x_author_persons = etree.XPath('/biblStruct/analytic/author/persName')
+x_forenames = etree.XPath('./forename')
+x_surname = etree.XPath('./surname')
+
+def parse_tei(tei):
+    '''
+    Parse a TEI string with the shared parser, return the root element
+    '''
+    return etree.fromstring(tei, tei_parser)
+
+def tei_doi(root):
+    '''
+    DOI of a parsed TEI reference, None if not present
+    '''
+    return _first_value(x_doi(root))
+
+def tei_to_json(tei):
+    '''
+    Transform a bibliographical reference in TEI (string or parsed root element) into JSON
+    '''
+    if isinstance(tei, (str, bytes)):
+        root = parse_tei(tei)
+    else:
+        root = tei
+
+    json_bib = {}
+
+    local_doi = _first_value(x_doi(root))
+    if local_doi != None:
+        json_bib['DOI'] = local_doi
+
+    local_pmid = _first_value(x_pmid(root))
+    if local_pmid != None:
+        json_bib["pmid"] = local_pmid
+
+    local_pmcid = _first_value(x_pmcid(root))
+    if local_pmcid != None:
+        json_bib["pmcid"] = local_pmcid
+
+    local_url = _first_value(x_url(root))
+    if local_url != None:
+        json_bib['URL'] = local_url
+
+    json_bib['author'] = _authors(x_author_persons(root))
+
+    local_volume = _first_value(x_volume(root))
+    if local_volume != None:
+        json_bib["volume"] = local_volume
+    local_issn = _first_value(x_issn(root))
+    if local_issn != None:
+        json_bib["ISSN"] = local_issn
+    local_isbn = _first_value(x_isbn(root))
+    if local_isbn != None:
+        json_bib["ISBN"] = local_isbn
+    local_issue = _first_value(x_issue(root))
+    if local_issue != None:
+        json_bib["issue"] = local_issue
+
+    local_oa_link = _first_attribute_value(x_oa_link(root))
+    if local_oa_link != None:
+        json_bib["oaLink"] = local_oa_link
+
+    json_bib["title"] = []
+    local_title = _first_value(x_title(root))
+    if local_title != None:
+        json_bib["title"].append(local_title)
+    local_publisher = _first_value(x_publisher(root))
+    if local_publisher != None:
+        json_bib["publisher"] = local_publisher
+
+    # date has a strange structure in crossref... we also store the standard ISO 8601 format which is much easier to work with and clear
+    dates = x_date(root)
+    local_date = None
+    if len(dates) > 0:
+        local_date = dates[0].get("when")
+    if local_date != None:
+        json_bib["date"] = local_date
+        # format is "published-online": { "date-parts": [ [ 2014, 9, 8 ] ] }
+        json_bib["published-online"] = { "date-parts": [ local_date.split("-")[:3] ] }
+
+    page_from = _first_attribute_value(x_page_from(root))
+    page_to = _first_attribute_value(x_page_to(root))
+    if page_from is not None and page_to is not None:
+        json_bib["page"] = page_from + '-' + page_to
+    else:
+        local_page_range = _first_value(x_pages(root))
+        if local_page_range != None:
+            json_bib["page"] = local_page_range
+
+    json_bib["container-title"] = []
+    title_journal = _first_value(x_journal(root))
+    if title_journal != None and len(title_journal) > 0:
+        json_bib["container-title"].append(title_journal)
+    title_monograph = _first_value(x_monograph(root))
+    if title_monograph != None and len(title_monograph) > 0:
+        json_bib["container-title"].append(title_monograph)
+
+    event_title = _first_value(x_meeting_title(root))
+    if event_title != None and len(event_title) > 0:
+        json_bib["event"] = { "name": event_title }
+
+    return json_bib
+
+def convert_tei(tei):
+    '''
+    Same as tei_to_json(), but None for a missing or invalid TEI string instead of an exception
+    '''
+    if tei is None:
+        return None
+    try:
+        return tei_to_json(tei)
+    except (etree.XMLSyntaxError, ValueError) as e:
+        logging.warning("invalid TEI bibliographical reference: " + str(e))
+        return None
+
+def convert_teis(teis, pool=None, chunksize=64):
+    '''
+    Convert a list of TEI strings, with a multiprocessing pool if given. The result is the list of the
+    JSON references in the same order, None for the missing or invalid TEI.
+    '''
+    if pool is None:
+        return [ convert_tei(tei) for tei in teis ]
+    return pool.map(convert_tei, teis, chunksize=chunksize)
+
+def _first_value(nodes):
+    if len(nodes) > 0:
+        return nodes[0].text
+    return None
+
+def _first_attribute_value(values):
+    if len(values) > 0:
+        return values[0]
+    return None
+
+def _authors(persons):
+    result = []
+    for person_node in persons:
+        # each node is a person
+        person = {}
+        surname = x_surname(person_node)
+        if len(surname) > 0 and surname[0].text != None:
+            person['family'] = surname[0].text.strip()
+
+        for forename in x_forenames(person_node):
+            if forename.text != None:
+                if not 'given' in person:
+                    person['given'] = forename.text.strip()
+                else:
+                    person['given'] += " " + forename.text
+        result.append(person)
+    # family, given - there is no middle name in crossref, it is just concatenated to "given" without any normalization
+    return result
@@ -0,0 +1,215 @@
+'''
+    Shared client for the GET calls to external web services (biblio-glutton, Crossref, Unpaywall, ...)
+
+    All the calls go through one pooled requests session, so the TCP/TLS connections are kept alive
+    between the calls, with a timeout and retries with exponential backoff on network errors, 429
+    and 5xx responses.
+
+    Responses are cached in two tiers:
+    - a bounded in-process LRU dict, so that a repeated call costs no database round trip,
+    - the persistent ArangoDB cache collection (optional), shared between runs.
+    Only final responses are cached (200 and non-retryable errors like 404), not the failures due to
+    network errors or exhausted retries. The returned data are shared with the cache and must not be
+    modified by the caller.
+
+    Other values than responses (e.g. the final outcome of a cascade of calls) can be stored in the
+    same tiers with put_value(), optionally with a time-to-live, and read with get_value().
+
+    Usage:
+
+        client = WebClient(cache_collection=db.collection('cache'))
+        data, success, status = client.get(url, params={'doi': doi})
+'''
+
+import time
+import random
+import hashlib
+import logging
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from collections import OrderedDict
+
+# number of responses kept in memory
+default_lru_size = 10000
+
+def cache_key(url, params=None, data=None):
+    '''
+    Key of a call in the cache collection, md5 of the url and of the parameters
+    '''
+    local_key = url
+    if params != None:
+        for param_key, param_value in params.items():
+            local_key += "_" + param_key + "_" + param_value
+    if data != None:
+        for param_key, param_value in data.items():
+            local_key += "_" + param_key + "_" + param_value
+    return hashlib.md5(local_key.encode()).hexdigest()
+
+class WebClient(object):
+
+    def __init__(self, cache_collection=None, pool_size=10, timeout=30, max_retries=3, backoff=0.5, lru_size=default_lru_size,
+                 user_agent="softcite-kb (https://github.com/softcite/softcite_kb)", sleep=time.sleep):
+        self.cache_collection = cache_collection
+        self.timeout = timeout
+        self.max_retries = max_retries
+        # base delay in seconds of the exponential backoff
+        self.backoff = backoff
+        self.sleep = sleep
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({"User-Agent": user_agent})
+
+        self.lru = OrderedDict()
+        self.lru_size = lru_size
+        # the client can be shared by several threads
+        self.lock = threading.Lock()
+
+        # counters, for information
+        self.lru_hits = 0
+        self.cache_hits = 0
+        self.requests = 0
+
+    def get(self, url, params=None, data=None, headers=None, use_cache=True, json_content=True):
+        '''
+        GET call to a web service, return (response content as JSON or text, success, HTTP status).
+        success is False and status is None if the service could not be reached.
+        '''
+        final_key = None
+        if use_cache:
+            final_key = cache_key(url, params, data)
+            if not json_content:
+                final_key += "_text"
+
+            with self.lock:
+                if final_key in self.lru:
+                    self.lru.move_to_end(final_key)
+                    self.lru_hits += 1
+                    return self.lru[final_key]
+
+            if self.cache_collection is not None:
+                response_doc = self.cache_collection.get({'_key': final_key})
+                if response_doc is not None:
+                    self.cache_hits += 1
+                    result = (response_doc["data"], response_doc["success"], response_doc["status"])
+                    self._put_lru(final_key, result)
+                    return result
+
+        response = self._request(url, params, data, headers)
+        if response is None:
+            # not cached, the call can be tried again later
+            return None, False, None
+
+        status = response.status_code
+        success = (status == 200)
+        response_data = None
+        if success and json_content:
+            response_data = response.json()
+        elif success:
+            response_data = response.text
+        result = (response_data, success, status)
+
+        if final_key != None:
+            # cache the result for next time
+            self._put_lru(final_key, result)
+            if self.cache_collection is not None:
+                local_doc = {}
+                local_doc["data"] = response_data
+                local_doc["success"] = success
+                local_doc["status"] = status
+                local_doc["_key"] = final_key
+                self.cache_collection.insert(local_doc, overwrite=True, silent=True)
+
+        return result
+
+    def get_value(self, key):
+        '''
+        Return (found, value, expired) for a value stored with put_value(), an expired value is not 
+        found and expired is then True
+        '''
+        now = time.time()
+        expired = False
+        with self.lock:
+            if key in self.lru:
+                value, expires = self.lru[key]
+                if expires is None or expires > now:
+                    self.lru.move_to_end(key)
+                    self.lru_hits += 1
+                    return True, value, False
+                del self.lru[key]
+                expired = True
+
+        if self.cache_collection is not None:
+            value_doc = self.cache_collection.get({'_key': key})
+            if value_doc is not None:
+                expires = value_doc.get("expires")
+                if expires is None or expires > now:
+                    self.cache_hits += 1
+                    self._put_lru(key, (value_doc["data"], expires))
+                    return True, value_doc["data"], False
+                expired = True
+        return False, None, expired
+
+    def put_value(self, key, value, ttl=None):
+        '''
+        Store a value in the cache, for ttl seconds if ttl is not None
+        '''
+        expires = None
+        if ttl is not None:
+            expires = time.time() + ttl
+        self._put_lru(key, (value, expires))
+        if self.cache_collection is not None:
+            local_doc = {}
+            local_doc["data"] = value
+            local_doc["expires"] = expires
+            local_doc["_key"] = key
+            self.cache_collection.insert(local_doc, overwrite=True, silent=True)
+
+    def _put_lru(self, key, result):
+        with self.lock:
+            self.lru[key] = result
+            self.lru.move_to_end(key)
+            while len(self.lru) > self.lru_size:
+                self.lru.popitem(last=False)
+
+    def _request(self, url, params, data, headers):
+        '''
+        GET with retries, return the response or None if the service could not be reached
+        '''
+        attempt = 0
+        while True:
+            retry_after = None
+            try:
+                self.requests += 1
+                if params != None and len(params) > 0:
+                    response = self.session.get(url, params=params, headers=headers, timeout=self.timeout)
+                elif data != None and len(data) > 0:
+                    response = self.session.get(url, data=data, headers=headers, timeout=self.timeout)
+                else:
+                    response = self.session.get(url, headers=headers, timeout=self.timeout)
+                if response.status_code != 429 and response.status_code < 500:
+                    return response
+                error = "HTTP error " + str(response.status_code)
+                retry_after = response.headers.get("Retry-After")
+                if retry_after is not None and retry_after.isdigit():
+                    retry_after = int(retry_after)
+                else:
+                    retry_after = None
+            except requests.exceptions.RequestException as err:
+                error = str(err)
+
+            attempt += 1
+            if attempt > self.max_retries:
+                logging.warning("web service call failed for " + url + ": " + error)
+                return None
+            if retry_after is not None:
+                delay = retry_after
+            else:
+                delay = self.backoff * (2 ** (attempt-1)) * (0.5 + random.random() / 2)
+            self.sleep(delay)
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,183 @@
+'''
+    Batched access to Wikidata entities via the wbgetentities web API
+
+    Up to 50 entity identifiers can be requested per wbgetentities call (the API limit for
+    non-bot users), so the entities are fetched by batches of identifiers, with a small number of
+    concurrent requests over a pooled HTTP session, and retries with exponential backoff on
+    network errors, 429 (rate limiting) and 5xx responses.
+
+    The HTTP transport is a simple callable transport(url, params, timeout) returning the parsed
+    JSON response, which can be replaced for instance to use a local stub server in tests.
+
+    Usage:
+
+        fetcher = WikidataEntityFetcher()
+        entities = fetcher.fetch(["Q42", "Q1", "P31"])
+        labels = fetcher.fetch_labels(["Q42", "P31"])
+'''
+
+import time
+import random
+import logging
+import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
+from software_kb.common.arango_common import simplify_entity
+
+default_api_url = "https://www.wikidata.org/w/api.php"
+
+# maximum number of identifiers per wbgetentities request
+max_batch_size = 50
+
+class WikidataTransportError(Exception):
+    '''
+    Failed request, with the HTTP status when available (None for network errors)
+    '''
+    def __init__(self, message, status=None, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+    def is_retryable(self):
+        return self.status is None or self.status == 429 or self.status >= 500
+
+class SessionTransport(object):
+    '''
+    Default transport, a requests session keeping the connections alive between the calls
+    '''
+    def __init__(self, pool_size=10, user_agent="softcite-kb (https://github.com/softcite/softcite_kb)"):
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({"User-Agent": user_agent})
+
+    def __call__(self, url, params, timeout):
+        try:
+            response = self.session.get(url, params=params, timeout=timeout)
+        except requests.exceptions.RequestException as err:
+            raise WikidataTransportError(str(err))
+        if response.status_code != 200:
+            retry_after = response.headers.get("Retry-After")
+            if retry_after is not None and retry_after.isdigit():
+                retry_after = int(retry_after)
+            else:
+                retry_after = None
+            raise WikidataTransportError("HTTP error " + str(response.status_code) + " for " + url,
+                                         status=response.status_code, retry_after=retry_after)
+        return response.json()
+
+class WikidataEntityFetcher(object):
+
+    def __init__(self, api_url=default_api_url, batch_size=max_batch_size, max_concurrency=4, max_retries=5,
+                 backoff=1.0, timeout=30, transport=None):
+        self.api_url = api_url
+        self.batch_size = min(batch_size, max_batch_size)
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        # base delay in seconds of the exponential backoff
+        self.backoff = backoff
+        self.timeout = timeout
+        if transport is None:
+            transport = SessionTransport(pool_size=max_concurrency)
+        self.transport = transport
+
+    def fetch(self, entity_ids, simplify=True, props=None, languages=None):
+        '''
+        Return a dict entity id -> entity JSON for the given identifiers, None for the entities
+        not found. The identifiers of a failed request (after the retries) are not in the result.
+        props and languages restrict the returned information, e.g. props=["labels"] and 
+        languages=["en"] to get only the English labels.
+        '''
+        # keep the order of first appearance and remove duplicates
+        unique_ids = list(dict.fromkeys(entity_id for entity_id in entity_ids if _is_entity_id(entity_id)))
+        batches = [ unique_ids[i:i+self.batch_size] for i in range(0, len(unique_ids), self.batch_size) ]
+
+        results = {}
+        if len(batches) == 0:
+            return results
+        if len(batches) == 1 or self.max_concurrency <= 1:
+            batch_results = [ self._fetch_batch(batch, props, languages) for batch in batches ]
+        else:
+            with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+                batch_results = list(executor.map(lambda batch: self._fetch_batch(batch, props, languages), batches))
+
+        # a redirected entity can be returned for two requested identifiers, it is simplified only once
+        simplified = {}
+        for batch, entities in zip(batches, batch_results):
+            if entities is None:
+                # failed request, unknown outcome for these entities
+                continue
+            for entity_id in batch:
+                entity = entities.get(entity_id)
+                if entity is not None and simplify:
+                    if not id(entity) in simplified:
+                        simplified[id(entity)] = simplify_entity(entity)
+                    entity = simplified[id(entity)]
+                results[entity_id] = entity
+        return results
+
+    def fetch_entity(self, entity_id, simplify=True):
+        return self.fetch([entity_id], simplify=simplify).get(entity_id)
+
+    def fetch_labels(self, entity_ids, language="en"):
+        '''
+        Return a dict entity id -> label in the given language, None for the entities not found or
+        without such a label. The identifiers of a failed request are not in the result.
+        '''
+        labels = {}
+        entities = self.fetch(entity_ids, simplify=False, props=["labels"], languages=[language])
+        for entity_id, entity in entities.items():
+            if entity is not None and "labels" in entity and language in entity["labels"]:
+                labels[entity_id] = entity["labels"][language]["value"]
+            else:
+                labels[entity_id] = None
+        return labels
+
+    def _fetch_batch(self, batch, props=None, languages=None):
+        params = { "action": "wbgetentities", "ids": "|".join(batch), "format": "json" }
+        if props is not None:
+            params["props"] = "|".join(props)
+        if languages is not None:
+            params["languages"] = "|".join(languages)
+
+        result_json = None
+        attempt = 0
+        while result_json is None:
+            try:
+                result_json = self.transport(self.api_url, params, self.timeout)
+                if result_json is None:
+                    raise WikidataTransportError("empty response for " + self.api_url)
+            except WikidataTransportError as err:
+                attempt += 1
+                if not err.is_retryable() or attempt > self.max_retries:
+                    logging.error("Wikidata request failed for " + params["ids"] + ": " + str(err))
+                    return None
+                if err.retry_after is not None:
+                    delay = err.retry_after
+                else:
+                    delay = self.backoff * (2 ** (attempt-1))
+                # jitter to avoid synchronized retries of the concurrent requests
+                time.sleep(delay * (0.5 + random.random() / 2))
+
+        if "error" in result_json:
+            logging.error("Wikidata API error for " + params["ids"] + ": " + str(result_json["error"]))
+            return None
+        if not "entities" in result_json:
+            return None
+
+        entities = {}
+        for key, entity in result_json["entities"].items():
+            if "missing" in entity:
+                continue
+            if not "id" in entity:
+                entity["id"] = key
+            entities[key] = entity
+            entities[entity["id"]] = entity
+            # redirected identifiers are returned under the target identifier
+            if "redirects" in entity and "from" in entity["redirects"]:
+                entities[entity["redirects"]["from"]] = entity
+        return entities
+
+def _is_entity_id(entity_id):
+    return isinstance(entity_id, str) and len(entity_id) > 1 and entity_id[0] in "PQ" and entity_id[1:].isdigit()
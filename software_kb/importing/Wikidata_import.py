@@ -36,45 +36,55 @@ import json
 from harvester import Harvester
 from arango import ArangoClient
 import re
-from import_common import clean_field, is_git_repo
+from software_kb.importing.import_common import clean_field, is_git_repo
 import sys
 import os
-import bz2
 from software_kb.common.arango_common import simplify_entity
+from software_kb.common.bulk_writer import BulkWriter, default_batch_size
+from software_kb.common.entity_set import WikidataEntitySet, load_entity_set, entity_set_path
+from software_kb.importing.dump_reader import DumpEntityFilter, DumpSpillIndex, DumpCheckpoint, read_dump_entities, read_spilled_entities
 
 class Wikidata_harvester(Harvester):
 
     database_name = "wikidata"
 
-    # list of software entities 
-    software_list = []
+    # set of software entities 
+    software_list = None
 
-    # list of entity identifiers corresponding to persons in relation to the entity software
-    persons_list = []
+    # bulk loader used when importing the naming information from the dump
+    naming_loader = None
+
+    # set of entity identifiers corresponding to persons in relation to the entity software
+    persons_list = None
     # list of properties that we consider for importing persons (P178 "developer" can also be an organization")
     # for person: P31 Q5 (instance of human) is normally enough
     person_properties = ["P50", "P170", "P178", "P767", "P3931", "P184", "P767"]
 
-    # list of entity identifiers corresponding to software licenses in relation to the entity software
-    licenses_list = []
+    # set of entity identifiers corresponding to software licenses in relation to the entity software
+    licenses_list = None
     # list of properties that we consider for importing licenses
     licenses_properties = ["P275"]
 
-    # list of entity identifiers corresponding to organizations in relation to the entity software
-    organizations_list = []
+    # set of entity identifiers corresponding to organizations in relation to the entity software
+    organizations_list = None
     # list of properties that we consider for importing organizations (P178 "developer" is usually a person")
     # at some point we should have P279 (subclass) of Q43229 (organization) in a long hierarchy...
     organizations_properties = ["P8324", "P178"]
 
-    # list of entity identifiers corresponding to publications in relation to the entity software
-    publications_list = []
+    # set of entity identifiers corresponding to publications in relation to the entity software
+    publications_list = None
     # list of properties that we consider for importing publications (additional constraint: P31 instance of scholar article Q13442814)
     publications_properties = ["P1343"]
 
-    def __init__(self, config_path="./config.yaml"):
+    def __init__(self, config_path="./config.yaml", batch_size=None):
         self.load_config(config_path)
         self.init_naming()
 
+        # documents are written by batches, instead of one round trip per document
+        if batch_size is None:
+            batch_size = self.config['arangodb'].get('batch_size', default_batch_size)
+        self.bulk_writer = BulkWriter(batch_size=batch_size)
+
         # create database and collection
         if not self.sys_db.has_database(self.database_name):
             self.sys_db.create_database(self.database_name)
@@ -111,53 +121,81 @@ class Wikidata_harvester(Harvester):
         else:
             self.cache = self.db.collection('cache')
 
+        self.init_entity_lists()
+        self.load_software_entity_list()
+
+    def init_entity_lists(self):
+        '''
+        Entity lists are hash sets, membership is tested for every line of the dump
+        '''
+        self.software_list = WikidataEntitySet()
+        self.persons_list = WikidataEntitySet()
+        self.licenses_list = WikidataEntitySet()
+        self.organizations_list = WikidataEntitySet()
+        self.publications_list = WikidataEntitySet()
+
+    def load_software_entity_list(self):
         # list of valid entities (this is relatively small, but we might want to use a key/value store, 
         # like LMDB map, in the future)
-        with open("data/resources/software.wikidata.entities", "rt") as fp:
-            for line in fp:
-                self.software_list.append(line.rstrip())
+        self.software_list = load_entity_set("software")
 
-    def import_software_entities_and_properties(self, jsonWikidataDumpPath, reset=False):
-        if reset:
+    def read_dump(self, jsonWikidataDumpPath, entity_filter, task_name, nb_workers=None, resume=False, spill_index=None):
+        '''
+        Iterate over the entities of the dump selected by the filter, with periodic checkpoints of the
+        position in the dump and of the related entity lists. With resume, reading restarts from the 
+        last checkpoint of the same task.
+        '''
+        entity_sets = { "persons": self.persons_list, "licenses": self.licenses_list, 
+                        "organizations": self.organizations_list, "publications": self.publications_list }
+        checkpoint = self._checkpoint(task_name, jsonWikidataDumpPath)
+        start_block = 0
+        carry = b''
+        if resume:
+            start_block, carry = checkpoint.load(entity_sets)
+
+        def on_block(tasks, next_block, carry):
+            if checkpoint.should_save(next_block):
+                # everything read before the checkpoint must be written in the database 
+                if hasattr(self, "bulk_writer"):
+                    self.bulk_writer.flush()
+                if self.naming_loader != None:
+                    self.naming_loader.flush()
+                spill_length = None
+                if spill_index != None:
+                    spill_length = spill_index.sync()
+                checkpoint.save(tasks, next_block, carry, entity_sets, spill_length=spill_length)
+
+        return read_dump_entities(jsonWikidataDumpPath, entity_filter, nb_workers=nb_workers, spill_index=spill_index, 
+                                  start_block=start_block, carry=carry, on_block=on_block, spill_length=checkpoint.spill_length)
+
+    def _checkpoint(self, task_name, jsonWikidataDumpPath=None):
+        return DumpCheckpoint(os.path.join("data", self.database_name, "checkpoint"), task_name, jsonWikidataDumpPath)
+
+    def clear_checkpoint(self, task_name):
+        self._checkpoint(task_name).clear()
+
+    def import_software_entities_and_properties(self, jsonWikidataDumpPath, reset=False, nb_workers=None, resume=False):
+        if reset and not resume:
             self.db.delete_collection('software')
             self.software = self.db.create_collection('software')
 
         name_additional_entities = []
 
-        # read compressed dump line by line
+        # read compressed dump, decompression and json parsing are distributed over several processes
         print(jsonWikidataDumpPath)
-        with bz2.open(jsonWikidataDumpPath, "rt") as bzinput:
-            bzinput.read(2) # skip first 2 bytes 
-            for i, line in enumerate(bzinput):
-                if i % 1000000 == 0 and i != 0:
-                    sys.stdout.write(str(i))
-                    sys.stdout.flush()
-                elif i % 100000 == 0 and i != 0:
-                    sys.stdout.write('.')
-                    sys.stdout.flush()
-
-                if len(line.strip().rstrip('\n')) == 0:
-                    # this is usually the end
-                    continue
-
-                entityJson = None
-                try:
-                    entityJson = json.loads(line.rstrip(',\n'))
-                except Exception as e:
-                    print("Failed to parse json line at line", i, str(e))
-
-                if not entityJson is None:    
-                    if self._valid_software(entityJson):
-                        entityJson = simplify_entity(entityJson)
-                        # store entity in arangodb as document
-                        local_id = entityJson['id']
-                        if not self.software.has(local_id):
-                            entityJson['_id'] = 'software/' + local_id
-                            self.software.insert(entityJson)
-                            self.add_extra_entities(entityJson)
+        entity_filter = DumpEntityFilter(wanted=[self.software_list])
+        for entityJson in self.read_dump(jsonWikidataDumpPath, entity_filter, "import_software_entities_and_properties", nb_workers=nb_workers, resume=resume):
+            if self._valid_software(entityJson):
+                # store entity in arangodb as document
+                local_id = entityJson['id']
+                entityJson['_id'] = 'software/' + local_id
+                self.bulk_writer.add(self.software, entityJson)
+                self.add_extra_entities(entityJson)
+        self.bulk_writer.flush()
         
         # write list of related entities
         self.write_extra_entity_lists()
+        self.clear_checkpoint("import_software_entities_and_properties")
 
     def _valid_software(self, jsonEntity):
         """
@@ -239,14 +277,14 @@ class Wikidata_harvester(Harvester):
                             person_value = property_value["value"]
                             if not person_value in self.persons_list:
                                 # note: we'll check the actual P31 entity type when loading, when we have the full record for this candidate person
-                                self.persons_list.append(person_value)
+                                self.persons_list.add(person_value)
                 # licenses
                 if wikidata_property in self.licenses_properties:
                     for property_value in property_values:
                         if property_value["datatype"] == 'wikibase-item':
                             license_value = property_value["value"]
                             if not license_value in self.licenses_list:
-                                self.licenses_list.append(license_value)
+                                self.licenses_list.add(license_value)
                 # organization
                 if wikidata_property in self.organizations_properties:
                     for property_value in property_values:
@@ -254,7 +292,7 @@ class Wikidata_harvester(Harvester):
                             organization_value = property_value["value"]
                             if not organization_value in self.organizations_list:
                                 # when loading, we will have to check the P279 chain to be sure it's an organization
-                                self.organizations_list.append(organization_value)
+                                self.organizations_list.add(organization_value)
                 # publication
                 if wikidata_property in self.publications_properties:
                     for property_value in property_values:
@@ -262,75 +300,37 @@ class Wikidata_harvester(Harvester):
                             publication_value = property_value["value"]
                             if not publication_value in self.publications_list:
                                 # when loading, we will have to check the P31 as scholar article (Q13442814) for the entity
-                                self.publications_list.append(publication_value)
+                                self.publications_list.add(publication_value)
 
     def write_extra_entity_lists(self):
         # person
-        person_path = os.path.join("data", "resources", "persons.wikidata.entities")
-        with open(person_path, "w") as person_file:
-            for person in self.persons_list:
-                person_file.write(person)
-                person_file.write("\n")
+        self.persons_list.save(entity_set_path("persons"))
         # license
-        license_path = os.path.join("data", "resources", "licenses.wikidata.entities")
-        with open(license_path, "w") as license_file:
-            for license in self.licenses_list:
-                license_file.write(license)
-                license_file.write("\n")
+        self.licenses_list.save(entity_set_path("licenses"))
         # organization
-        organization_path = os.path.join("data", "resources", "organizations.wikidata.entities")
-        with open(organization_path, "w") as organization_file:
-            for organization in self.organizations_list:
-                organization_file.write(organization)
-                organization_file.write("\n")
+        self.organizations_list.save(entity_set_path("organizations"))
         # publication
-        publication_path = os.path.join("data", "resources", "publications.wikidata.entities")
-        with open(publication_path, "w") as publication_file:
-            for publication in self.publications_list:
-                publication_file.write(publication)
-                publication_file.write("\n")
+        self.publications_list.save(entity_set_path("publications"))
 
     def load_extra_entity_list(self):
         # person
-        person_path = os.path.join("data", "resources", "persons.wikidata.entities")
-        if os.path.isfile(person_path):
-            self.persons_list = []
-            with open(person_path) as person_file:
-                for line in person_file.readlines():
-                    line = line.strip().rstrip('\n')
-                    self.persons_list.append(line)
+        if os.path.isfile(entity_set_path("persons")):
+            self.persons_list = load_entity_set("persons")
         # license
-        license_path = os.path.join("data", "resources", "licenses.wikidata.entities")
-        if os.path.isfile(license_path):
-            self.licenses_list = []
-            with open(license_path) as license_file:
-                for line in license_file.readlines():
-                    line = line.strip().rstrip('\n')
-                    self.licenses_list.append(line)
-
+        if os.path.isfile(entity_set_path("licenses")):
+            self.licenses_list = load_entity_set("licenses")
         # organization
-        organization_path = os.path.join("data", "resources", "organizations.wikidata.entities")
-        if os.path.isfile(organization_path):
-            self.organizations_list = []
-            with open(organization_path) as organization_file:
-                for line in organization_file.readlines():
-                    line = line.strip().rstrip('\n')
-                    self.organizations_list.append(line)
-
+        if os.path.isfile(entity_set_path("organizations")):
+            self.organizations_list = load_entity_set("organizations")
         # publication
-        publication_path = os.path.join("data", "resources", "publications.wikidata.entities")
-        if os.path.isfile(publication_path):
-            self.publications_list = []
-            with open(publication_path) as publication_file:
-                for line in publication_file.readlines():
-                    line = line.strip().rstrip('\n')
-                    self.publications_list.append(line)
-
-    def import_extra_entities(self, jsonWikidataDumpPath, reset=False):
+        if os.path.isfile(entity_set_path("publications")):
+            self.publications_list = load_entity_set("publications")
+
+    def import_extra_entities(self, jsonWikidataDumpPath, reset=False, nb_workers=None, resume=False):
         '''
         We make an extra pass in the Wikidata dump (slow but it should be normally done rarely)
         '''
-        if reset:
+        if reset and not resume:
             self.db.delete_collection('persons')
             self.persons = self.db.create_collection('persons')
 
@@ -346,64 +346,135 @@ class Wikidata_harvester(Harvester):
         # load entity lists if exist
         self.load_extra_entity_list()
 
-        # read compressed dump line by line
+        # read compressed dump, decompression and json parsing are distributed over several processes
         print(jsonWikidataDumpPath)
-        with bz2.open(jsonWikidataDumpPath, "rt") as bzinput:
-            bzinput.read(2) # skip first 2 bytes 
-            for i, line in enumerate(bzinput):
-                if i % 1000000 == 0 and i != 0:
-                    sys.stdout.write(str(i))
-                    sys.stdout.flush()
-                elif i % 100000 == 0 and i != 0:
-                    sys.stdout.write('.')
-                    sys.stdout.flush()
-                
-                if len(line.strip()) == 0:
-                    # this is usually the end
-                    continue
-
-                entityJson = None
-                try:
-                    entityJson = json.loads(line.rstrip(',\n'))
-                except Exception as e:
-                    print("Failed to parse json line at line", i, str(e))
-                    #print("Failed to parse json line at line", i, "json content:", line.rstrip(',\n'))
-
-                if not entityJson is None:
-                    # first rough filtering
-                    if entityJson["id"] in self.persons_list or entityJson["id"] in self.licenses_list or entityJson["id"] in self.organizations_list or entityJson["id"] in self.publications_list:
-                        entityJson = simplify_entity(entityJson)
-
-                        if self._valid_person(entityJson):
-                            # store entity in arangodb as document
-                            local_id = entityJson['id']
-                            if not self.persons.has(local_id):
-                                entityJson['_id'] = 'persons/' + local_id
-                                self.persons.insert(entityJson)
-                        elif self._valid_license(entityJson):
-                            # store entity in arangodb as document
-                            local_id = entityJson['id']
-                            if not self.licenses.has(local_id):
-                                entityJson['_id'] = 'licenses/' + local_id
-                                self.licenses.insert(entityJson)
-                        elif self._valid_organization(entityJson):
-                            # store entity in arangodb as document
-                            local_id = entityJson['id']
-                            if not self.organizations.has(local_id):
-                                entityJson['_id'] = 'organizations/' + local_id
-                                self.organizations.insert(entityJson)        
-                        elif self._valid_publication(entityJson):
-                            # store entity in arangodb as document
-                            local_id = entityJson['id']
-                            if not self.publications.has(local_id):
-                                entityJson['_id'] = 'publications/' + local_id
-                                self.publications.insert(entityJson)        
-
-    def import_all(self, jsonWikidataDumpPath, reset=False):
+        # first rough filtering
+        entity_filter = DumpEntityFilter(wanted=[self.persons_list, self.licenses_list, self.organizations_list, self.publications_list])
+        for entityJson in self.read_dump(jsonWikidataDumpPath, entity_filter, "import_extra_entities", nb_workers=nb_workers, resume=resume):
+            if self._valid_person(entityJson):
+                # store entity in arangodb as document
+                local_id = entityJson['id']
+                entityJson['_id'] = 'persons/' + local_id
+                self.bulk_writer.add(self.persons, entityJson)
+            elif self._valid_license(entityJson):
+                # store entity in arangodb as document
+                local_id = entityJson['id']
+                entityJson['_id'] = 'licenses/' + local_id
+                self.bulk_writer.add(self.licenses, entityJson)
+            elif self._valid_organization(entityJson):
+                # store entity in arangodb as document
+                local_id = entityJson['id']
+                entityJson['_id'] = 'organizations/' + local_id
+                self.bulk_writer.add(self.organizations, entityJson)
+            elif self._valid_publication(entityJson):
+                # store entity in arangodb as document
+                local_id = entityJson['id']
+                entityJson['_id'] = 'publications/' + local_id
+                self.bulk_writer.add(self.publications, entityJson)
+        self.bulk_writer.flush()
+        self.clear_checkpoint("import_extra_entities")
+
+    def import_single_pass(self, jsonWikidataDumpPath, reset=False, nb_workers=None, naming=True, resume=False):
+        '''
+        Import software entities, related entities and optionally naming information with only one 
+        pass in the Wikidata dump. Software entities and properties are selected during the pass, 
+        while the position of every other item is recorded in a spill index on disk. The related 
+        entities (persons, licenses, organizations, publications), only known at the end of the pass,
+        are then read back from the few dump blocks containing them. 
+        '''
+        if reset and not resume:
+            for collection_name in ['software', 'persons', 'licenses', 'organizations', 'publications']:
+                self.db.delete_collection(collection_name)
+                setattr(self, collection_name, self.db.create_collection(collection_name))
+
+        spill_index = DumpSpillIndex(os.path.join("data", self.database_name, "spill"))
+
+        # read compressed dump, decompression and json parsing are distributed over several processes
+        print(jsonWikidataDumpPath)
+        if naming:
+            self.naming_loader = self.naming_bulk_loader()
+
+        entity_filter = DumpEntityFilter(wanted=[self.software_list], properties=naming)
+        for entityJson in self.read_dump(jsonWikidataDumpPath, entity_filter, "import_single_pass", nb_workers=nb_workers, resume=resume, spill_index=spill_index):
+            if self._valid_software(entityJson):
+                # store entity in arangodb as document
+                local_id = entityJson['id']
+                entityJson['_id'] = 'software/' + local_id
+                self.bulk_writer.add(self.software, entityJson)
+                self.add_extra_entities(entityJson)
+                if naming:
+                    self._add_entity_naming(entityJson)
+            elif naming and self._valid_property(entityJson):
+                self._add_entity_naming(entityJson)
+        self.bulk_writer.flush()
+
+        # write list of related entities
+        self.write_extra_entity_lists()
+
+        # second order entities from the spill index
+        related_ids = set()
+        for entity_list in [self.persons_list, self.licenses_list, self.organizations_list, self.publications_list]:
+            related_ids.update(entity_list)
+        print("\nresolving", len(related_ids), "related entities")
+
+        entity_filter = DumpEntityFilter(wanted=[related_ids])
+        for entityJson in read_spilled_entities(spill_index, entity_filter, related_ids, nb_workers=nb_workers):
+            local_id = entityJson['id']
+            if self._valid_person(entityJson):
+                entityJson['_id'] = 'persons/' + local_id
+                self.bulk_writer.add(self.persons, entityJson)
+            elif self._valid_license(entityJson):
+                entityJson['_id'] = 'licenses/' + local_id
+                self.bulk_writer.add(self.licenses, entityJson)
+            elif self._valid_organization(entityJson):
+                entityJson['_id'] = 'organizations/' + local_id
+                self.bulk_writer.add(self.organizations, entityJson)
+            elif self._valid_publication(entityJson):
+                entityJson['_id'] = 'publications/' + local_id
+                self.bulk_writer.add(self.publications, entityJson)
+            if naming:
+                self._add_entity_naming(entityJson)
+        self.bulk_writer.flush()
+
+        if naming:
+            self.add_custom_properties_naming()
+            self.naming_loader.flush()
+            self.naming_loader = None
+            # names may have been replaced, the snapshot is outdated
+            self.remove_naming_snapshot()
+        self.clear_checkpoint("import_single_pass")
+
+    def _add_entity_naming(self, entityJson):
+        # after simplification, the labels field is the English label string when available
+        if "labels" in entityJson and isinstance(entityJson["labels"], str):
+            self.add_naming(entityJson["id"], entityJson["labels"])
+
+    def add_naming(self, wikidata_id, name):
+        # names are written by batches during dump imports
+        if self.naming_loader != None:
+            self.naming_loader.add(wikidata_id, name)
+        else:
+            self.add_naming_wikidata(wikidata_id, name)
+
+    def add_custom_properties_naming(self):
+        # add the few custom properties
+        custom_properties = None
+        custom_properties_file = os.path.join("data", "resources", "custom_properties.json")
+        if not os.path.isfile(custom_properties_file): 
+            print("Warning: no custom Wikidata properties file defintion:", custom_properties_file)
+        else:
+            with open(custom_properties_file) as properties_f:
+                custom_properties_string = properties_f.read()
+                custom_properties = json.loads(custom_properties_string)
+
+            for key, value in custom_properties.items():
+                self.add_naming(key, value['label'])
+
+    def import_all(self, jsonWikidataDumpPath, reset=False, nb_workers=None, resume=False):
         '''
         Import all relevant entities and all properties
         '''
-        if reset:
+        if reset and not resume:
             self.db.delete_collection('software')
             self.software = self.db.create_collection('software')
 
@@ -423,82 +494,69 @@ class Wikidata_harvester(Harvester):
         # load non-software entity lists if exist
         self.load_extra_entity_list()
 
-        # read compressed dump line by line
+        # read compressed dump, decompression and json parsing are distributed over several processes
         print(jsonWikidataDumpPath)
-        with bz2.open(jsonWikidataDumpPath, "rt") as bzinput:
-            bzinput.read(2) # skip first 2 bytes 
-            for i, line in enumerate(bzinput):
-                if i % 1000000 == 0 and i != 0:
-                    sys.stdout.write(str(i))
-                    sys.stdout.flush()
-                elif i % 100000 == 0 and i != 0:
-                    sys.stdout.write('.')
-                    sys.stdout.flush()
-                
-                if len(line.strip()) == 0:
-                    # this is usually the end
-                    continue
-
-                entityJson = None
-                try:
-                    entityJson = json.loads(line.rstrip(',\n'))
-                except Exception as e:
-                    print("Failed to parse json line at line", i, str(e))
-                    #print("Failed to parse json line at line", i, "json content:", line.rstrip(',\n'))
-
-                if not entityJson is None:
-                    # first rough filtering
-                    if entityJson["id"] in self.persons_list or entityJson["id"] in self.licenses_list or entityJson["id"] in self.organizations_list or entityJson["id"] in self.publications_list:
-                        entityJson = simplify_entity(entityJson)
-
-                        if self._valid_software(entityJson):
-                            # store entity in arangodb as document
-                            local_id = entityJson['id']
-                            if not self.software.has(local_id):
-                                entityJson['_id'] = 'software/' + local_id
-                                self.software.insert(entityJson)
-                        elif self._valid_person(entityJson):
-                            # store entity in arangodb as document
-                            local_id = entityJson['id']
-                            if not self.persons.has(local_id):
-                                entityJson['_id'] = 'persons/' + local_id
-                                self.persons.insert(entityJson)
-                        elif self._valid_license(entityJson):
-                            # store entity in arangodb as document
-                            local_id = entityJson['id']
-                            if not self.licenses.has(local_id):
-                                entityJson['_id'] = 'licenses/' + local_id
-                                self.licenses.insert(entityJson)
-                        elif self._valid_organization(entityJson):
-                            # store entity in arangodb as document
-                            local_id = entityJson['id']
-                            if not self.organizations.has(local_id):
-                                entityJson['_id'] = 'organizations/' + local_id
-                                self.organizations.insert(entityJson)        
-                        elif self._valid_publication(entityJson):
-                            # store entity in arangodb as document
-                            local_id = entityJson['id']
-                            if not self.publications.has(local_id):
-                                entityJson['_id'] = 'publications/' + local_id
-                                self.publications.insert(entityJson)        
+        # first rough filtering
+        entity_filter = DumpEntityFilter(wanted=[self.software_list, self.persons_list, self.licenses_list, self.organizations_list, self.publications_list])
+        for entityJson in self.read_dump(jsonWikidataDumpPath, entity_filter, "import_all", nb_workers=nb_workers, resume=resume):
+            if self._valid_software(entityJson):
+                # store entity in arangodb as document
+                local_id = entityJson['id']
+                entityJson['_id'] = 'software/' + local_id
+                self.bulk_writer.add(self.software, entityJson)
+            elif self._valid_person(entityJson):
+                # store entity in arangodb as document
+                local_id = entityJson['id']
+                entityJson['_id'] = 'persons/' + local_id
+                self.bulk_writer.add(self.persons, entityJson)
+            elif self._valid_license(entityJson):
+                # store entity in arangodb as document
+                local_id = entityJson['id']
+                entityJson['_id'] = 'licenses/' + local_id
+                self.bulk_writer.add(self.licenses, entityJson)
+            elif self._valid_organization(entityJson):
+                # store entity in arangodb as document
+                local_id = entityJson['id']
+                entityJson['_id'] = 'organizations/' + local_id
+                self.bulk_writer.add(self.organizations, entityJson)
+            elif self._valid_publication(entityJson):
+                # store entity in arangodb as document
+                local_id = entityJson['id']
+                entityJson['_id'] = 'publications/' + local_id
+                self.bulk_writer.add(self.publications, entityJson)
+        self.bulk_writer.flush()
+        self.clear_checkpoint("import_all")
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description = "Import relevant Wikidata entities")
-    parser.add_argument("WikidataDumpPath", default=None, help="path to a complete Wikidata JSON dump file in bz2 format") 
+    parser.add_argument("WikidataDumpPath", default=None, help="path to a complete Wikidata JSON dump file in bz2 format, or to a directory of bz2 chunks") 
     parser.add_argument("--config", default="./config.yaml", help="path to the config file, default is ./config.yaml") 
     parser.add_argument("--reset", action="store_true", help="reset existing collections and re-import all Wikidata records") 
+    parser.add_argument("--workers", type=int, default=None, help="number of processes for decompressing and parsing the dump, default is the number of CPU cores") 
+    parser.add_argument("--batch-size", type=int, default=None, help="number of documents written to ArangoDB per request, default is the value of the config file") 
+    parser.add_argument("--resume", action="store_true", help="resume an interrupted import from its last checkpoint") 
+    parser.add_argument("--single-pass", action="store_true", help="import software, related entities and naming with only one pass in the dump") 
 
     args = parser.parse_args()
     config_path = args.config
     WikidataDumpPath = args.WikidataDumpPath
     to_reset = args.reset
+    nb_workers = args.workers
+    single_pass = args.single_pass
+    batch_size = args.batch_size
+    resume = args.resume
+    if resume and to_reset:
+        print("Resuming an import, existing collections will not be reset")
 
     if WikidataDumpPath is not None:
-        local_harvester = Wikidata_harvester(config_path=config_path)
+        local_harvester = Wikidata_harvester(config_path=config_path, batch_size=batch_size)
         #local_harvester.import_entities(WikidataDumpPath, reset=to_reset)
         #local_harvester.import_extra_entities(WikidataDumpPath, reset=to_reset)
-        local_harvester.import_all(WikidataDumpPath, reset=to_reset)
+        if single_pass:
+            local_harvester.import_single_pass(WikidataDumpPath, reset=to_reset, nb_workers=nb_workers, resume=resume)
+        else:
+            local_harvester.import_all(WikidataDumpPath, reset=to_reset, nb_workers=nb_workers, resume=resume)
     else:
         print("No Wikidata JSON dump file path indicated")
 
@@ -9,10 +9,10 @@ import json
 from Wikidata_import import Wikidata_harvester
 from arango import ArangoClient
 import re
-from import_common import clean_field, is_git_repo
+from software_kb.importing.import_common import clean_field, is_git_repo
 import sys
 import os
-import bz2
+from software_kb.importing.dump_reader import DumpEntityFilter
 
 class Wikidata_naming_harvester(Wikidata_harvester):
 
@@ -20,76 +20,52 @@ class Wikidata_naming_harvester(Wikidata_harvester):
         self.load_config(config_path)
         self.init_naming(reset)
 
-        with open("data/resources/software.wikidata.entities", "rt") as fp:
-            for line in fp:
-                self.software_list.append(line.rstrip())
-        
+        self.init_entity_lists()
+        self.load_software_entity_list()
         self.load_extra_entity_list()
 
-    def import_naming(self, jsonWikidataDumpPath):
+    def import_naming(self, jsonWikidataDumpPath, nb_workers=None, resume=False):
 
-        # read compressed dump line by line
-        print(jsonWikidataDumpPath)
-        with bz2.open(jsonWikidataDumpPath, "rt") as bzinput:
-            bzinput.read(2) # skip first 2 bytes 
-            for i, line in enumerate(bzinput):
-                if i % 1000000 == 0 and i != 0:
-                    sys.stdout.write(str(i))
-                    sys.stdout.flush()
-                elif i % 100000 == 0 and i != 0:
-                    sys.stdout.write('.')
-                    sys.stdout.flush()
-
-                if len(line.strip().rstrip('\n')) == 0:
-                    # this is usually the end
-                    continue
-
-                entityJson = None
-                try:
-                    entityJson = json.loads(line.rstrip(',\n'))
-                except Exception as e:
-                    print("Failed to parse json line at line", i, str(e))
+        # names are checked in memory and written by large batches
+        self.naming_loader = self.naming_bulk_loader()
 
-                if not entityJson is None:    
-                    
-                    if self._valid_property(entityJson) or \
-                       self._valid_software(entityJson) or \
-                       entityJson["id"] in self.persons_list or \
-                       entityJson["id"] in self.licenses_list or \
-                       entityJson["id"] in self.organizations_list or \
-                       entityJson["id"] in self.publications_list:
-                        local_labels = entityJson["labels"]
-                        if "en" in local_labels:
-                            string_name = local_labels["en"]["value"]
-                        self.add_naming_wikidata(entityJson["id"], string_name)
-
-        # add the few custom properties
-        custom_properties = None
-        custom_properties_file = os.path.join("data", "resources", "custom_properties.json")
-        if not os.path.isfile(custom_properties_file): 
-            print("Warning: no custom Wikidata properties file defintion:", custom_properties_file)
-        else:
-            with open(custom_properties_file) as properties_f:
-                custom_properties_string = properties_f.read()
-                custom_properties = json.loads(custom_properties_string)
+        # read compressed dump, decompression and json parsing are distributed over several processes
+        print(jsonWikidataDumpPath)
+        entity_filter = DumpEntityFilter(wanted=[self.software_list, self.persons_list, self.licenses_list, self.organizations_list, self.publications_list], 
+                                         properties=True, 
+                                         simplify=False)
+        for entityJson in self.read_dump(jsonWikidataDumpPath, entity_filter, "import_naming", nb_workers=nb_workers, resume=resume):
+            local_labels = entityJson["labels"]
+            if "en" in local_labels:
+                string_name = local_labels["en"]["value"]
+                self.add_naming(entityJson["id"], string_name)
 
-            for key, value in custom_properties.items():
-                self.add_naming_wikidata(key, value['label'])
+        self.add_custom_properties_naming()
+        self.naming_loader.flush()
+        print("\n" + str(self.naming_loader.nb_added), "names added,", self.naming_loader.nb_not_unique, "non unique names ignored")
+        self.naming_loader = None
+        # names may have been replaced, the snapshot is outdated
+        self.remove_naming_snapshot()
+        self.clear_checkpoint("import_naming")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description = "Import relevant Wikidata entities")
-    parser.add_argument("WikidataDumpPath", default=None, help="path to a complete Wikidata JSON dump file in bz2 format") 
+    parser.add_argument("WikidataDumpPath", default=None, help="path to a complete Wikidata JSON dump file in bz2 format, or to a directory of bz2 chunks") 
     parser.add_argument("--config", default="./config.yaml", help="path to the config file, default is ./config.yaml") 
     parser.add_argument("--reset", action="store_true", help="reset existing collections and re-import all Wikidata records") 
+    parser.add_argument("--workers", type=int, default=None, help="number of processes for decompressing and parsing the dump, default is the number of CPU cores") 
+    parser.add_argument("--resume", action="store_true", help="resume an interrupted import from its last checkpoint") 
 
     args = parser.parse_args()
     config_path = args.config
     WikidataDumpPath = args.WikidataDumpPath
     to_reset = args.reset
+    nb_workers = args.workers
+    resume = args.resume
 
     if WikidataDumpPath is not None:
-        local_harvester = Wikidata_naming_harvester(config_path=config_path, reset=to_reset)
-        local_harvester.import_naming(WikidataDumpPath)
+        local_harvester = Wikidata_naming_harvester(config_path=config_path, reset=(to_reset and not resume))
+        local_harvester.import_naming(WikidataDumpPath, nb_workers=nb_workers, resume=resume)
     else:
         print("No Wikidata JSON dump file path indicated")
 
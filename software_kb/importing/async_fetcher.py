@@ -0,0 +1,130 @@
+'''
+    Concurrent and polite HTTP fetcher for the harvesters
+
+    Downloads are done with an asyncio httpx client, so many requests can be in flight while the
+    politeness towards each host is kept with a per-host token bucket (a sustained number of
+    requests per second with a small burst), instead of a fixed sleep before every request.
+    Connections are kept alive and reused between requests to the same host. Network errors,
+    429 and 5xx responses are retried with a jittered exponential backoff, respecting the
+    Retry-After header when present.
+
+    The fetcher owns its event loop, so it can be used from the synchronous harvester code:
+
+        fetcher = AsyncFetcher(max_connections=8, requests_per_second=2)
+        responses = fetcher.fetch_all(["https://cran.r-project.org/package=knitr", ...])
+        fetcher.close()
+'''
+
+import time
+import random
+import asyncio
+import httpx
+from urllib.parse import urlparse
+
+default_user_agent = 'Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:68.0) Gecko/20100101 Firefox/68.0'
+
+class TokenBucket(object):
+    '''
+    Asynchronous token bucket, refilled at rate tokens per second up to capacity tokens
+    '''
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.last = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class AsyncFetcher(object):
+
+    def __init__(self, max_connections=8, requests_per_second=2.0, burst=2, max_retries=4, backoff=1.0,
+                 timeout=60, user_agent=default_user_agent, transport=None):
+        self.max_connections = max_connections
+        self.requests_per_second = requests_per_second
+        self.burst = burst
+        self.max_retries = max_retries
+        # base delay in seconds of the exponential backoff
+        self.backoff = backoff
+        self.timeout = timeout
+        self.user_agent = user_agent
+        # optional httpx transport, e.g. httpx.MockTransport in tests
+        self.transport = transport
+        self.loop = asyncio.new_event_loop()
+        self.client = None
+        self.buckets = {}
+
+    def _get_client(self):
+        if self.client is None:
+            limits = httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections)
+            self.client = httpx.AsyncClient(limits=limits, timeout=self.timeout, follow_redirects=True,
+                                            headers={'User-agent': self.user_agent}, transport=self.transport)
+        return self.client
+
+    def _get_bucket(self, url):
+        host = urlparse(url).netloc
+        if not host in self.buckets:
+            self.buckets[host] = TokenBucket(self.requests_per_second, self.burst)
+        return self.buckets[host]
+
+    async def _fetch(self, url, semaphore, headers=None):
+        '''
+        Return the (fully read) httpx response, or None if the connection failed after all the retries
+        '''
+        attempt = 0
+        while True:
+            await self._get_bucket(url).acquire()
+            response = None
+            try:
+                async with semaphore:
+                    response = await self._get_client().get(url, headers=headers)
+            except httpx.HTTPError as err:
+                print("Connection fails:", url, str(err))
+
+            retry_after = None
+            if response is not None:
+                if response.status_code != 429 and response.status_code < 500:
+                    return response
+                retry_after = response.headers.get("Retry-After")
+
+            attempt += 1
+            if attempt > self.max_retries:
+                return response
+            if retry_after is not None and retry_after.isdigit():
+                delay = int(retry_after)
+            else:
+                delay = self.backoff * (2 ** (attempt-1))
+            # jitter, so that the retries of concurrent requests are not synchronized
+            await asyncio.sleep(delay * (0.5 + random.random() / 2))
+
+    async def _fetch_all(self, urls, headers):
+        semaphore = asyncio.Semaphore(self.max_connections)
+        tasks = [ self._fetch(url, semaphore, headers.get(url) if headers is not None else None) for url in urls ]
+        return await asyncio.gather(*tasks)
+
+    def fetch_all(self, urls, headers=None):
+        '''
+        Download concurrently a list of URL, return the list of httpx responses in the same order
+        (None for connection failures). headers is an optional dict url -> additional request headers.
+        '''
+        if len(urls) == 0:
+            return []
+        return self.loop.run_until_complete(self._fetch_all(urls, headers))
+
+    def fetch(self, url, headers=None):
+        return self.fetch_all([url], headers={ url: headers } if headers is not None else None)[0]
+
+    def close(self):
+        if self.client is not None:
+            self.loop.run_until_complete(self.client.aclose())
+            self.client = None
+        self.loop.close()
@@ -6,14 +6,17 @@
     As of 2021-02-01, 17091 packages
 '''
 
+import os
 import requests
 import argparse
 import json
-import re
+import multiprocessing
 from harvester import Harvester
+from software_kb.importing.local_cache import open_cached_file
+from software_kb.importing.cran_parser import extract_package_record, convert_package_record, extract_references, parse_package_pages
+from software_kb.common.bulk_writer import BulkWriter, default_batch_size
 from arango import ArangoClient
-from bs4 import BeautifulSoup
-from import_common import process_author_field, clean_field, process_url_field, process_maintainer_field, process_boolean_field, process_dependency_field, is_git_repo
+from software_kb.importing.import_common import diff_package_versions
 
 base_url = 'http://crandb.r-pkg.org/'
 # example package metadata: http://crandb.r-pkg.org/knitr
@@ -23,13 +26,27 @@ package_list_cran_raw = 'https://cran.r-project.org/src/contrib/PACKAGES'
 # raw package: https://cran.r-project.org/package=knitr
 # bibliographical reference raw information: "https://cran.r-project.org/web/packages/%s/citation.html"
 
+# number of package pages downloaded concurrently before being processed
+prefetch_size = 200
+
+def package_page_url(package_name):
+    return "https://cran.r-project.org/package=" + package_name
+
+def citation_page_url(package_name):
+    return "https://cran.r-project.org/web/packages/" + package_name + "/citation.html"
+
 class cran_harvester(Harvester):
 
     database_name = "CRAN"
 
-    def __init__(self, config_path="./config.json"):
+    def __init__(self, config_path="./config.json", batch_size=None):
         self.load_config(config_path)
 
+        # packages are written by batches, replacing the previous version of the package
+        if batch_size is None:
+            batch_size = self.config['arangodb'].get('batch_size', default_batch_size)
+        self.bulk_writer = BulkWriter(batch_size=batch_size, on_duplicate="replace")
+
         # create database and collection
         if not self.sys_db.has_database(self.database_name):
             self.sys_db.create_database(self.database_name)
@@ -41,28 +58,30 @@ class cran_harvester(Harvester):
         else:
             self.packages = self.db.collection('packages')
 
-        if not self.db.has_collection('cache'):
-            self.cache = self.db.create_collection('cache')
-        else:
-            self.cache = self.db.collection('cache')
-
+    def import_packages(self, reset=False, nb_workers=None, refresh=False):
+        '''
+        The stored versions of the packages are compared with the list of available CRAN packages, only
+        the new packages and the packages with a new version are fetched and written. With refresh,
+        the stored packages not available anymore on CRAN are also removed.
 
-    def import_packages(self, reset=False):
+        The package pages are parsed from the local cache with a pool of nb_workers processes 
+        (default is the number of CPU)
+        '''
         if reset:
             self.db.delete_collection('packages')
             self.packages = self.db.create_collection('packages')
 
         all_packages = []
 
-        # get the list of packages
-        local_path = self.access_file(package_list_cran_raw, use_cache=True)
+        # get the list of packages, revalidated at each run (cheap 304 response if the list has not changed)
+        local_path = self.access_file(package_list_cran_raw, use_cache=False)
         textResult = None
         if local_path is not None:
             # get the content from file
-            with open(local_path) as file:
+            with open_cached_file(local_path, "rt") as file:
                 textResult = file.read()
         else:
-            print("Fail to retrieve the list of packages", packages_url, "status", response.status_code)
+            print("Fail to retrieve the list of packages", package_list_cran_raw)
             return
 
         textResultPackages = textResult.split("\n\n")
@@ -72,80 +91,91 @@ class cran_harvester(Harvester):
 
         print("total of available packages:", len(all_packages))
 
+        # check if package version match already stored package and version, all the stored versions 
+        # are retrieved with a single query
+        # if not, we will get the full raw package record via  https://cran.r-project.org/package=knitr
+        stored_versions = {}
+        cursor = self.db.aql.execute('FOR package IN packages RETURN [package._key, package.Version]', 
+            batch_size=10000, stream=True, ttl=3600)
+        for package_name, version in cursor:
+            stored_versions[package_name] = version
+        available_versions = {}
         for one_package in all_packages:
-            # check if package version match already stored package and version
-            # if not, we will get the full raw package record via  https://cran.r-project.org/package=knitr
-            to_be_inserted = False
-            one_package['_id'] = 'packages/' + one_package['Package']
-            if self.packages.has(one_package['_id']):
-                # check version
-                stored_package = self.packages.get(one_package['_id'])
-                if stored_package is not None:
-                    version = stored_package["Version"]
-                    #this is a new version available
-                    if version != one_package["Version"]:
-                        to_be_inserted = True
-            else:
-                to_be_inserted = True
-
-            if to_be_inserted:
-                local_url = "https://cran.r-project.org/package=" + one_package["Package"]
-                local_path = self.access_file(local_url)
-                if local_path is not None:
-                    # get the content from file
-                    content_html = None
-                    with open(local_path, "rb") as file:
-                        content_html = file.read()
-                    # the following should work, but apparently the CRAN html pages can be a mixture of UTF-8 and windows-1252 encoding
-                    content_html = content_html.decode('utf-8','ignore')    
-                    json_package = _convert_raw_package_record(content_html, one_package)
-                    #print(json.dumps(json_package))
+            available_versions[one_package['Package']] = one_package['Version']
+
+        new_packages, updated_packages, removed_packages = diff_package_versions(stored_versions, available_versions)
+        print("new packages:", len(new_packages), "- packages with a new version:", len(updated_packages), 
+            "- packages not available anymore:", len(removed_packages))
 
+        to_be_imported = []
+        for one_package in all_packages:
+            if one_package['Package'] in new_packages or one_package['Package'] in updated_packages:
+                if len(to_be_imported) > 0 and to_be_imported[-1]['Package'] == one_package['Package']:
+                    continue
+                one_package['_id'] = 'packages/' + one_package['Package']
+                to_be_imported.append(one_package)
+
+        print("packages to be imported:", len(to_be_imported))
+
+        if refresh and len(removed_packages) > 0:
+            removed_packages = list(removed_packages)
+            for batch_start in range(0, len(removed_packages), self.bulk_writer.batch_size):
+                self.packages.delete_many(removed_packages[batch_start:batch_start+self.bulk_writer.batch_size])
+
+        if nb_workers is None:
+            nb_workers = os.cpu_count() or 1
+        pool = None
+        if nb_workers > 1 and len(to_be_imported) > prefetch_size:
+            pool = multiprocessing.Pool(nb_workers)
+
+        try:
+            # package pages and citation pages are downloaded concurrently by chunks, they are then parsed 
+            # from the cache in parallel
+            for chunk_start in range(0, len(to_be_imported), prefetch_size):
+                chunk = to_be_imported[chunk_start:chunk_start+prefetch_size]
+                urls = []
+                revalidated_urls = []
+                for one_package in chunk:
+                    page_urls = [ package_page_url(one_package["Package"]), citation_page_url(one_package["Package"]) ]
+                    if one_package["Package"] in updated_packages:
+                        revalidated_urls.extend(page_urls)
+                    else:
+                        urls.extend(page_urls)
+                local_paths = self.access_files(urls)
+                local_paths.update(self.access_files(revalidated_urls, use_cache=False))
+
+                tasks = []
+                for one_package in chunk:
+                    tasks.append((one_package, 
+                                  local_paths[package_page_url(one_package["Package"])], 
+                                  local_paths[citation_page_url(one_package["Package"])]))
+
+                for json_package in parse_package_pages(tasks, pool=pool):
                     if json_package is None:
                         # it means that this package has been removed from CRAN (e.g. because policy violation)
                         continue
 
-                    # try to get bibliographical reference information
-                    references = self.import_reference_information(one_package['Package'])
-                    if references is not None and len(references)>0:
-                        json_package["References"] = references
-
-                    # detext repo in the field URL
-                    if 'URL' in json_package:
-
-                        # in case we have one git repo in the list of URL, we can seprate it from the from other url
-                        # manual/doc URL are already separated in CRAN 
-                        to_be_removed = []
-                        for url in json_package['URL']:
-                            if is_git_repo(url):
-                                to_be_removed.append(url)
-                                if url.startswith("http://"):
-                                    url = url.replace("http://", "https://")
-                                json_package['git_repository'] = url
-                                break
-                        if to_be_removed != None:
-                            for one_to_be_removed in to_be_removed:
-                                json_package['URL'].remove(one_to_be_removed)
-
-                    # insert
-                    json_package['_id'] = 'packages/' + one_package['Package']
-                    if not self.packages.has(json_package['_id']):
-                        self.packages.insert(json_package)
+                    # insert, or replace the previous version of the package
+                    json_package['_id'] = 'packages/' + json_package['Package']
+                    self.bulk_writer.add(self.packages, json_package)
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+            self.bulk_writer.flush()
 
     def import_reference_information(self, package_name):
         '''
         Raw bibliographical reference information for a given package can be accessed at
         "https://cran.r-project.org/web/packages/%s/citation.html"
         '''
-        local_url = "https://cran.r-project.org/web/packages/" + package_name + "/citation.html"
+        local_url = citation_page_url(package_name)
         local_path = self.access_file(local_url)
         if local_path is not None:
             # get the content from file
             content_html = None
-            with open(local_path, "rb") as file:
+            with open_cached_file(local_path, "rb") as file:
                 content_html = file.read()
-            content_html = content_html.decode('utf-8','ignore')  
-
             return convert_reference_information(content_html)
         else:
             return None
@@ -196,163 +226,11 @@ def _convert_raw_package_summary(textResultPackage):
     return package
 
 def _convert_raw_package_record(packageRecordHtml, json_package):
-    orcid_pattern = r'([0-9]{4}\-[0-9]{4}\-[0-9]{4}\-[0-9]{4})'
-    regex_orcid = re.compile(orcid_pattern)
-
-    soup = BeautifulSoup(packageRecordHtml, "lxml")
-
-    # note that some package can be removed from CRAN, but still have a page explaining the removal
-    # project is archived and metadata removed
-    # this can be detected easily here 
-    if soup.body.find("h2") == None:
-        print("the package has been removed from CRAN:", json_package['Package'])
-        return None
-
-    json_package['Title'] = clean_field(soup.body.h2.text)
-
-    # package name is prefixed in the title, we can strip it
-    if 'Package' in json_package:
-        if json_package['Title'].startswith(json_package['Package']):
-            json_package['Title'] = json_package['Title'][len(json_package['Package'])+1:].strip()
-
-    json_package['Description'] = clean_field(soup.body.p.text)
-    
-    # the rest is via a 2-column tables encoding basically attribute/value
-    tables = soup.findAll("table")
-
-    table1 = None
-    for table in tables:
-        if table.has_attr('summary'):
-            # first one is the package metadata summary
-            table1 = table
-            break
-
-    if table1 is not None:
-        tbody = table1.find("tbody")
-        if tbody == None:
-            rows = table1.find_all("tr")
-        else:
-            rows = table1.find("tbody").find_all("tr")
-        for row in rows:
-            cells = row.find_all("td")
-            if len(cells) != 2:
-                continue
-            field = cells[0].get_text()
-            #print(field)
-            if field == "Version:":
-                json_package["Version"] = clean_field(cells[1].get_text())
-            elif field == "Maintainer:":
-                json_package["Maintainer"] = process_maintainer_field(clean_field(cells[1].get_text()))
-            elif field == "Author:":
-                json_package["Authors"] = process_author_field(clean_field(cells[1].get_text()))
-            elif field == "License:":
-                json_package["License"] = clean_field(cells[1].get_text())
-            elif field == "Published:":
-                json_package["latest_published"] = clean_field(cells[1].get_text())
-            elif field == "BugReports:":
-                urls = process_url_field(cells[1].get_text())
-                if len(urls) > 0:
-                    json_package["BugReports"] = urls[0]
-            elif field == "NeedsCompilation:":
-                json_package["NeedsCompilation"] = process_boolean_field(cells[1].get_text())
-            elif field == "URL:":
-                json_package["URL"] = process_url_field(cells[1].get_text())
-            elif field == "Depends:":
-                if "_hard_deps" in json_package:
-                    json_package["_hard_deps"] = json_package["_hard_deps"] + process_dependency_field(cells[1].get_text(), "Depends")
-                else:
-                    json_package["_hard_deps"] = process_dependency_field(cells[1].get_text(), "Depends")
-            elif field == "Imports:":
-                if "_hard_deps" in json_package:
-                    json_package["_hard_deps"] = json_package["_hard_deps"] + process_dependency_field(cells[1].get_text(), "Imports")
-                else:
-                    json_package["_hard_deps"] = process_dependency_field(cells[1].get_text(), "Imports")
-            elif field == "Suggests:":
-                json_package["_soft_deps"] = process_dependency_field(cells[1].get_text(), "Suggest")
-
-            #print(cells[1].get_text())
-
-    table2 = None
-    rank = 0
-    for table in tables:
-        if table.has_attr('summary'):
-            rank += 1
-            if rank == 2:
-                # second one is the download summary 
-                table2 = table
-                break
-    if table2 is not None:
-        tbody = table2.find("tbody")
-        if tbody == None:
-            rows = table2.find_all("tr")
-        else:
-            rows = table2.find("tbody").find_all("tr")
-        for row in rows:
-            cells = row.find_all("td")
-            if len(cells) != 2:
-                continue
-            field = cells[0].get_text().strip()
-            #print(field)
-
-            if field == 'Reference manual:':
-                if cells[1].find("a") != None:
-                    link_manual = cells[1].find("a")['href']
-                    if not link_manual.startswith("http"):
-                        # this is a relative address, so we expand it
-                        link_manual = "https://cran.r-project.org/web/packages/" + json_package['Package'] + "/" + link_manual
-                    json_package["Manual"] = link_manual
-
-    table3 = None
-    rank = 0
-    for table in tables:
-        if table.has_attr('summary'):
-            rank += 1
-            if rank == 3:
-                # third one is the reverse dependency summary 
-                table3 = table
-    if table3 is not None:
-        tbody = table3.find("tbody")
-        if tbody == None:
-            rows = table3.find_all("tr")
-        else:
-            rows = table3.find("tbody").find_all("tr")
-        for row in rows:
-            cells = row.find_all("td")
-            if len(cells) != 2:
-                continue
-            field = cells[0].get_text()
-            #print(field)
-
-            #"Reverse depends:"
-            #"Reverse imports:"
-            #"Reverse suggests:"
-            #"Reverse enhances:"
-
-    return json_package
+    # see cran_parser.py for the extraction of the package page
+    return convert_package_record(extract_package_record(packageRecordHtml), json_package)
 
 def convert_reference_information(content_html):
-    if content_html == None:
-        return None
-
-    soup = BeautifulSoup(content_html, "lxml")
-    references = []
-
-    # raw reference are under <blockquote>, one <blockquote> per reference
-    blockquotes = soup.find_all("blockquote")
-    for blockquote in blockquotes:
-        reference = {}
-        reference['raw'] = clean_field(blockquote.text)
-        references.append(reference)
-
-    # each bibtex reference are under one <pre> block, then usual bibtex format
-    pres = soup.find_all("pre")
-    for pre in pres:
-        reference = {}
-        reference['bibtex'] = pre.text.strip()
-        references.append(reference)
-
-    return references
-
+    return extract_references(content_html)
 
 def _val_line(line):
     ind = line.find(":")
@@ -365,11 +243,13 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Harvest and update CRAN public data")
     parser.add_argument("--config", default="./config.json", help="path to the config file, default is ./config.json") 
     parser.add_argument("--reset", action="store_true", help="reset existing collections and re-import all CRAN records") 
+    parser.add_argument("--refresh", action="store_true", help="also remove the stored packages which are not available anymore on CRAN") 
+    parser.add_argument("--nb-workers", type=int, default=None, help="number of processes for parsing the package pages, default is the number of CPU") 
 
     args = parser.parse_args()
     config_path = args.config
     to_reset = args.reset
 
     local_harvester = cran_harvester(config_path=config_path)
-    local_harvester.import_packages(reset=to_reset)
+    local_harvester.import_packages(reset=to_reset, nb_workers=args.nb_workers, refresh=args.refresh)
     local_harvester.export_package_names('data/resources/cran_package_names.txt')
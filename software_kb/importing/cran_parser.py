@@ -0,0 +1,247 @@
+'''
+    Extraction of the CRAN package pages (package metadata page and citation page)
+
+    The pages are parsed with lxml and precompiled XPath expressions, which is much faster than
+    building a BeautifulSoup tree for each of the ~17k CRAN packages. The parsing only depends on the
+    files of the local download cache, so it can run in a process pool:
+
+        with multiprocessing.Pool() as pool:
+            json_packages = parse_package_pages(tasks, pool=pool)
+
+    with tasks a list of (json_package, path to the cached package page, path to the cached citation page).
+
+    extract_package_record_soup() is the former BeautifulSoup extraction, kept as reference for testing
+    and benchmarking the lxml extractor.
+'''
+
+import lxml.html
+from lxml import etree
+from bs4 import BeautifulSoup
+from software_kb.importing.import_common import process_author_field, clean_field, process_url_field, process_maintainer_field, process_boolean_field, process_dependency_field, is_git_repo
+from software_kb.importing.local_cache import open_cached_file
+
+html_parser = lxml.html.HTMLParser(encoding="utf-8")
+
+xpath_body = etree.XPath("/html/body")
+xpath_first_h2 = etree.XPath("(.//h2)[1]")
+xpath_first_p = etree.XPath("(.//p)[1]")
+xpath_summary_tables = etree.XPath(".//table[@summary]")
+xpath_rows = etree.XPath(".//tr")
+xpath_cells = etree.XPath(".//td")
+xpath_first_link = etree.XPath("(.//a)[1]")
+xpath_blockquotes = etree.XPath(".//blockquote")
+xpath_pres = etree.XPath(".//pre")
+
+def _parse_html(content_html):
+    if isinstance(content_html, bytes):
+        # the CRAN html pages can be a mixture of UTF-8 and windows-1252 encoding
+        content_html = content_html.decode('utf-8','ignore')
+    return lxml.html.document_fromstring(content_html.encode('utf-8'), parser=html_parser)
+
+def _table_cells(table):
+    '''
+    list of the 2-cells rows of an attribute/value table
+    '''
+    rows = []
+    for row in xpath_rows(table):
+        cells = xpath_cells(row)
+        if len(cells) == 2:
+            rows.append(cells)
+    return rows
+
+def extract_package_record(content_html):
+    '''
+    Extract the raw information of a CRAN package page: title, description, the attribute/value
+    pairs of the package metadata table and the link to the reference manual.
+    Return None if the package has been removed from CRAN.
+    '''
+    root = _parse_html(content_html)
+    bodies = xpath_body(root)
+    if len(bodies) == 0:
+        return None
+    body = bodies[0]
+
+    # note that some package can be removed from CRAN, but still have a page explaining the removal
+    # project is archived and metadata removed
+    h2 = xpath_first_h2(body)
+    if len(h2) == 0:
+        return None
+
+    record = {}
+    record["title"] = h2[0].text_content()
+    p = xpath_first_p(body)
+    record["description"] = p[0].text_content() if len(p) > 0 else ""
+    record["fields"] = []
+    record["manual"] = None
+
+    # the rest is via 2-column tables encoding basically attribute/value, first one is the package
+    # metadata summary, second one is the download summary
+    tables = xpath_summary_tables(body)
+    if len(tables) > 0:
+        for cells in _table_cells(tables[0]):
+            record["fields"].append((cells[0].text_content(), cells[1].text_content()))
+    if len(tables) > 1:
+        for cells in _table_cells(tables[1]):
+            # the field name is written with a non-breaking space in the CRAN pages
+            if cells[0].text_content().replace('\xa0', ' ').strip() == 'Reference manual:':
+                links = xpath_first_link(cells[1])
+                if len(links) > 0:
+                    record["manual"] = links[0].get("href")
+    return record
+
+def extract_package_record_soup(content_html):
+    '''
+    Same as extract_package_record() with BeautifulSoup
+    '''
+    if isinstance(content_html, bytes):
+        content_html = content_html.decode('utf-8','ignore')
+    soup = BeautifulSoup(content_html, "lxml")
+    if soup.body == None or soup.body.find("h2") == None:
+        return None
+
+    record = {}
+    record["title"] = soup.body.h2.text
+    record["description"] = soup.body.p.text if soup.body.p != None else ""
+    record["fields"] = []
+    record["manual"] = None
+
+    tables = [ table for table in soup.find_all("table") if table.has_attr('summary') ]
+    for rank, table in enumerate(tables[:2]):
+        tbody = table.find("tbody")
+        if tbody == None:
+            rows = table.find_all("tr")
+        else:
+            rows = tbody.find_all("tr")
+        for row in rows:
+            cells = row.find_all("td")
+            if len(cells) != 2:
+                continue
+            if rank == 0:
+                record["fields"].append((cells[0].get_text(), cells[1].get_text()))
+            elif cells[0].get_text().replace('\xa0', ' ').strip() == 'Reference manual:' and cells[1].find("a") != None:
+                record["manual"] = cells[1].find("a")['href']
+    return record
+
+def convert_package_record(record, json_package):
+    '''
+    Update the json package from the raw information of its CRAN package page
+    '''
+    if record is None:
+        print("the package has been removed from CRAN:", json_package.get('Package'))
+        return None
+
+    json_package['Title'] = clean_field(record["title"])
+
+    # package name is prefixed in the title, we can strip it
+    if 'Package' in json_package:
+        if json_package['Title'].startswith(json_package['Package']):
+            json_package['Title'] = json_package['Title'][len(json_package['Package'])+1:].strip()
+
+    json_package['Description'] = clean_field(record["description"])
+
+    for field, value in record["fields"]:
+        if field == "Version:":
+            json_package["Version"] = clean_field(value)
+        elif field == "Maintainer:":
+            json_package["Maintainer"] = process_maintainer_field(clean_field(value))
+        elif field == "Author:":
+            json_package["Authors"] = process_author_field(clean_field(value))
+        elif field == "License:":
+            json_package["License"] = clean_field(value)
+        elif field == "Published:":
+            json_package["latest_published"] = clean_field(value)
+        elif field == "BugReports:":
+            urls = process_url_field(value)
+            if len(urls) > 0:
+                json_package["BugReports"] = urls[0]
+        elif field == "NeedsCompilation:":
+            json_package["NeedsCompilation"] = process_boolean_field(value)
+        elif field == "URL:":
+            json_package["URL"] = process_url_field(value)
+        elif field == "Depends:":
+            if "_hard_deps" in json_package:
+                json_package["_hard_deps"] = json_package["_hard_deps"] + process_dependency_field(value, "Depends")
+            else:
+                json_package["_hard_deps"] = process_dependency_field(value, "Depends")
+        elif field == "Imports:":
+            if "_hard_deps" in json_package:
+                json_package["_hard_deps"] = json_package["_hard_deps"] + process_dependency_field(value, "Imports")
+            else:
+                json_package["_hard_deps"] = process_dependency_field(value, "Imports")
+        elif field == "Suggests:":
+            json_package["_soft_deps"] = process_dependency_field(value, "Suggest")
+
+    link_manual = record["manual"]
+    if link_manual != None:
+        if not link_manual.startswith("http"):
+            # this is a relative address, so we expand it
+            link_manual = "https://cran.r-project.org/web/packages/" + json_package['Package'] + "/" + link_manual
+        json_package["Manual"] = link_manual
+
+    return json_package
+
+def extract_references(content_html):
+    '''
+    Raw and bibtex references of a CRAN citation page
+    '''
+    if content_html == None:
+        return None
+
+    root = _parse_html(content_html)
+    references = []
+
+    # raw reference are under <blockquote>, one <blockquote> per reference
+    for blockquote in xpath_blockquotes(root):
+        references.append({ 'raw': clean_field(blockquote.text_content()) })
+
+    # each bibtex reference are under one <pre> block, then usual bibtex format
+    for pre in xpath_pres(root):
+        references.append({ 'bibtex': pre.text_content().strip() })
+
+    return references
+
+def _read_cached_file(path):
+    with open_cached_file(path, "rb") as file:
+        return file.read()
+
+def parse_package_files(task):
+    '''
+    Convert a CRAN package from its cached pages, task is (json_package, path to the package page,
+    path to the citation page or None). Return the json package, None if not available.
+    '''
+    json_package, page_path, citation_path = task
+    if page_path is None:
+        return None
+
+    json_package = convert_package_record(extract_package_record(_read_cached_file(page_path)), json_package)
+    if json_package is None:
+        return None
+
+    # try to get bibliographical reference information
+    if citation_path is not None:
+        references = extract_references(_read_cached_file(citation_path))
+        if references is not None and len(references)>0:
+            json_package["References"] = references
+
+    # detect repo in the field URL
+    if 'URL' in json_package:
+        # in case we have one git repo in the list of URL, we can separate it from the other url
+        # manual/doc URL are already separated in CRAN
+        for url in json_package['URL']:
+            if is_git_repo(url):
+                json_package['URL'].remove(url)
+                if url.startswith("http://"):
+                    url = url.replace("http://", "https://")
+                json_package['git_repository'] = url
+                break
+
+    return json_package
+
+def parse_package_pages(tasks, pool=None, chunksize=8):
+    '''
+    Convert a list of CRAN packages from their cached pages, with a multiprocessing pool if given,
+    the results are in the same order as the tasks
+    '''
+    if pool is None:
+        return [ parse_package_files(task) for task in tasks ]
+    return pool.map(parse_package_files, tasks, chunksize=chunksize)
@@ -0,0 +1,671 @@
+'''
+    Parallel reader for the bz2 compressed Wikidata JSON dump
+
+    A bz2 file is a sequence of independently compressed blocks (900k of uncompressed data
+    with the usual -9 level). Blocks are not byte-aligned, but each block starts with a 48-bit
+    magic number which can be located at bit level. Every block is then re-wrapped as a
+    standalone single-block bz2 stream, so that decompression, JSON parsing and entity
+    simplification can be fanned out to a pool of processes. Results are returned in dump
+    order to a single consumer (the importer writing in ArangoDB).
+
+    Alternatively, the dump can be provided as a directory of pre-split bz2 chunks (for
+    example produced by bzip2recover, one file per block), processed in file name order.
+
+    Lines crossing block boundaries are stitched and processed by the consumer process.
+
+    When a DumpSpillIndex is given, the identifiers of the entities which are not selected are
+    recorded on disk together with the block where they start. Entities which become relevant
+    only at the end of the pass (e.g. persons or licenses related to software entities) can then
+    be read back by decompressing only the blocks containing them, instead of a new full pass.
+
+    Reading can start at a given block, with the partial line carried over from the previous
+    block, so that an interrupted import can be resumed from a DumpCheckpoint.
+
+    Usage:
+
+        entity_filter = DumpEntityFilter(wanted=[software_list])
+        for entity in read_dump_entities("latest-all.json.bz2", entity_filter, nb_workers=8):
+            ...
+'''
+
+import os
+import sys
+import bz2
+import re
+import json
+import base64
+import time
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from software_kb.common.arango_common import simplify_entity
+
+# 0x314159265359 (BCD of pi) starts a compressed block
+block_magic = 0x314159265359
+# 0x177245385090 (BCD of sqrt(pi)) starts the end-of-stream marker
+eos_magic = 0x177245385090
+
+# size of the buffer used when scanning the compressed file for block boundaries
+scan_buffer_size = 8 * 1024 * 1024
+
+# entity identifier token in a raw dump line, e.g. {"type":"item","id":"Q31","labels":...
+regex_entity_id = re.compile(rb'"id"\s*:\s*"([A-Z][0-9]+)"')
+
+class DumpEntityFilter(object):
+    '''
+    Callable applied to every complete line of the dump in the worker processes. It parses the
+    JSON entity and returns it if relevant, None otherwise. This object is pickled once per worker,
+    so the entity sets to be matched are copied to each worker.
+    '''
+
+    def __init__(self, wanted=None, properties=False, simplify=True, prefilter=True):
+        # list of entity sets, an entity is relevant if its identifier is in one of them,
+        # None means that every entity is relevant
+        self.wanted = wanted
+        # if True, all the properties are also relevant
+        self.properties = properties
+        # if True, the entity is simplified (English only, simplified statements)
+        self.simplify = simplify
+        # if True, the entity identifier is first read from the raw line and the JSON is 
+        # only parsed for relevant entities
+        self.prefilter = prefilter
+
+    def is_wanted(self, entity_id):
+        if self.wanted is None:
+            return True
+        if self.properties and entity_id.startswith("P"):
+            return True
+        for entity_set in self.wanted:
+            if entity_id in entity_set:
+                return True
+        return False
+
+    def __call__(self, line):
+        line = line.strip().rstrip(b',')
+        if len(line) == 0 or line == b'[' or line == b']':
+            # this is the start or the end of the dump
+            return None
+
+        if self.prefilter and self.wanted is not None:
+            entity_id = raw_entity_id(line)
+            if entity_id is not None and not self.is_wanted(entity_id):
+                return None
+
+        entityJson = None
+        try:
+            entityJson = json.loads(line)
+        except Exception as e:
+            print("Failed to parse json line", str(e))
+            return None
+
+        if entityJson is None or not "id" in entityJson or not self.is_wanted(entityJson["id"]):
+            return None
+
+        if self.simplify:
+            entityJson = simplify_entity(entityJson)
+        return entityJson
+
+def raw_entity_id(line):
+    '''
+    Return the identifier of the entity of a raw dump line without parsing the JSON, or None if
+    it cannot be safely identified. The top-level "id" comes before the first nested object 
+    (labels, claims, ...), while the nested "id" (statements, entity values) come after, so 
+    only the prefix of the line before the second "{" is considered.
+    '''
+    end = line.find(b'{', 1)
+    if end == -1:
+        end = len(line)
+    match = regex_entity_id.search(line, 0, end)
+    if match is None:
+        return None
+    return match.group(1).decode("ascii")
+
+def find_block_offsets(path):
+    '''
+    Scan a bz2 file and return the sorted list of bit offsets of the block and end-of-stream
+    markers, as a list of pairs (bit offset, is_block)
+    '''
+    # for each of the 8 possible bit alignments, the magic numbers give at least 5 fully
+    # determined bytes which can be searched with a simple bytes find
+    patterns = []
+    for magic, is_block in [(block_magic, True), (eos_magic, False)]:
+        for shift in range(8):
+            window = (magic << (16 - shift)).to_bytes(8, "big")
+            if shift == 0:
+                patterns.append((window[0:6], 0, shift, magic, is_block))
+            else:
+                patterns.append((window[1:6], 1, shift, magic, is_block))
+
+    offsets = {}
+    file_size = os.path.getsize(path)
+    with open(path, "rb") as dump_file:
+        position = 0
+        while position < file_size:
+            dump_file.seek(position)
+            # overlap the next buffer to catch markers over the buffer boundary
+            buffer = dump_file.read(scan_buffer_size + 8)
+            if len(buffer) == 0:
+                break
+            for pattern, pattern_start, shift, magic, is_block in patterns:
+                ind = buffer.find(pattern)
+                while ind != -1:
+                    window_start = ind - pattern_start
+                    # markers over the end of the buffer are found when scanning the next buffer
+                    if window_start >= 0 and window_start + 8 <= len(buffer):
+                        window = buffer[window_start:window_start + 8]
+                        candidate = (int.from_bytes(window, "big") >> (16 - shift)) & 0xFFFFFFFFFFFF
+                        if candidate == magic:
+                            bit_offset = (position + window_start) * 8 + shift
+                            # the 4 bytes stream header is never a marker
+                            if bit_offset >= 32:
+                                offsets[bit_offset] = is_block
+                    ind = buffer.find(pattern, ind + 1)
+            position += scan_buffer_size
+    return sorted(offsets.items())
+
+def list_block_segments(path):
+    '''
+    Return the list of compressed blocks of a bz2 file as (start bit, end bit, level) triples,
+    where the block covers the bits [start, end[ from its magic number included
+    '''
+    with open(path, "rb") as dump_file:
+        header = dump_file.read(4)
+    if len(header) < 4 or not header.startswith(b'BZh'):
+        raise Exception("Not a bz2 file: " + path)
+    level = header[3:4]
+
+    segments = []
+    offsets = find_block_offsets(path)
+    with open(path, "rb") as dump_file:
+        # 48 bits are not enough to exclude false end-of-stream markers in the compressed data, which would end 
+        # a block too early and make the merge of the following segments fail
+        offsets = [ (bit_offset, is_block) for i, (bit_offset, is_block) in enumerate(offsets) 
+                    if is_block or i+1 == len(offsets) or _is_stream_end(dump_file, bit_offset) ]
+    for i, (bit_offset, is_block) in enumerate(offsets):
+        if not is_block:
+            continue
+        if i+1 < len(offsets):
+            end_offset = offsets[i+1][0]
+        else:
+            end_offset = os.path.getsize(path) * 8
+        segments.append((bit_offset, end_offset, level))
+    return segments
+
+def _is_stream_end(dump_file, bit_offset):
+    '''
+    True if the end-of-stream marker at this bit offset is followed by a new stream (pbzip2-like 
+    multistream file): 48 bits magic and 32 bits combined CRC, padding to a byte boundary, then the
+    "BZh" header
+    '''
+    dump_file.seek((bit_offset + 48 + 32 + 7) // 8)
+    header = dump_file.read(4)
+    return len(header) == 4 and header.startswith(b'BZh') and header[3:4].isdigit()
+
+def read_block_stream(path, start_bit, end_bit, level):
+    '''
+    Extract a compressed block from the file and wrap it as a standalone single-block bz2 stream
+    '''
+    start_byte = start_bit // 8
+    end_byte = (end_bit + 7) // 8
+    with open(path, "rb") as dump_file:
+        dump_file.seek(start_byte)
+        raw = dump_file.read(end_byte - start_byte)
+
+    nb_bits = end_bit - start_bit
+    value = int.from_bytes(raw, "big")
+    # drop the bits after the end of the block, then the bits before its start
+    value >>= (end_byte * 8 - end_bit)
+    value &= (1 << nb_bits) - 1
+
+    # the block CRC follows the block magic number, for a single-block stream the combined
+    # stream CRC is equal to the block CRC
+    block_crc = (value >> (nb_bits - 80)) & 0xFFFFFFFF
+    value = (value << 80) | (eos_magic << 32) | block_crc
+    nb_bits += 80
+    padding = (-nb_bits) % 8
+    value <<= padding
+    return b'BZh' + level + value.to_bytes((nb_bits + padding) // 8, "big")
+
+def _line_item_number(line):
+    '''
+    Return the numeric identifier of the item of a raw dump line (42 for Q42), None for other 
+    lines (properties, lexemes, start and end of the dump)
+    '''
+    entity_id = raw_entity_id(line)
+    if entity_id is None:
+        line = line.strip().rstrip(b',')
+        if len(line) == 0 or line == b'[' or line == b']':
+            return None
+        try:
+            entity_id = json.loads(line).get("id")
+        except Exception:
+            return None
+    if entity_id is None or not entity_id.startswith("Q"):
+        return None
+    return int(entity_id[1:])
+
+def _process_data(data, line_processor, spill=False):
+    '''
+    Split decompressed data into lines, the first and last pieces might be partial lines and
+    are returned as they are to be stitched with the neighbouring blocks. If spill is True, the
+    numeric identifiers of the items not selected by the line processor are also returned.
+    '''
+    lines = data.split(b'\n')
+    head = lines[0]
+    tail = lines[-1] if len(lines) > 1 else None
+    results = []
+    spilled = array('I')
+    for line in lines[1:-1]:
+        result = line_processor(line)
+        if result is not None:
+            results.append(result)
+        elif spill:
+            item_number = _line_item_number(line)
+            if item_number is not None:
+                spilled.append(item_number)
+    return head, results, tail, len(lines) - 1, spilled
+
+def _process_segment(segment):
+    path, start_bit, end_bit, level = segment
+    try:
+        data = bz2.decompress(read_block_stream(path, start_bit, end_bit, level))
+    except (OSError, ValueError):
+        # most likely a false block marker inside compressed data, the consumer will merge
+        # this segment with the next one
+        return None
+    return _process_data(data, _worker_line_processor, _worker_spill)
+
+def _process_chunk_file(chunk_path):
+    with open(chunk_path, "rb") as chunk_file:
+        data = bz2.decompress(chunk_file.read())
+    return _process_data(data, _worker_line_processor, _worker_spill)
+
+_worker_line_processor = None
+_worker_spill = False
+
+def _init_worker(line_processor, spill=False):
+    global _worker_line_processor, _worker_spill
+    _worker_line_processor = line_processor
+    _worker_spill = spill
+
+def _list_chunk_files(path):
+    return [ os.path.join(path, chunk_file) for chunk_file in sorted(os.listdir(path)) if chunk_file.endswith(".bz2") ]
+
+def _list_tasks(path):
+    if os.path.isdir(path):
+        return _list_chunk_files(path)
+    else:
+        return [ (path, start_bit, end_bit, level) for start_bit, end_bit, level in list_block_segments(path) ]
+
+def read_dump_entities(path, line_processor, nb_workers=None, verbose=True, spill_index=None, 
+                       start_block=0, carry=b'', on_block=None, spill_length=None):
+    '''
+    Iterate in dump order over the non-None results of line_processor applied to every line of
+    a bz2 compressed dump file, or of a directory of pre-split bz2 chunks. line_processor must
+    be picklable (e.g. a DumpEntityFilter). If a DumpSpillIndex is given, the items not selected
+    by line_processor are recorded in this index.
+
+    Reading starts at the block start_block, carry being the partial line ending the previous 
+    block. If on_block is given, it is called as on_block(tasks, next_block, carry) once all the 
+    results of a block have been consumed, so it's a consistent point to resume from. When resuming
+    with a spill index, spill_length is the size of the spill index at this point (see 
+    DumpSpillIndex.sync()), what was written after it is discarded.
+    '''
+    if nb_workers is None:
+        nb_workers = os.cpu_count() or 1
+
+    tasks = _list_tasks(path)
+    if os.path.isdir(path):
+        task_function = _process_chunk_file
+    else:
+        task_function = _process_segment
+
+    spill = spill_index is not None
+    if spill:
+        spill_index.open(tasks, append=(start_block > 0), length=spill_length)
+
+    # partial line carried over from the previous block, and index of the block where it starts
+    carry_index = max(start_block - 1, 0)
+    nb_lines = 0
+    with ProcessPoolExecutor(max_workers=nb_workers, initializer=_init_worker, initargs=(line_processor, spill)) as executor:
+        # bounded number of blocks in flight, so that a slow consumer does not accumulate results in memory
+        pending = deque()
+        task_index = start_block
+        while task_index < len(tasks) or len(pending) > 0:
+            while task_index < len(tasks) and len(pending) < nb_workers * 2:
+                pending.append((task_index, executor.submit(task_function, tasks[task_index])))
+                task_index += 1
+
+            current_index, future = pending.popleft()
+            result = future.result()
+            last_index = current_index
+
+            if result is None:
+                # the segment could not be decompressed alone: false marker detected while scanning,
+                # we merge consecutive segments until the decompression succeeds (this is very rare)
+                merged_path, start_bit, end_bit, level = tasks[current_index]
+                while result is None:
+                    if len(pending) == 0:
+                        raise Exception("Invalid bz2 block at bit offset " + str(start_bit) + " in " + merged_path)
+                    next_index, next_future = pending.popleft()
+                    last_index = next_index
+                    end_bit = tasks[next_index][2]
+                    # the same worker function, but run in the consumer process
+                    _init_worker(line_processor, spill)
+                    result = _process_segment((merged_path, start_bit, end_bit, level))
+                    while task_index < len(tasks) and len(pending) < nb_workers * 2:
+                        pending.append((task_index, executor.submit(task_function, tasks[task_index])))
+                        task_index += 1
+
+            head, results, tail, nb_block_lines, spilled = result
+
+            if tail is None:
+                # no end of line in this block
+                carry += head
+                continue
+
+            stitched = line_processor(carry + head)
+            if stitched is not None:
+                yield stitched
+            elif spill:
+                item_number = _line_item_number(carry + head)
+                if item_number is not None:
+                    spill_index.add(carry_index, [item_number])
+            if spill and len(spilled) > 0:
+                spill_index.add(current_index, spilled)
+            for entity in results:
+                yield entity
+            carry = tail
+            carry_index = current_index
+
+            if on_block is not None:
+                on_block(tasks, last_index + 1, carry)
+
+            if verbose:
+                previous = nb_lines
+                nb_lines += nb_block_lines
+                if nb_lines // 1000000 != previous // 1000000:
+                    sys.stdout.write(str((nb_lines // 1000000) * 1000000))
+                    sys.stdout.flush()
+                elif nb_lines // 100000 != previous // 100000:
+                    sys.stdout.write('.')
+                    sys.stdout.flush()
+
+    if len(carry) > 0:
+        last = line_processor(carry)
+        if last is not None:
+            yield last
+        elif spill:
+            item_number = _line_item_number(carry)
+            if item_number is not None:
+                spill_index.add(carry_index, [item_number])
+
+    if spill:
+        spill_index.close()
+
+class DumpSpillIndex(object):
+    '''
+    On-disk index of the items of a dump which have not been selected during a pass, keyed by
+    item identifier and giving the index of the compressed block where the item line starts. 
+    Only numeric identifiers are stored (4 bytes per item, so around 400MB for the full 
+    Wikidata dump), the entities themselves are read back from the dump.
+
+    Files in the index directory:
+    - tasks.json: the list of blocks (bit segments) or chunk files of the dump
+    - blocks.bin: a sequence of records (block index, number of items, item numbers...) as 
+    unsigned 32-bit integers
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.tasks_path = os.path.join(path, "tasks.json")
+        self.blocks_path = os.path.join(path, "blocks.bin")
+        self.blocks_file = None
+
+    def open(self, tasks, append=False, length=None):
+        '''
+        Start a new index for the given list of dump blocks, replacing a previous one, or continue
+        the existing index when resuming an interrupted pass. With length, the existing index is
+        first cut back to this size, the records written after the last checkpoint (possibly a 
+        partial one) are then removed.
+        '''
+        os.makedirs(self.path, exist_ok=True)
+        with open(self.tasks_path, "wt") as tasks_file:
+            json.dump([ _task_to_json(task) for task in tasks ], tasks_file)
+        if append and length is not None and os.path.isfile(self.blocks_path):
+            os.truncate(self.blocks_path, length)
+        self.blocks_file = open(self.blocks_path, "ab" if append else "wb")
+
+    def sync(self):
+        '''
+        Write the index on disk and return its size in bytes, to be saved with a checkpoint
+        '''
+        if self.blocks_file is None:
+            return None
+        self.blocks_file.flush()
+        os.fsync(self.blocks_file.fileno())
+        return self.blocks_file.tell()
+
+    def add(self, block_index, item_numbers):
+        array('I', [block_index, len(item_numbers)]).tofile(self.blocks_file)
+        if not isinstance(item_numbers, array):
+            item_numbers = array('I', item_numbers)
+        item_numbers.tofile(self.blocks_file)
+
+    def close(self):
+        if self.blocks_file is not None:
+            self.blocks_file.close()
+            self.blocks_file = None
+
+    def load_tasks(self):
+        with open(self.tasks_path, "rt") as tasks_file:
+            return [ _task_from_json(task) for task in json.load(tasks_file) ]
+
+    def locate(self, entity_ids):
+        '''
+        Return the sorted list of block indexes where the lines of the given items start
+        '''
+        wanted = set()
+        for entity_id in entity_ids:
+            if entity_id.startswith("Q") and entity_id[1:].isdigit():
+                wanted.add(int(entity_id[1:]))
+
+        blocks = set()
+        if len(wanted) == 0:
+            return []
+        with open(self.blocks_path, "rb") as blocks_file:
+            while True:
+                header = array('I')
+                try:
+                    header.fromfile(blocks_file, 2)
+                except EOFError:
+                    break
+                block_index, nb_items = header
+                item_numbers = array('I')
+                try:
+                    item_numbers.fromfile(blocks_file, nb_items)
+                except EOFError:
+                    # partial last record of an interrupted pass
+                    break
+                if block_index not in blocks and not wanted.isdisjoint(item_numbers):
+                    blocks.add(block_index)
+        return sorted(blocks)
+
+def _task_to_json(task):
+    if isinstance(task, str):
+        return task
+    path, start_bit, end_bit, level = task
+    return [path, start_bit, end_bit, level.decode("ascii")]
+
+def _task_from_json(task):
+    if isinstance(task, str):
+        return task
+    path, start_bit, end_bit, level = task
+    return (path, start_bit, end_bit, level.encode("ascii"))
+
+def _decompress_task(tasks, index):
+    '''
+    Decompress the block of the given index, return the data and the index of the next block
+    '''
+    task = tasks[index]
+    if isinstance(task, str):
+        with open(task, "rb") as chunk_file:
+            return bz2.decompress(chunk_file.read()), index + 1
+
+    path, start_bit, end_bit, level = task
+    next_index = index + 1
+    while True:
+        try:
+            return bz2.decompress(read_block_stream(path, start_bit, end_bit, level)), next_index
+        except (OSError, ValueError):
+            # false block marker, as when reading the whole dump the segment is merged with the next one
+            if next_index >= len(tasks):
+                raise Exception("Invalid bz2 block at bit offset " + str(start_bit) + " in " + path)
+            end_bit = tasks[next_index][2]
+            next_index += 1
+
+_worker_tasks = None
+
+def _init_resolve_worker(line_processor, tasks_path):
+    global _worker_tasks
+    _init_worker(line_processor)
+    with open(tasks_path, "rt") as tasks_file:
+        _worker_tasks = [ _task_from_json(task) for task in json.load(tasks_file) ]
+
+def _resolve_block(block_index):
+    '''
+    Apply the line processor to the lines starting in the given block, the last line is 
+    completed with the following blocks
+    '''
+    data, next_index = _decompress_task(_worker_tasks, block_index)
+    position = data.find(b'\n')
+    if position == -1:
+        return []
+    data = data[position+1:]
+    while next_index < len(_worker_tasks):
+        next_data, next_index = _decompress_task(_worker_tasks, next_index)
+        position = next_data.find(b'\n')
+        if position == -1:
+            data += next_data
+        else:
+            data += next_data[:position]
+            break
+
+    results = []
+    for line in data.split(b'\n'):
+        result = _worker_line_processor(line)
+        if result is not None:
+            results.append(result)
+    return results
+
+def read_spilled_entities(spill_index, line_processor, entity_ids, nb_workers=None):
+    '''
+    Iterate over the non-None results of line_processor applied to the lines of the given items,
+    as recorded in the spill index of a previous pass. Only the blocks containing these items
+    are decompressed. 
+    '''
+    if nb_workers is None:
+        nb_workers = os.cpu_count() or 1
+
+    blocks = spill_index.locate(entity_ids)
+    if len(blocks) == 0:
+        return
+    print("reading", len(blocks), "blocks from", spill_index.path)
+
+    with ProcessPoolExecutor(max_workers=nb_workers, initializer=_init_resolve_worker, initargs=(line_processor, spill_index.tasks_path)) as executor:
+        for results in executor.map(_resolve_block, blocks, chunksize=4):
+            for entity in results:
+                yield entity
+
+class DumpCheckpoint(object):
+    '''
+    Periodic checkpoint of a pass over a dump, to resume an interrupted import. A checkpoint 
+    records the next block to be read (index and compressed bit offset), the partial line 
+    carried over from the previous block and a set of named entity sets (e.g. the related entity
+    lists built during the pass). Checkpoints are written atomically under the given directory,
+    one per task name, e.g. data/wikidata/checkpoint/import_all.json.
+    '''
+
+    def __init__(self, path, task_name, dump_path, interval=500):
+        self.path = path
+        self.task_name = task_name
+        self.dump_path = dump_path
+        # number of blocks between two checkpoints (500 blocks is around 450MB of uncompressed data)
+        self.interval = interval
+        self.state_path = os.path.join(path, task_name + ".json")
+        self.last_block = None
+        # size of the spill index at the last checkpoint, if any
+        self.spill_length = None
+
+    def save(self, tasks, next_block, carry, entity_sets=None, spill_length=None):
+        os.makedirs(self.path, exist_ok=True)
+        state = {
+            "task": self.task_name,
+            "dump": os.path.abspath(self.dump_path),
+            "nb_blocks": len(tasks),
+            "block": next_block,
+            "carry": base64.b64encode(carry).decode("ascii"),
+            "entity_sets": [],
+            "time": time.time()
+        }
+        if spill_length is not None:
+            state["spill_length"] = spill_length
+        if next_block < len(tasks) and not isinstance(tasks[next_block], str):
+            state["bit_offset"] = tasks[next_block][1]
+
+        if entity_sets is not None:
+            for name, entity_set in entity_sets.items():
+                entity_set_file = os.path.join(self.path, self.task_name + "." + name + ".entities")
+                entity_set.save(entity_set_file + ".tmp")
+                os.replace(entity_set_file + ".tmp", entity_set_file)
+                state["entity_sets"].append(name)
+
+        with open(self.state_path + ".tmp", "wt") as state_file:
+            json.dump(state, state_file)
+        os.replace(self.state_path + ".tmp", self.state_path)
+        self.last_block = next_block
+        self.spill_length = spill_length
+
+    def should_save(self, next_block):
+        if self.last_block is None:
+            self.last_block = next_block
+            return False
+        return next_block - self.last_block >= self.interval
+
+    def load(self, entity_sets=None):
+        '''
+        Return the next block index and the carried partial line of the last checkpoint, the
+        entity sets are restored in place and the size of the spill index is set in spill_length.
+        Without a valid checkpoint for this dump, (0, b'') is returned to start from the beginning.
+        '''
+        if not os.path.isfile(self.state_path):
+            print("No checkpoint found for", self.task_name, "starting from the beginning of the dump")
+            return 0, b''
+        with open(self.state_path, "rt") as state_file:
+            state = json.load(state_file)
+        if state["dump"] != os.path.abspath(self.dump_path):
+            print("Checkpoint for", self.task_name, "relates to another dump:", state["dump"], "starting from the beginning of the dump")
+            return 0, b''
+
+        if entity_sets is not None:
+            for name in state["entity_sets"]:
+                if name in entity_sets:
+                    entity_set_file = os.path.join(self.path, self.task_name + "." + name + ".entities")
+                    entity_sets[name].load(entity_set_file)
+
+        print("resuming", self.task_name, "at block", state["block"], "/", state["nb_blocks"])
+        self.last_block = state["block"]
+        self.spill_length = state.get("spill_length")
+        return state["block"], base64.b64decode(state["carry"])
+
+    def clear(self):
+        '''
+        Remove the checkpoint when the pass is complete
+        '''
+        if not os.path.isdir(self.path):
+            return
+        if os.path.isfile(self.state_path):
+            os.remove(self.state_path)
+        for name in os.listdir(self.path):
+            if name.startswith(self.task_name + ".") and name.endswith(".entities"):
+                os.remove(os.path.join(self.path, name))
@@ -0,0 +1,228 @@
+'''
+    Batched access to GitHub repository metadata via the GraphQL API
+
+    Many repositories are requested in a single GraphQL query, one aliased repository() field per
+    repository (up to 100 per query), instead of one REST call per repository. The rate limit
+    information is requested with every query: when the remaining points are low, the fetcher waits
+    until the rate limit window is reset. Network errors, 5xx responses and secondary rate limits
+    (403/429 with Retry-After) are retried with exponential backoff.
+
+    The HTTP transport is a simple callable transport(url, payload, timeout) returning the parsed
+    JSON response, which can be replaced for instance to use a local stub server in tests.
+
+    Usage:
+
+        fetcher = GitHubRepositoryFetcher(token="...")
+        repositories = fetcher.fetch([("softcite", "softcite_kb"), ("ropensci", "auk")])
+'''
+
+import re
+import time
+import random
+import logging
+import calendar
+import requests
+from requests.adapters import HTTPAdapter
+
+default_api_url = "https://api.github.com/graphql"
+
+# maximum number of repositories per GraphQL query
+max_batch_size = 100
+
+repository_fields = '''fragment RepositoryFields on Repository {
+  nameWithOwner
+  url
+  description
+  homepageUrl
+  createdAt
+  updatedAt
+  pushedAt
+  isArchived
+  isFork
+  stargazerCount
+  forkCount
+  owner { login }
+  primaryLanguage { name }
+  licenseInfo { spdxId name }
+  repositoryTopics(first: 20) { nodes { topic { name } } }
+}'''
+
+github_url_pattern = re.compile(r'^(?:https?://)?(?:www\.)?github\.com/([A-Za-z0-9_.\-]+)/([A-Za-z0-9_.\-]+)', re.IGNORECASE)
+
+def parse_github_repository(url):
+    '''
+    Return (owner, name) of a GitHub repository URL, None if the URL is not a GitHub repository
+    '''
+    if url is None:
+        return None
+    match = github_url_pattern.match(url.strip())
+    if match is None:
+        return None
+    owner, name = match.group(1), match.group(2)
+    if name.endswith(".git"):
+        name = name[:-4]
+    if len(name) == 0:
+        return None
+    return owner, name
+
+def repository_key(owner, name):
+    '''
+    key of a repository in the repos collection, GitHub names are case insensitive
+    '''
+    return (owner + ":" + name).lower()
+
+class GitHubTransportError(Exception):
+    '''
+    Failed request, with the HTTP status when available (None for network errors). rate_limited
+    is True when the response says to wait (Retry-After or no remaining rate limit points).
+    '''
+    def __init__(self, message, status=None, retry_after=None, rate_limited=False):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+        self.rate_limited = rate_limited
+
+    def is_retryable(self):
+        # a 403 is also returned for a bad token or a forbidden resource, it is retried only when rate limited
+        if self.status == 403:
+            return self.rate_limited
+        return self.status is None or self.status == 429 or self.status >= 500
+
+class SessionTransport(object):
+    '''
+    Default transport, a requests session keeping the connection alive between the queries
+    '''
+    def __init__(self, token=None, user_agent="softcite-kb (https://github.com/softcite/softcite_kb)"):
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=1)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({"User-Agent": user_agent})
+        if token is not None:
+            self.session.headers.update({"Authorization": "bearer " + token})
+
+    def __call__(self, url, payload, timeout):
+        try:
+            response = self.session.post(url, json=payload, timeout=timeout)
+        except requests.exceptions.RequestException as err:
+            raise GitHubTransportError(str(err))
+        if response.status_code != 200:
+            retry_after = response.headers.get("Retry-After")
+            rate_limited = retry_after is not None or response.headers.get("X-RateLimit-Remaining") == "0"
+            if retry_after is not None and retry_after.isdigit():
+                retry_after = int(retry_after)
+            elif response.headers.get("X-RateLimit-Remaining") == "0" and response.headers.get("X-RateLimit-Reset", "").isdigit():
+                retry_after = max(int(response.headers.get("X-RateLimit-Reset")) - int(time.time()), 1)
+            else:
+                retry_after = None
+            raise GitHubTransportError("HTTP error " + str(response.status_code) + " for " + url,
+                                       status=response.status_code, retry_after=retry_after, rate_limited=rate_limited)
+        return response.json()
+
+def _parse_reset_time(reset_at):
+    # e.g. 2021-02-01T10:00:00Z
+    return calendar.timegm(time.strptime(reset_at, "%Y-%m-%dT%H:%M:%SZ"))
+
+class GitHubRepositoryFetcher(object):
+
+    def __init__(self, api_url=default_api_url, token=None, batch_size=max_batch_size, max_retries=5, backoff=1.0,
+                 min_remaining=100, timeout=60, transport=None, sleep=time.sleep):
+        self.api_url = api_url
+        self.batch_size = min(batch_size, max_batch_size)
+        self.max_retries = max_retries
+        # base delay in seconds of the exponential backoff
+        self.backoff = backoff
+        # below this number of remaining rate limit points, we wait for the reset of the rate limit
+        self.min_remaining = min_remaining
+        self.timeout = timeout
+        if transport is None:
+            transport = SessionTransport(token=token)
+        self.transport = transport
+        self.sleep = sleep
+        # last known rate limit state
+        self.remaining = None
+        self.reset_time = None
+
+    def fetch(self, repositories):
+        '''
+        Return a dict repository key -> repository JSON for the given (owner, name) pairs, None for
+        the repositories not found. The repositories of a failed query (e.g. bad token, retries 
+        exhausted) are not in the dict.
+        '''
+        unique = {}
+        for owner, name in repositories:
+            key = repository_key(owner, name)
+            if not key in unique:
+                unique[key] = (owner, name)
+        keys = list(unique.keys())
+
+        results = {}
+        for batch_start in range(0, len(keys), self.batch_size):
+            batch = keys[batch_start:batch_start+self.batch_size]
+            batch_results = self._fetch_batch([ unique[key] for key in batch ])
+            if batch_results is None:
+                continue
+            for key, repository in zip(batch, batch_results):
+                results[key] = repository
+        return results
+
+    def _build_query(self, batch):
+        declarations = []
+        fields = []
+        variables = {}
+        for rank, (owner, name) in enumerate(batch):
+            declarations.append("$o" + str(rank) + ": String!, $n" + str(rank) + ": String!")
+            fields.append("r" + str(rank) + ": repository(owner: $o" + str(rank) + ", name: $n" + str(rank) + ") { ...RepositoryFields }")
+            variables["o" + str(rank)] = owner
+            variables["n" + str(rank)] = name
+        query = "query(" + ", ".join(declarations) + ") {\n" + "\n".join(fields) + "\nrateLimit { cost remaining resetAt }\n}\n" + repository_fields
+        return { "query": query, "variables": variables }
+
+    def _wait_for_rate_limit(self):
+        if self.remaining is None or self.reset_time is None or self.remaining >= self.min_remaining:
+            return
+        delay = self.reset_time - time.time()
+        if delay > 0:
+            logging.info("GitHub rate limit nearly exhausted, waiting " + str(int(delay)) + " seconds")
+            self.sleep(delay + 1)
+        self.remaining = None
+
+    def _fetch_batch(self, batch):
+        '''
+        Return the list of repository JSON for a batch of (owner, name), in the same order, None
+        if the query failed
+        '''
+        payload = self._build_query(batch)
+
+        result_json = None
+        attempt = 0
+        while result_json is None:
+            self._wait_for_rate_limit()
+            try:
+                result_json = self.transport(self.api_url, payload, self.timeout)
+                if result_json is None:
+                    raise GitHubTransportError("empty response for " + self.api_url)
+            except GitHubTransportError as err:
+                attempt += 1
+                if not err.is_retryable() or attempt > self.max_retries:
+                    logging.error("GitHub GraphQL request failed for " + str(len(batch)) + " repositories: " + str(err))
+                    return None
+                if err.retry_after is not None:
+                    delay = err.retry_after
+                else:
+                    delay = self.backoff * (2 ** (attempt-1)) * (0.5 + random.random() / 2)
+                self.sleep(delay)
+
+        data = result_json.get("data")
+        if data is None:
+            logging.error("GitHub GraphQL error: " + str(result_json.get("errors")))
+            return None
+
+        rate_limit = data.get("rateLimit")
+        if rate_limit is not None:
+            self.remaining = rate_limit.get("remaining")
+            if rate_limit.get("resetAt") is not None:
+                self.reset_time = _parse_reset_time(rate_limit["resetAt"])
+
+        # not found repositories are null, with a NOT_FOUND error
+        return [ data.get("r" + str(rank)) for rank in range(len(batch)) ]
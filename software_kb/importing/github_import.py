@@ -1,26 +1,43 @@
 '''
     Access, convert and load GitHub relevant public data
 
-    See REST API at https://docs.github.com/en/rest
+    GitHub public data come as an enrichment of a populated knowledge base: the GitHub repositories
+    (git_repository/P1324 claims) of the software entities of the staging area are collected, their
+    metadata are fetched by batches via the GitHub GraphQL API (see github_graphql.py) and written
+    in the repos collection, keyed by "owner:name" in lower case.
+
+    The GraphQL API does not support conditional requests (ETag), so a repository already imported is
+    only requested again when its record is older than the refresh period (refresh_days).
+
+    A GitHub token is required for the GraphQL API, see config.yaml.
 '''
 
-import requests
+import time
 import argparse
-import json
 from harvester import Harvester
 from arango import ArangoClient
-import re
-from collections import OrderedDict
+from software_kb.common.bulk_writer import BulkWriter, default_batch_size
+from software_kb.importing.github_graphql import GitHubRepositoryFetcher, parse_github_repository, repository_key, default_api_url, max_batch_size
+
+base_url = "https://api.github.com/"
 
-base_url = "hhttps://api.github.com/"
+# number of repositories fetched before being written
+fetch_chunk_size = 1000
 
-class rOpenSci_harvester(Harvester):
+class GitHub_harvester(Harvester):
 
     database_name = "GitHub"
 
-    def __init__(self, config_path="./config.yaml"):
+    def __init__(self, config_path="./config.yaml", github_fetcher=None):
         self.load_config(config_path)
 
+        github_config = {}
+        if "github" in self.config and self.config["github"] != None:
+            github_config = self.config["github"]
+        # without token, the GraphQL API answers 401 to every query
+        if github_fetcher is None and not github_config.get("github_token"):
+            raise Exception("A GitHub token is required for the GitHub GraphQL API, set github_token in the github section of " + config_path)
+
         # create database and collection
         if not self.sys_db.has_database(self.database_name):
             self.sys_db.create_database(self.database_name)
@@ -37,8 +54,105 @@ class rOpenSci_harvester(Harvester):
         else:
             self.repos = self.db.collection('repos')
 
-        if not self.db.has_collection('cache'):
-            self.cache = self.db.create_collection('cache')
-        else:
-            self.cache = self.db.collection('cache')
+        self.refresh_days = github_config.get("refresh_days", 30)
+        # note: self.fetcher is the file downloader of the Harvester
+        if github_fetcher is None:
+            github_fetcher = GitHubRepositoryFetcher(api_url=github_config.get("github_api_url", default_api_url),
+                                                     token=github_config.get("github_token"),
+                                                     batch_size=github_config.get("batch_size", max_batch_size))
+        self.github_fetcher = github_fetcher
+
+        # repositories are written by batches, replacing the previous record
+        self.bulk_writer = BulkWriter(batch_size=self.config['arangodb'].get('batch_size', default_batch_size), on_duplicate="replace")
+
+    def collect_repositories(self):
+        '''
+        Return the list of (owner, name) of the GitHub repositories of the software entities in the staging area
+        '''
+        staging_db = self.client.db("staging", username=self.config['arangodb']['arango_user'], password=self.config['arangodb']['arango_pwd'])
+        cursor = staging_db.aql.execute(
+            'FOR software IN software FILTER HAS(software.claims, "P1324") \
+                FOR claim IN software.claims.P1324 RETURN claim.value', batch_size=10000, stream=True, ttl=3600)
+        repositories = {}
+        for url in cursor:
+            if not isinstance(url, str):
+                continue
+            repository = parse_github_repository(url)
+            if repository is not None:
+                repositories[repository_key(*repository)] = repository
+        return list(repositories.values())
+
+    def import_repositories(self, reset=False, refresh_days=None):
+        '''
+        Fetch and store the metadata of the GitHub repositories of the staging area, the repositories
+        imported less than refresh_days ago are skipped
+        '''
+        if reset:
+            self.db.delete_collection('repos')
+            self.repos = self.db.create_collection('repos')
+
+        if refresh_days is None:
+            refresh_days = self.refresh_days
+
+        repositories = self.collect_repositories()
+        print("GitHub repositories in the staging area:", len(repositories))
+
+        # time of the last import of the stored repositories, retrieved with a single query
+        fetched = {}
+        cursor = self.db.aql.execute('FOR repo IN repos RETURN [repo._key, repo.fetched]', batch_size=10000, stream=True, ttl=3600)
+        for key, fetched_time in cursor:
+            fetched[key] = fetched_time
+
+        limit = time.time() - refresh_days * 24 * 3600
+        to_be_fetched = [ repository for repository in repositories
+                          if fetched.get(repository_key(*repository)) is None or fetched[repository_key(*repository)] < limit ]
+        print("repositories to be fetched:", len(to_be_fetched))
+
+        nb_not_found = 0
+        nb_failed = 0
+        for chunk_start in range(0, len(to_be_fetched), fetch_chunk_size):
+            chunk = to_be_fetched[chunk_start:chunk_start+fetch_chunk_size]
+            results = self.github_fetcher.fetch(chunk)
+            # the repositories of the failed queries are not in the results, they are not written and
+            # will be fetched again at the next import
+            nb_failed += len(chunk) - len(results)
+            now = time.time()
+            for key, repository in results.items():
+                if repository is None:
+                    nb_not_found += 1
+                    continue
+                self.bulk_writer.add(self.repos, convert_repository(key, repository, now))
+        self.bulk_writer.flush()
+        print("repositories written:", self.bulk_writer.created, "- not found:", nb_not_found, "- failed requests:", nb_failed)
+
+def convert_repository(key, repository, fetched_time):
+    '''
+    Flatten the GraphQL repository record
+    '''
+    repo_json = {}
+    repo_json["_key"] = key
+    for field in ["nameWithOwner", "url", "description", "homepageUrl", "createdAt", "updatedAt", "pushedAt",
+                  "isArchived", "isFork", "stargazerCount", "forkCount"]:
+        if field in repository:
+            repo_json[field] = repository[field]
+    if repository.get("owner") is not None:
+        repo_json["owner"] = repository["owner"].get("login")
+    if repository.get("primaryLanguage") is not None:
+        repo_json["primaryLanguage"] = repository["primaryLanguage"].get("name")
+    if repository.get("licenseInfo") is not None:
+        repo_json["license"] = repository["licenseInfo"]
+    if repository.get("repositoryTopics") is not None:
+        repo_json["topics"] = [ node["topic"]["name"] for node in repository["repositoryTopics"].get("nodes", []) ]
+    repo_json["fetched"] = fetched_time
+    return repo_json
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Enrich the software entities with GitHub repository public data")
+    parser.add_argument("--config", default="./config.yaml", help="path to the config file, default is ./config.yaml")
+    parser.add_argument("--reset", action="store_true", help="reset existing collections and re-import all GitHub records")
+    parser.add_argument("--refresh-days", type=int, default=None, help="fetch again the repositories imported more than this number of days ago, default from the config file")
+
+    args = parser.parse_args()
 
+    local_harvester = GitHub_harvester(config_path=args.config)
+    local_harvester.import_repositories(reset=args.reset, refresh_days=args.refresh_days)
@@ -1,106 +1,149 @@
 '''
     Proxy class for using ArangoDB and implement a common cache mechanism for downloaded data
+
+    Downloaded files are kept in a local cache (see local_cache.py), use open_cached_file() to read 
+    them as they can be compressed. 
 '''
 
 import os
 import sys
 import json
 from arango import ArangoClient
-import requests
-import hashlib
-import time
-from random import randint, seed
 sys.path.append(os.path.abspath('./common'))
 from software_kb.common.arango_common import CommonArangoDB
-
-seed(1)
+from software_kb.importing.async_fetcher import AsyncFetcher
+from software_kb.importing.local_cache import LocalCache, open_cached_file, conditional_headers
 
 class Harvester(CommonArangoDB):
 
+    # concurrent downloader, created on first use
+    fetcher = None
+
+    # local cache of the downloaded files, created on first use
+    local_cache = None
+
+    def get_fetcher(self):
+        if self.fetcher == None:
+            harvester_config = {}
+            if "harvester" in self.config and self.config["harvester"] != None:
+                harvester_config = self.config["harvester"]
+            self.fetcher = AsyncFetcher(max_connections=harvester_config.get("max_connections", 8), 
+                                        requests_per_second=harvester_config.get("requests_per_second", 2.0),
+                                        burst=harvester_config.get("burst", 2),
+                                        max_retries=harvester_config.get("max_retries", 4))
+        return self.fetcher
+
     def access_file(self, url, use_cache=True):
         '''
-        download file if not cached and use_cache is True
+        download file if not cached or if use_cache is False (then with a conditional request if the file is cached)
         return local path to the file
         '''
-        # check if file is present in the cache
-        hash_url = hashlib.md5(url.encode()).hexdigest()
-        local_id = 'cache/' + hash_url
-        if not use_cache or not self.cache.has(local_id):
-            # if not we download the file and save it 
-            content, extension, status = self.download(url)
-            if content == None:
-                # online access failed
-                if status == 404:
-                    # resources is not present, we can store this result in the cache to avoid new calls
-                    if use_cache and not self.cache.has(local_id):
-                        file_json = {}
-                        file_json['_id'] = local_id
-                        file_json['path'] = None
-                        self.cache.insert(file_json)
-                return None
-
-            self.cache_files = "data/" + self.database_name
-            if not os.path.exists(self.cache_files):
-                os.makedirs(self.cache_files)
-
-            local_path = os.path.join(self.cache_files, hash_url+"."+extension)
-
-            if extension == "txt" or extension == "xml":
-                with open(local_path, "w") as the_file:
-                    the_file.write(content)
-            elif extension == "json":   
-                with open(local_path, "w") as the_file:
-                    the_file.write(json.dumps(content))
-            else: 
-                # keep binary, in particular for html
-                with open(local_path, "wb") as the_file:
-                    the_file.write(content)
-
-            if use_cache and not self.cache.has(local_id):
-                file_json = {}
-                file_json['_id'] = local_id
-                file_json['path'] = local_path
-                self.cache.insert(file_json)
-            return local_path
-        else:
-            # return store path to the file
-            file_json = self.cache.get(local_id)
-            return file_json["path"]
+        return self.access_files([url], use_cache=use_cache)[url]
+
+    def get_local_cache(self):
+        '''
+        local cache of the downloaded files, under data/<database_name>/cache
+        '''
+        if self.local_cache == None:
+            harvester_config = {}
+            if "harvester" in self.config and self.config["harvester"] != None:
+                harvester_config = self.config["harvester"]
+            max_size = harvester_config.get("cache_max_size")
+            if max_size != None:
+                # in MB in the config
+                max_size = max_size * 1024 * 1024
+            self.local_cache = LocalCache(os.path.join("data", self.database_name, "cache"), 
+                                          ttl=harvester_config.get("cache_ttl"), 
+                                          max_size=max_size)
+        return self.local_cache
+
+    def access_files(self, urls, use_cache=True):
+        '''
+        same as access_file() for a list of url, the files not cached are downloaded concurrently
+        return a dict url -> local path to the file (None if not available)
+
+        Expired cached files, and all the cached files if use_cache is False, are revalidated with 
+        a conditional request when possible: the file is downloaded again only if it has changed.  
+        '''
+        local_cache = self.get_local_cache()
+        local_paths = {}
+        to_download = []
+        entries = {}
+        headers = {}
+        for url in urls:
+            # check if file is present in the cache
+            entry = local_cache.get(url, include_expired=True)
+            if use_cache and entry != None and not entry["expired"]:
+                # return store path to the file
+                local_paths[url] = entry["path"]
+            elif not url in entries:
+                to_download.append(url)
+                entries[url] = entry
+                headers[url] = conditional_headers(entry)
+
+        # if not we download the files and save them 
+        responses = self.get_fetcher().fetch_all(to_download, headers=headers)
+        for url, response in zip(to_download, responses):
+            if response != None and response.status_code == 304 and entries[url] != None and entries[url]["path"] != None:
+                # not modified, the cached file is still valid
+                local_cache.touch(url)
+                local_paths[url] = entries[url]["path"]
+                continue
+            content, extension, status = _decode_response(url, response)
+            if content == None and status != 404 and entries[url] != None and entries[url]["path"] != None:
+                # revalidation failed (e.g. connection error), the stale cached file is still used
+                local_paths[url] = entries[url]["path"]
+                continue
+            etag = None
+            last_modified = None
+            if response != None:
+                etag = response.headers.get("ETag")
+                last_modified = response.headers.get("Last-Modified")
+            local_paths[url] = self._store_file(url, content, extension, status, etag=etag, last_modified=last_modified)
+        return local_paths
+
+    def _store_file(self, url, content, extension, status, etag=None, last_modified=None):
+        if content == None:
+            # online access failed
+            if status == 404:
+                # resources is not present, we can store this result in the cache to avoid new calls
+                self.get_local_cache().put(url, None, None, status)
+            return None
+
+        if extension == "json":   
+            content = json.dumps(content)
+        return self.get_local_cache().put(url, content, extension, status, etag=etag, last_modified=last_modified)
 
     def download(self, url):
-        time.sleep(randint(1, 2))
-        user_agent = {'User-agent': 'Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:68.0) Gecko/20100101 Firefox/68.0'}
-        success = False
-        response = None
-        try:
-            response = requests.get(url, allow_redirects=True, headers=user_agent)
-            success = (response.status_code == 200)
-            print(url, response.status_code, response.headers.get('content-type'))
-        except:
-            print("Connection fails:", url)
-        if success:
-            content_type = response.headers.get('content-type')
-            #print(content_type)
-            extension = "bin"
-            if content_type == None:
-                content_type = "text"
-                extension = "text"
-            if "json" in content_type.lower():
-                return response.json(), "json", response.status_code
-            elif "html" in content_type.lower():
-                # html is kept non-decoded to deal with encoding issue at later stage
-                return response.content, "html", response.status_code
-            elif "xml" in content_type.lower():
-                return response.content, "xml", response.status_code
-            elif "text" in content_type.lower():
-                return response.text, "txt", response.status_code
-            else: 
-                return response.content, extension, response.status_code
-        else:
-            status = 0
-            if response is not None:
-                print("Download of the resource failed with status", response.status_code)
-                status = response.status_code
-            else:
-                print("Download of the resource failed with connection error, remote disconnected?")   
-            return None, None, status
+        return _decode_response(url, self.get_fetcher().fetch(url))
+
+def _decode_response(url, response):
+    '''
+    return the content of a response as (content, extension, status), content is None if the download failed
+    '''
+    if response is None:
+        print("Download of the resource failed with connection error, remote disconnected?")   
+        return None, None, 0
+
+    print(url, response.status_code, response.headers.get('content-type'))
+    if response.status_code != 200:
+        print("Download of the resource failed with status", response.status_code)
+        return None, None, response.status_code
+
+    content_type = response.headers.get('content-type')
+    #print(content_type)
+    extension = "bin"
+    if content_type == None:
+        content_type = "text"
+        extension = "text"
+    if "json" in content_type.lower():
+        return response.json(), "json", response.status_code
+    elif "html" in content_type.lower():
+        # html is kept non-decoded to deal with encoding issue at later stage
+        return response.content, "html", response.status_code
+    elif "xml" in content_type.lower():
+        return response.content, "xml", response.status_code
+    elif "text" in content_type.lower():
+        return response.text, "txt", response.status_code
+    else: 
+        return response.content, extension, response.status_code
@@ -12,203 +12,162 @@ def is_git_repo(url):
             return True
     return False
 
-def process_r_author_field(author_field):
-
-    # first get each person clause
-    author_field = author_field.replace("\n", " ")
-    if author_field.startswith("c(") and author_field.endswith(")"):
-        author_field = author_field[2:-1]
+# tokens of an R Authors@R expression like c(person(given = "A", role = c("aut", "cre")), person("B", "C")),
+# an argument with its optional name is a single token: 
+#   (argument name, "string", 'string', c(vector content), identifier, opening parenthesis of a call, closing parenthesis)
+r_token_pattern = re.compile(r'''(?=[\w."')])(?:([A-Za-z_.][\w.]*)\s*=\s*)?(?:"((?:[^"\\]|\\.)*)(?:"|$)|'((?:[^'\\]|\\.)*)(?:'|$)|c\s*\(((?:[^()"']|"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')*)\)|([A-Za-z_.][\w.]*)(\s*\()?)|(\))''')
+
+# elements of a vector c(...), possibly named like c(ORCID = "...")
+r_vector_element_pattern = re.compile(r'''(?:([A-Za-z_.][\w.]*)\s*=\s*)?(?:"((?:[^"\\]|\\.)*)"|'((?:[^'\\]|\\.)*)')''')
+
+def _parse_r_vector(content):
+    values = []
+    for name, double_quoted, single_quoted in r_vector_element_pattern.findall(content):
+        value = (double_quoted or single_quoted).strip()
+        if len(name) > 0:
+            # named elements are kept as "ORCID = ..."
+            value = name + " = " + value
+        values.append(value)
+    return values
+
+def _extract_orcid(value):
+    if isinstance(value, str):
+        value = [ value ]
+    for val in value:
+        result_match = regex_orcid.search(val)
+        if not result_match is None:
+            return result_match.group(1)
+    return None
+
+def _build_r_person(arguments):
+    person = {}
+    for attribute, value in arguments:
+        if attribute is None:
+            # we don't have a known attribute, but directly a person name component
+            attribute = 'given'
+            if isinstance(value, list):
+                value = " ".join(value)
+
+        if attribute == 'comment':
+            # we extract the orcid if present
+            orcid = _extract_orcid(value)
+            if orcid != None:
+                person['orcid'] = orcid
+
+        if attribute == 'given' and isinstance(value, str) and value.find("@") != -1:
+            # it happens that we have an email address directly after the name
+            person["email"] = value
+        elif attribute in person and isinstance(value, str) and isinstance(person[attribute], str):
+            person[attribute] = person[attribute] + ' ' + value
+        else:
+            person[attribute] = value
+    return person
 
-    #print(author_field)
+def process_r_author_field(author_field):
+    '''
+    Parse an R Authors@R field, a vector of person() calls, in a single pass over the argument tokens.
+    Unnamed arguments are added to the "given" attribute (or "email" when it looks like an email),
+    named arguments are kept with their name and the ORCID is extracted from the comment. 
+    '''
+    persons = []
 
-    person_strings = []
-    while len(author_field)>0:
-        pos2 = author_field.find('person(')
-        if pos2 == -1:
-            break;
+    # open calls, as [function name, argument name, list of arguments]
+    calls = []
+    for name, double_quoted, single_quoted, vector, identifier, call, closing in r_token_pattern.findall(author_field.replace("\n", " ")):
+        if double_quoted or single_quoted:
+            if len(calls) > 0:
+                calls[-1][2].append((name or None, (double_quoted or single_quoted).strip()))
+        elif vector:
+            if len(calls) > 0:
+                calls[-1][2].append((name or None, _parse_r_vector(vector)))
+        elif call:
+            calls.append([identifier, name or None, []])
+        elif closing:
+            if len(calls) == 0:
+                continue
+            function_name, argument_name, arguments = calls.pop()
+            if function_name.endswith("person"):
+                person = _build_r_person(arguments)
+                if len(person) > 0:
+                    persons.append(person)
+            elif len(calls) > 0:
+                # other function call inside a person (e.g. paste()), we simply concatenate the string arguments
+                calls[-1][2].append((argument_name, "".join([ value for _, value in arguments if isinstance(value, str) ])))
+        elif identifier and len(calls) > 0:
+            # NULL, NA, TRUE, ...
+            calls[-1][2].append((name or None, identifier))
 
-        pos3 = author_field.find('person(', pos2+1)
-        if pos3 == -1:
-            pos3 = len(author_field)-1
+    return clean_person_field(persons)
 
-        local_string = author_field[pos2:pos3]
-        local_string = local_string.replace("person(", "")
-        if local_string.endswith("), "):
-            local_string = local_string[:-3]
+# comment in parenthesis, with possibly one level of nested parenthesis
+comment_pattern = re.compile(r'\(((?:[^()]|\([^()]*\))*)\)')
 
-        person_strings.append(local_string)
-        author_field = author_field[pos3:]
+# one person of a CRAN Author field like "Yihui Xie <a href=...>...</a> [aut, cre], Adam Vogt [ctb] (comment), ...":
+# the name, then the annotations (<> parts, [] roles, () comment) up to the next comma outside of them
+author_person_pattern = re.compile(r'''([^<\[\](),]*)((?:<[^>]*>|\[[^\]]*\]|\((?:[^()]|\([^()]*\))*\)|[^,])*)(?:,|$)''')
 
+def process_author_field(author_field):
+    '''
+    Parse a free text Author field in a single pass, persons are separated by commas outside the 
+    brackets and parenthesis, the first [] group gives the roles, the first () group the comment and
+    the ORCID is searched in the first <> part. 
+    '''
     persons = []
-    for person_string in person_strings:
-        #print("\nPerson")
+    for name, annotations in author_person_pattern.findall(author_field.replace("\n", " ")):
         person = {}
-        person_string = person_string.strip()
-        #print(person_string)
-        ind = 0
-        while ind != -1:
-            if len(person_string) <= 1:
-                break
-
-            if person_string.startswith("\""):
-                # we don't have a known attribute, but directly a person name component
-                attribute = 'given'
-            else:
-                ind = person_string.find("=")
-                attribute = None
+        if len(annotations) > 0:
+            pos = annotations.find("<")
+            if pos != -1:
+                # try to fish an orcid there 
+                result_match = regex_orcid.search(annotations, pos, annotations.find(">", pos))
+                if not result_match is None:
+                    person['orcid'] = result_match.group(1)
+
+            pos = annotations.find("[")
+            if pos != -1:
+                pos2 = annotations.find("]", pos)
+                if pos2 != -1:
+                    # roles are there
+                    roles = []
+                    for subpiece in annotations[pos+1:pos2].split(","):
+                        if subpiece.endswith(")"):
+                            subpiece = subpiece[:-1]
+                        roles.append(subpiece.strip(" \""))
+                    person["roles"] = roles
 
-            if ind != -1:
-                if attribute is None:
-                    attribute = person_string[0:ind].strip(", ")
-            
-                # do we have a list as value?
-                if person_string[ind:].strip().startswith('=c(') or person_string[ind:].strip().startswith('= c('):
-                    ind2 = person_string.find("),", ind)
-                else:
-                    if attribute == 'comment':
-                        ind_com = person_string.find("\"", ind)
-                        ind2 = person_string.find("\"", ind_com+1)
-                        if ind2 != -1:
-                            # shift the last "
-                            ind2 += 1
-                    else:
-                        ind2 = person_string.find(", ", ind)
-                
-                if ind2 == -1:
-                    ind2 = len(person_string)
-
-                value = person_string[ind:ind2].strip(" =\"")
-
-                if value.startswith("c("):
-                    # this is an array
-                    value = value[2:].strip()
-                    pieces = value.split(",")
-                    values = []
-                    for piece in pieces:
-                        values.append(piece.strip(" \""))
-                    value = values
-
-                if attribute == 'comment':
-                    # we extract the orcid if present
-                    # normally the value is a list, but not sure
-                    orcid = None
-                    if isinstance(value, str):
-                        result_match = regex_orcid.search(value)
-                        if not result_match is None:
-                            orcid = result_match.group(1)
-                    else:
-                        for val in value:
-                            result_match = regex_orcid.search(val)
-                            if not result_match is None:
-                                orcid = result_match.group(1)
-                                break
-                    if orcid != None:
-                        person['orcid'] = orcid
-                
-                if attribute == 'given' and isinstance(value, str) and value.find("@") != -1:
-                    # it happens that we have an email address directly after the name
-                    person["email"] = value
-                elif attribute in person:
-                    person[attribute] = person[attribute] + ' ' + value
-                else:
-                    person[attribute] = value
-
-                person_string = person_string[ind2:]
-                person_string = person_string.strip(" ,)")
+            pos = annotations.find("(")
+            if pos != -1:
+                result_match = comment_pattern.match(annotations, pos)
+                if not result_match is None:
+                    person["comment"] = clean_field(result_match.group(1))
 
+        person["full_name"] = name.strip()
         persons.append(person)
 
-    persons = [ pers for pers in persons if not len(pers) == 0 ]
     return clean_person_field(persons)
 
+def process_r_author_fields(author_fields, pool=None, chunksize=64):
+    '''
+    Parse a list of Authors@R fields, with a multiprocessing pool if given. The result is the list 
+    of the person lists, in the same order, None for a None field.
+    '''
+    return _process_fields(process_r_author_field, author_fields, pool, chunksize)
 
-def process_author_field(author_field):
-
-    # first get each person clause
-    author_field = author_field.replace("\n", " ")
-
-    persons = []
-
-    pos = 0
-    pieces = []
-    while pos != -1:
-        new_pos = author_field.find("],", pos)
-        if new_pos != -1:
-            local_subfield = author_field[pos:new_pos+2]
-            # try sub-segment for ")," boundaries
-            extra_pos = local_subfield.find("),")
-            if extra_pos != -1:
-                pieces.append(local_subfield[:extra_pos+2].strip())
-                pieces.append(local_subfield[extra_pos+2:].strip())
-            else:
-                pieces.append(local_subfield.strip())
-            pos = new_pos+2
-        else:
-            # last piece
-            pieces.append(author_field[pos:].strip())
-            pos = -1
+def process_author_fields(author_fields, pool=None, chunksize=64):
+    '''
+    Parse a list of Author fields, same as process_r_author_fields()
+    '''
+    return _process_fields(process_author_field, author_fields, pool, chunksize)
 
-    for piece in pieces:
-        #print(piece)
-        person = {}
-        last_pos = len(piece)
-        pos = piece.find("<");
-        orcid = None
-        if pos != -1:
-            # find last occuring > in this piece
-            pos2 = piece.find(">");
-            # try to fish an orcid there 
-            result_match = regex_orcid.search(piece[pos:pos2])
-            if not result_match is None:
-                orcid = result_match.group(1)
-            if pos < last_pos:
-                last_pos = pos
-        if orcid != None:
-            person['orcid'] = orcid
-
-        pos = piece.find("[");
-        if pos != -1:
-            pos2 = piece.find("]", pos);
-            if pos2 != -1:
-                # roles are there
-                subpieces = piece[pos+1:pos2].split(",")
-                roles = []
-                for subpiece in subpieces:
-                    if subpiece.endswith(")"):
-                        subpiece = subpiece[:-1]
-                    roles.append(subpiece.strip(" \""))
-                if len(roles)>0:
-                    person["roles"] = roles
+def _process_optional_field(process_function, field):
+    if field is None:
+        return None
+    return process_function(field)
 
-            if pos < last_pos:
-                last_pos = pos
-
-        pos = piece.find("(");
-        if pos != -1:
-            pos2 = piece.find(")", pos);
-            if pos2 != -1:
-                # comment
-                person["comment"] = clean_field(piece[pos+1:pos2])
-            if pos < last_pos:
-                last_pos = pos
-
-        # full name - but still the rare possibility of several names separated by a colon
-        final_name = piece[:last_pos].strip()
-        pos3 = final_name.find(",")
-        if pos3 != -1:
-            last_pos = 0
-            subnames = final_name.split(",")
-            for subname in subnames:
-                person = {}
-                person["full_name"] = subname.strip()
-                persons.append(person)
-        else:
-            person["full_name"] = final_name
-            persons.append(person)
-        
-    persons = [ pers for pers in persons if not len(pers) == 0 ]
-    
-    return clean_person_field(persons)
+def _process_fields(process_function, fields, pool, chunksize):
+    if pool is None:
+        return [ _process_optional_field(process_function, field) for field in fields ]
+    return pool.starmap(_process_optional_field, [ (process_function, field) for field in fields ], chunksize=chunksize)
 
 def process_maintainer_field(maintainer_field):
     '''
@@ -290,16 +249,30 @@ def clean_person_field(persons):
     This is a final cleaning for CRAN author field, which appears quite noisy. 
     TBD: call Grobid author model to more properly segment and normalize person names
     '''
+    final_persons = []
     for person in persons:
-        person = person.strip()
-        if person.startswith("and"):
-            person = person[3:].strip()
-        if person.endswith("."):
-            person = person[:-1].strip()
-
-        if person in filter_person_values:
-            continue
-        final_persons.append(person.strip())
+        if "full_name" in person:
+            full_name = person["full_name"].strip()
+            if full_name.startswith("and "):
+                full_name = full_name[4:].strip()
+            if full_name.endswith("."):
+                full_name = full_name[:-1].strip()
+
+            if len(full_name) == 0 or full_name.lower() in filter_person_values:
+                continue
+            person["full_name"] = full_name
+        final_persons.append(person)
 
     return final_persons
-    
\ No newline at end of file
+    
+def diff_package_versions(stored_versions, available_versions):
+    '''
+    Compare the stored and the available versions of packages, both as dict package name -> version.
+    Return the sets of new, changed and removed package names. 
+    '''
+    stored_names = set(stored_versions.keys())
+    available_names = set(available_versions.keys())
+    new_packages = available_names - stored_names
+    removed_packages = stored_names - available_names
+    changed_packages = set(name for name in available_names & stored_names if stored_versions[name] != available_versions[name])
+    return new_packages, changed_packages, removed_packages
@@ -0,0 +1,253 @@
+'''
+    Local cache of the downloaded resources for the harvesters
+
+    Files are stored in a sharded directory layout under the cache root, e.g.
+    data/CRAN/cache/3f/a2/3fa2...e1.html.gz, with an embedded SQLite index giving for each URL the
+    path, the type of content, the size and the access times. Text payloads (HTML, JSON, XML, text)
+    are compressed transparently with zstd if the zstandard package is installed, otherwise with
+    gzip. A cache hit is then a local SQLite lookup and a file read, without database server round
+    trip.
+
+    Entries can expire after a time-to-live, and the least recently used entries are evicted when
+    the total size of the cache exceeds a maximum size. The access times of the cache hits are kept
+    in memory and written in one batch (every access_batch_size hits, before an eviction and when
+    closing the cache), so a hit does not cost a write transaction.
+
+    The HTTP validators (ETag, Last-Modified) are stored with each entry, so that an expired entry
+    can be revalidated with a conditional request instead of being downloaded again.
+'''
+
+import os
+import gzip
+import time
+import hashlib
+import sqlite3
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# extensions of the payloads which are compressed
+compressed_extensions = ["html", "json", "xml", "txt", "text"]
+
+# number of buffered access times written at once
+default_access_batch_size = 1000
+
+schema = '''CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    path TEXT,
+    extension TEXT,
+    status INTEGER,
+    size INTEGER NOT NULL DEFAULT 0,
+    created REAL NOT NULL,
+    accessed REAL NOT NULL,
+    etag TEXT,
+    last_modified TEXT
+)'''
+
+def url_key(url):
+    return hashlib.md5(url.encode()).hexdigest()
+
+class LocalCache(object):
+
+    def __init__(self, root, ttl=None, max_size=None, compression=None, access_batch_size=default_access_batch_size):
+        '''
+        ttl is the time-to-live of the entries in seconds, max_size the maximum total size of the
+        stored files in bytes, None for no limit. compression is "zstd", "gzip" or "none", by default
+        zstd if available.
+        '''
+        self.root = root
+        self.ttl = ttl
+        self.max_size = max_size
+        # key -> last access time, not yet written in the index
+        self.accessed = {}
+        self.access_batch_size = access_batch_size
+        if compression is None:
+            compression = "zstd" if zstandard is not None else "gzip"
+        if compression == "zstd" and zstandard is None:
+            raise Exception("zstd compression requires the zstandard package")
+        self.compression = compression
+        os.makedirs(root, exist_ok=True)
+        self.db = sqlite3.connect(os.path.join(root, "index.sqlite"))
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(schema)
+        # caches created before the validators were stored
+        columns = [ row[1] for row in self.db.execute("PRAGMA table_info(entries)") ]
+        for column in ["etag", "last_modified"]:
+            if not column in columns:
+                self.db.execute("ALTER TABLE entries ADD COLUMN " + column + " TEXT")
+        self.db.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries(accessed)")
+        self.db.commit()
+
+    def get(self, url, include_expired=False):
+        '''
+        Return the cache entry of an URL as a dict (path to the stored file, None for a resource
+        recorded as not available, extension and status), None if the URL is not cached or expired.
+        With include_expired, expired entries are also returned, with the validators to revalidate
+        them ("expired", "etag" and "last_modified" fields).
+        '''
+        row = self.db.execute("SELECT path, extension, status, created, etag, last_modified FROM entries WHERE key = ?", 
+            (url_key(url),)).fetchone()
+        if row is None:
+            return None
+        path, extension, status, created, etag, last_modified = row
+        expired = self.ttl is not None and time.time() - created > self.ttl
+        if expired and not include_expired:
+            return None
+        if path is not None:
+            path = os.path.join(self.root, path)
+            if not os.path.isfile(path):
+                return None
+        self.accessed[url_key(url)] = time.time()
+        if len(self.accessed) >= self.access_batch_size:
+            self.flush_accessed()
+        entry = { "path": path, "extension": extension, "status": status }
+        if include_expired:
+            entry["expired"] = expired
+            entry["etag"] = etag
+            entry["last_modified"] = last_modified
+        return entry
+
+    def put(self, url, content, extension, status=200, etag=None, last_modified=None):
+        '''
+        Store the content (bytes) of an URL, or only record the status when content is None (e.g. 404),
+        with the HTTP validators of the response if any, return the path to the stored file
+        '''
+        key = url_key(url)
+        relative_path = None
+        size = 0
+        if content is not None:
+            if isinstance(content, str):
+                content = content.encode("utf-8")
+            relative_path = os.path.join(key[0:2], key[2:4], key + "." + extension)
+            if extension in compressed_extensions:
+                if self.compression == "zstd":
+                    content = zstandard.ZstdCompressor().compress(content)
+                    relative_path += ".zst"
+                elif self.compression == "gzip":
+                    content = gzip.compress(content, compresslevel=6)
+                    relative_path += ".gz"
+            path = os.path.join(self.root, relative_path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # written under a temporary name then renamed, a partial file is never in the cache
+            with open(path + ".tmp", "wb") as the_file:
+                the_file.write(content)
+            os.replace(path + ".tmp", path)
+            size = len(content)
+
+        previous = self.db.execute("SELECT path FROM entries WHERE key = ?", (key,)).fetchone()
+        if previous is not None and previous[0] is not None and previous[0] != relative_path:
+            self._remove_file(previous[0])
+
+        now = time.time()
+        self.accessed.pop(key, None)
+        self.db.execute("INSERT OR REPLACE INTO entries (key, url, path, extension, status, size, created, accessed, etag, last_modified) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (key, url, relative_path, extension, status, size, now, now, etag, last_modified))
+        self.db.commit()
+
+        if self.max_size is not None:
+            self.evict(self.max_size)
+        if relative_path is None:
+            return None
+        return os.path.join(self.root, relative_path)
+
+    def touch(self, url):
+        '''
+        Reset the creation time of an entry, i.e. the resource is still valid (e.g. after a 304 response)
+        '''
+        self.accessed.pop(url_key(url), None)
+        self.db.execute("UPDATE entries SET created = ?, accessed = ? WHERE key = ?", (time.time(), time.time(), url_key(url)))
+        self.db.commit()
+
+    def flush_accessed(self):
+        '''
+        Write the buffered access times in the index
+        '''
+        if len(self.accessed) == 0:
+            return
+        self.db.executemany("UPDATE entries SET accessed = ? WHERE key = ?", 
+            [ (accessed, key) for key, accessed in self.accessed.items() ])
+        self.db.commit()
+        self.accessed = {}
+
+    def size(self):
+        return self.db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def evict(self, max_size):
+        '''
+        Remove the least recently used entries until the total size is below max_size
+        '''
+        total = self.size()
+        if total <= max_size:
+            return
+        self.flush_accessed()
+        cursor = self.db.execute("SELECT key, path, size FROM entries ORDER BY accessed ASC")
+        to_remove = []
+        for key, path, size in cursor:
+            if total <= max_size:
+                break
+            to_remove.append((key, path))
+            total -= size
+        for key, path in to_remove:
+            if path is not None:
+                self._remove_file(path)
+            self.db.execute("DELETE FROM entries WHERE key = ?", (key,))
+        self.db.commit()
+
+    def purge_expired(self):
+        '''
+        Remove the entries older than the time-to-live
+        '''
+        if self.ttl is None:
+            return
+        limit = time.time() - self.ttl
+        expired = self.db.execute("SELECT key, path FROM entries WHERE created < ?", (limit,)).fetchall()
+        for key, path in expired:
+            if path is not None:
+                self._remove_file(path)
+            self.db.execute("DELETE FROM entries WHERE key = ?", (key,))
+        self.db.commit()
+
+    def _remove_file(self, relative_path):
+        path = os.path.join(self.root, relative_path)
+        if os.path.isfile(path):
+            os.remove(path)
+
+    def close(self):
+        self.flush_accessed()
+        self.db.close()
+
+def open_cached_file(path, mode="rb"):
+    '''
+    Open a file of the cache, decompressing it transparently. mode is "rb" or "rt" (UTF-8).
+    '''
+    if path.endswith(".gz"):
+        if mode == "rt":
+            return gzip.open(path, "rt", encoding="utf-8")
+        return gzip.open(path, "rb")
+    if path.endswith(".zst"):
+        if zstandard is None:
+            raise Exception("zstd compressed cache file requires the zstandard package: " + path)
+        if mode == "rt":
+            return zstandard.open(path, "rt", encoding="utf-8")
+        return zstandard.open(path, "rb")
+    if mode == "rt":
+        return open(path, "rt", encoding="utf-8")
+    return open(path, "rb")
+
+def conditional_headers(entry):
+    '''
+    Request headers for revalidating a cache entry, None if the entry has no validator
+    '''
+    if entry is None or entry["path"] is None:
+        return None
+    headers = {}
+    if entry.get("etag") is not None:
+        headers["If-None-Match"] = entry["etag"]
+    if entry.get("last_modified") is not None:
+        headers["If-Modified-Since"] = entry["last_modified"]
+    if len(headers) == 0:
+        return None
+    return headers
@@ -0,0 +1,224 @@
+'''
+    Parallel reader of the software mention MongoDB exports
+
+    The mongoexport files (one JSON object per line, possibly gzipped) are read by chunks of lines
+    in the main process, the chunks of the three export files (annotations, documents, references)
+    are decoded concurrently in a pool of worker processes, and the decoded documents are returned
+    by chunks, in the order of each file, ready for bulk import:
+
+        for path, collection_name, documents, offset, nb_lines in read_mention_exports(paths, blacklist=blacklist, tags=tags):
+            ...
+
+    JSON lines are decoded with orjson if available, otherwise with the standard json module.
+
+    The progress of the import of each export file (offset in the uncompressed file, number of lines
+    and tags) is recorded in a small manifest, see ExportManifest, so that an interrupted import can 
+    continue in the middle of a file and the files already loaded are not read again.
+'''
+
+import os
+import gzip
+import json
+import time
+import hashlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# the three mongoexport collections, in the order of the file name matching
+export_collections = ["annotations", "documents", "references"]
+
+# number of lines decoded per task
+default_chunk_size = 5000
+
+def export_collection_name(filename):
+    '''
+    collection of a mongoexport file, based on the file name, None if the file is not a mention export
+    '''
+    for collection_name in export_collections:
+        if filename.find(collection_name) != -1:
+            return collection_name
+    return None
+
+def open_export_file(path):
+    if path.endswith(".gz"):
+        return gzip.open(path, 'rb')
+    return open(path, 'rb')
+
+def read_line_chunks(path, chunk_size=default_chunk_size, start_offset=0):
+    '''
+    Iterate over the lines of an export file by chunks of lines, as (lines, offset after the chunk).
+    Offsets are positions in the uncompressed content, start_offset must be the start of a line.
+    '''
+    with open_export_file(path) as fjson:
+        offset = start_offset
+        if start_offset > 0:
+            # for gzip files, the content is decompressed up to the offset
+            fjson.seek(start_offset)
+        lines = []
+        for line in fjson:
+            offset += len(line)
+            lines.append(line)
+            if len(lines) == chunk_size:
+                yield lines, offset
+                lines = []
+        if len(lines) > 0:
+            yield lines, offset
+
+def _is_number(s):
+    try:
+        float(s)
+        return True
+    except ValueError:
+        return False
+
+def is_blacklisted(term, blacklist):
+    return term in blacklist or term.find("SARS") != -1 or _is_number(term)
+
+def decode_json(json_string, fast_json=True):
+    if fast_json and orjson is not None:
+        try:
+            return orjson.loads(json_string)
+        except orjson.JSONDecodeError:
+            # e.g. invalid UTF-8, the standard decoder is more permissive
+            pass
+    return json.loads(json_string.decode('utf-8') if isinstance(json_string, bytes) else json_string)
+
+def decode_mention_line(json_string, collection_name, blacklist=None, tags=None, fast_json=True):
+    '''
+    Decode an exported JSON line, we use "$oid" under _id as key for the entry.
+    Return None for blacklisted annotations.
+    '''
+    json_object = decode_json(json_string, fast_json=fast_json)
+    local_id = json_object['_id']
+    local_id = local_id['$oid']
+    json_object['_id'] = collection_name + "/" + local_id
+    # check blacklist
+    if collection_name == "annotations" and blacklist is not None:
+        if "software-name" in json_object:
+            term = json_object["software-name"]["normalizedForm"]
+            if is_blacklisted(term, blacklist):
+                return None
+    json_object['tenants'] = tags
+    return json_object
+
+# worker state, set once per worker process
+_worker_blacklist = None
+_worker_tags = None
+_worker_fast_json = True
+
+def _init_worker(blacklist, tags, fast_json):
+    global _worker_blacklist, _worker_tags, _worker_fast_json
+    _worker_blacklist = blacklist
+    _worker_tags = tags
+    _worker_fast_json = fast_json
+
+def _decode_chunk(collection_name, lines):
+    documents = []
+    for line in lines:
+        try:
+            json_object = decode_mention_line(line, collection_name, blacklist=_worker_blacklist, tags=_worker_tags, fast_json=_worker_fast_json)
+            if json_object is not None:
+                documents.append(json_object)
+        except Exception as e:
+            print("failed to ingest json input:", line, e)
+    return documents
+
+def read_mention_exports(paths, blacklist=None, tags=None, nb_workers=None, chunk_size=default_chunk_size, fast_json=True,
+                         start_offsets=None):
+    '''
+    Iterate over the decoded documents of a list of mongoexport files, as (path, collection name, 
+    list of documents, offset in the file after the chunk, number of lines of the chunk). The chunks
+    of the different files are decoded concurrently, the chunks of a given file are returned in order.
+    The files not corresponding to a mention collection are ignored.
+
+    start_offsets is an optional dict path -> offset where to start reading the file.
+    '''
+    if nb_workers is None:
+        nb_workers = os.cpu_count() or 1
+
+    readers = deque()
+    for path in paths:
+        collection_name = export_collection_name(os.path.basename(path))
+        if collection_name is None:
+            continue
+        start_offset = 0
+        if start_offsets is not None:
+            start_offset = start_offsets.get(path, 0)
+        readers.append((path, collection_name, read_line_chunks(path, chunk_size, start_offset=start_offset)))
+
+    with ProcessPoolExecutor(max_workers=nb_workers, initializer=_init_worker, initargs=(blacklist, tags, fast_json)) as executor:
+        # bounded number of chunks in flight, submitted in turn from each file
+        pending = deque()
+        while len(readers) > 0 or len(pending) > 0:
+            while len(readers) > 0 and len(pending) < nb_workers * 2:
+                path, collection_name, reader = readers.popleft()
+                chunk = next(reader, None)
+                if chunk is None:
+                    continue
+                lines, offset = chunk
+                pending.append((path, collection_name, offset, len(lines), executor.submit(_decode_chunk, collection_name, lines)))
+                readers.append((path, collection_name, reader))
+
+            if len(pending) == 0:
+                break
+            path, collection_name, offset, nb_lines, future = pending.popleft()
+            yield path, collection_name, future.result(), offset, nb_lines
+
+class ExportManifest(object):
+    '''
+    Import progress of a mongoexport file: offset in the uncompressed file and number of lines
+    already loaded, tags of the import and completion. The manifest is a small JSON file written 
+    atomically under the manifest directory, e.g. data/mentions/manifest/annotations.json.gz.3fa2e1c0.json,
+    it is only valid for the same export file (same size and modification time).
+    '''
+
+    def __init__(self, path, export_path):
+        self.path = path
+        self.export_path = os.path.abspath(export_path)
+        name = os.path.basename(export_path) + "." + hashlib.md5(self.export_path.encode()).hexdigest()[:8] + ".json"
+        self.state_path = os.path.join(path, name)
+
+    def _file_signature(self):
+        stat = os.stat(self.export_path)
+        return stat.st_size, stat.st_mtime
+
+    def load(self):
+        '''
+        Return the recorded progress as a dict (offset, lines, tags, complete), None if there is no
+        valid manifest for this export file
+        '''
+        if not os.path.isfile(self.state_path):
+            return None
+        with open(self.state_path, "rt") as state_file:
+            state = json.load(state_file)
+        size, mtime = self._file_signature()
+        if state["file"] != self.export_path or state["size"] != size or state["mtime"] != mtime:
+            print("Export file has changed since the last import:", self.export_path)
+            return None
+        return state
+
+    def save(self, offset, lines, tags=None, complete=False):
+        os.makedirs(self.path, exist_ok=True)
+        size, mtime = self._file_signature()
+        state = {
+            "file": self.export_path,
+            "size": size,
+            "mtime": mtime,
+            "offset": offset,
+            "lines": lines,
+            "tags": tags,
+            "complete": complete,
+            "time": time.time()
+        }
+        with open(self.state_path + ".tmp", "wt") as state_file:
+            json.dump(state, state_file)
+        os.replace(self.state_path + ".tmp", self.state_path)
+
+    def clear(self):
+        if os.path.isfile(self.state_path):
+            os.remove(self.state_path)
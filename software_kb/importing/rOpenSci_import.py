@@ -8,9 +8,11 @@ import requests
 import argparse
 import json
 from harvester import Harvester
+from software_kb.importing.local_cache import open_cached_file
 from arango import ArangoClient
 import re
-from import_common import process_r_author_field, clean_field, process_author_field, process_url_field, is_git_repo, process_boolean_field, process_maintainer_field
+from software_kb.importing.import_common import process_r_author_field, clean_field, process_author_field, process_r_author_fields, process_author_fields, process_url_field, is_git_repo, process_boolean_field, process_maintainer_field, diff_package_versions
+from software_kb.common.bulk_writer import BulkWriter, default_batch_size
 from collections import OrderedDict
 import logging
 import logging.handlers
@@ -23,13 +25,21 @@ descriptions_path = "descriptions/"
 # the following list of fields are considered to be only related to particular build and could be ignored 
 skipped_fields = ['Packaged', 'VignetteBuilder', '_type', '_file', 'MD5sum', '_builder', '_user', 'Built', 'Encoding', 'LazyData', 'RoxygenNote', 'Remotes', 'Collate']
 
+# number of package version records downloaded concurrently before being converted
+prefetch_size = 200
+
 class rOpenSci_harvester(Harvester):
 
     database_name = "rOpenSci"
 
-    def __init__(self, config_path="./config.yaml"):
+    def __init__(self, config_path="./config.yaml", batch_size=None):
         self.load_config(config_path)
 
+        # packages are written by batches, replacing the previous version of the package
+        if batch_size is None:
+            batch_size = self.config['arangodb'].get('batch_size', default_batch_size)
+        self.bulk_writer = BulkWriter(batch_size=batch_size, on_duplicate="replace")
+
         # create database and collection
         if not self.sys_db.has_database(self.database_name):
             self.sys_db.create_database(self.database_name)
@@ -41,76 +51,117 @@ class rOpenSci_harvester(Harvester):
         else:
             self.packages = self.db.collection('packages')
 
-        if not self.db.has_collection('cache'):
-            self.cache = self.db.create_collection('cache')
-        else:
-            self.cache = self.db.collection('cache')
-
-
     def import_packages(self, reset=False):
         if reset:
             self.db.delete_collection('packages')
             self.packages = self.db.create_collection('packages')
 
-        # get the list of packages
+        # get the list of packages, always revalidated (cheap 304 response if the list has not changed)
         jsonResult = None
         packages_url = base_url + packages_path
         local_path = self.access_file(packages_url, use_cache=False)
         if local_path is not None:
             # get the content from file
-            with open(local_path) as file:
+            with open_cached_file(local_path, "rt") as file:
                 jsonResult = json.load(file)
         else:
-            print("Fail to retrieve the list of packages", packages_url, "status", response.status_code)
+            print("Fail to retrieve the list of packages", packages_url)
 
         if jsonResult == None:
             return
 
+        # lists of versions are revalidated concurrently, only the changed lists are downloaded again
+        versions_paths = self.access_files([ base_url + packages_path + package for package in jsonResult ], use_cache=False)
+        all_versions = {}
         for package in jsonResult:
-            # get the list of versions for this package
             jsonResultVersions = None
             packages_versions_url = base_url + packages_path + package
-            local_path = self.access_file(packages_versions_url, use_cache=False)
+            local_path = versions_paths[packages_versions_url]
             if local_path is not None:
                 # get the content from file
-                with open(local_path) as file:
+                with open_cached_file(local_path, "rt") as file:
                     jsonResultVersions = json.load(file)
-            else:
-                print("Fail to retrieve the list of package versions", packages_versions_url)
-
-            if jsonResultVersions == None:
-                continue
-
-            # sort by version number, descending
-            jsonResultVersions.sort(reverse=True)
-
-            for packageVersion in jsonResultVersions:
-                # finally get the package version
-                package_version_url = packages_versions_url + "/" + packageVersion
-                jsonResultVersionPackage = None
-                local_path = self.access_file(package_version_url)
-                if local_path is not None:
-                    # get the content from file
-                    with open(local_path) as file:
-                        jsonResultVersionPackage = json.load(file)
-                else:
-                    print("Fail to retrieve the list of package with version", package_version_url)
-
-                if jsonResultVersionPackage == None:
-                    continue
+            if jsonResultVersions != None and len(jsonResultVersions) > 0:
+                # sort by version number, descending
+                jsonResultVersions.sort(reverse=True)
+                all_versions[package] = jsonResultVersions
+
+        # stored packages and versions, retrieved with a single query
+        stored_versions = {}
+        stored_keys = {}
+        cursor = self.db.aql.execute('FOR package IN packages RETURN [package._key, package.Package, package.Version]', 
+            batch_size=10000, stream=True, ttl=3600)
+        for key, package, version in cursor:
+            stored_versions[package] = version
+            stored_keys.setdefault(package, []).append(key)
+
+        # packages whose latest version is already stored are skipped
+        latest_versions = {}
+        for package, versions in all_versions.items():
+            latest_versions[package] = versions[0]
+        new_packages, updated_packages, _ = diff_package_versions(stored_versions, latest_versions)
+        to_be_imported = [ package for package in jsonResult if package in new_packages or package in updated_packages ]
+        print("packages to be imported:", len(to_be_imported), "- unchanged packages:", len(all_versions) - len(to_be_imported))
 
-                package_json = self.convert_package_json(jsonResultVersionPackage)
+        for package in jsonResult:
+            if not package in all_versions:
+                print("Fail to retrieve the list of package versions", base_url + packages_path + package)
+
+        # the latest version of the packages is normally the one imported, they are downloaded concurrently
+        # by chunks, then converted and written by batches
+        to_be_removed = []
+        for chunk_start in range(0, len(to_be_imported), prefetch_size):
+            chunk = to_be_imported[chunk_start:chunk_start+prefetch_size]
+            latest_paths = self.access_files([ base_url + packages_path + package + "/" + latest_versions[package] for package in chunk ])
+
+            # records of the chunk, as (package, record of the latest available version)
+            records = []
+            for package in chunk:
+                packages_versions_url = base_url + packages_path + package
+                for packageVersion in all_versions[package]:
+                    # finally get the package version
+                    package_version_url = packages_versions_url + "/" + packageVersion
+                    jsonResultVersionPackage = None
+                    if package_version_url in latest_paths:
+                        local_path = latest_paths[package_version_url]
+                    else:
+                        # the latest version record is not available, older versions are tried 
+                        local_path = self.access_file(package_version_url)
+                    if local_path is not None:
+                        # get the content from file
+                        with open_cached_file(local_path, "rt") as file:
+                            jsonResultVersionPackage = json.load(file)
+                    else:
+                        print("Fail to retrieve the list of package with version", package_version_url)
+
+                    if jsonResultVersionPackage == None or len(jsonResultVersionPackage) == 0:
+                        continue
+
+                    # we only import the full record for the latest version
+                    records.append((package, jsonResultVersionPackage))
+                    break
+
+            # the author fields of the chunk are parsed together
+            r_authors = process_r_author_fields([ record[0].get('Authors@R') for _, record in records ])
+            authors = process_author_fields([ record[0].get('Author') for _, record in records ])
+
+            for (package, record), r_persons, persons in zip(records, r_authors, authors):
+                package_json = self.convert_package_json(record, r_persons=r_persons, persons=persons)
                 if package_json is None:
                     continue
-                # insert json document
+
+                # only one record per package (the latest version), the previously stored version is removed
                 package_json['_id'] = 'packages/' + package_json['_id']
-                if not self.packages.has(package_json['_id']):
-                    # for safety, check uniqueness of package name too (latestversion of each package comes first)
-                    cursor = self.packages.find({'Package': package_json["Package"]}, skip=0, limit=1)
-                    if cursor.count() == 0:
-                        self.packages.insert(package_json)
-                        # we only import the full record for the latest version
-                        break
+                for stored_key in stored_keys.get(package, []):
+                    if 'packages/' + stored_key != package_json['_id']:
+                        to_be_removed.append(stored_key)
+
+                # insert json document
+                self.bulk_writer.add(self.packages, package_json)
+
+        self.bulk_writer.flush()
+        for batch_start in range(0, len(to_be_removed), self.bulk_writer.batch_size):
+            self.packages.delete_many(to_be_removed[batch_start:batch_start+self.bulk_writer.batch_size])
 
     '''
     not used, we get it via the normal package input
@@ -144,7 +195,10 @@ class rOpenSci_harvester(Harvester):
         else:
             print("Fail to retrieve the list of package descriptions", base_url + descriptions_path, "status", response.status_code)
 
-    def convert_package_json(self, package_json):
+    def convert_package_json(self, package_json, r_persons=None, persons=None):
+        '''
+        r_persons and persons are the already parsed Authors@R and Author fields, if available
+        '''
         if package_json is None or len(package_json) == 0:
             return None
 
@@ -159,14 +213,16 @@ class rOpenSci_harvester(Harvester):
             # in this case the author field, also parsed, will be the fqall back
             return package_json
 
-        author_field = package_json['Authors@R']
-        persons = process_r_author_field(author_field)
-        if len(persons) > 0:
-            #print(persons)
-            package_json['Authors@R'] = persons
+        if r_persons is None:
+            r_persons = process_r_author_field(package_json['Authors@R'])
+        if len(r_persons) > 0:
+            #print(r_persons)
+            package_json['Authors@R'] = r_persons
 
         if "Author" in package_json:
-            package_json['Author'] = process_author_field(package_json['Author'])
+            if persons is None:
+                persons = process_author_field(package_json['Author'])
+            package_json['Author'] = persons
 
         if "Title" in package_json:
             package_json['Title'] = clean_field(package_json["Title"])
@@ -5,12 +5,20 @@
     are available: mentions, documents (documents where the mention is extracted) and references 
     (bibliographical references part of the context and attached to the extracted mentioned software)
 
+    The export files are decoded in parallel (see mention_reader.py) and written with bulk imports,
+    existing entries being ignored.
+
+    For the PDF viewer, the annotations of each document (page dimensions, md5, mentions and references)
+    are also materialized at import time as one bundle per document in the collection document_annotations, 
+    keyed by the document identifier, so that they are retrieved with a single key lookup.
 '''
 
 import requests
 import argparse
 import json
 from software_kb.importing.harvester import Harvester
+from software_kb.importing.mention_reader import read_mention_exports, export_collection_name, decode_mention_line, ExportManifest
+from software_kb.common.bulk_writer import BulkWriter, default_batch_size
 from arango import ArangoClient
 import re
 import os
@@ -21,6 +29,15 @@ class Software_mention_import(Harvester):
     database_name = "mentions"
     blacklist_files = [ "data/mentions/blacklists/cord-19.blacklist.software-mentions.txt" ]
 
+    # import progress of the export files
+    manifest_path = "data/mentions/manifest"
+
+    # number of decoded chunks between two records of the import progress
+    progress_interval = 20
+
+    # number of documents per annotation bundle building query
+    bundle_batch_size = 1000
+
     def __init__(self, config_path="./config.yaml"):
         self.load_config(config_path)
 
@@ -46,22 +63,36 @@ class Software_mention_import(Harvester):
             self.references = self.db.create_collection('references')
         else:
             self.references = self.db.collection('references')
+        # hash index on the document identifier, ensured also for databases created without it
+        self.references.add_hash_index(fields=['document.$oid'], unique=False, sparse=False)
+
+        # per-document annotation bundles, the document identifier is the key
+        if not self.db.has_collection('document_annotations'):
+            self.document_annotations = self.db.create_collection('document_annotations')
+        else:
+            self.document_annotations = self.db.collection('document_annotations')
 
         # blacklist
-        self.blacklist = []
+        self.blacklist = set()
         for black_file in self.blacklist_files:
             if not os.path.isfile(black_file): 
                 continue
             with open(black_file) as fp:
                 for line in fp:
                     line = line.strip()
-                    if len(line)>0 and not line in self.blacklist and not line.startswith("#"):
-                        self.blacklist.append(line)
+                    if len(line)>0 and not line.startswith("#"):
+                        self.blacklist.add(line)
 
-    def import_mentions(self, mongoExportPath, reset=False, tags=None):
+    def import_mentions(self, mongoExportPath, reset=False, tags=None, nb_workers=None, batch_size=None, fast_json=True, resume=False):
         '''
         We use the result of mongoexport, one JSON per line, with one file per collection.
         This can be incremental, loading different set of mentions extraction dumps from different sources/set of PDF. 
+
+        The JSON lines are decoded by nb_workers processes (default is the number of CPU), with orjson 
+        if installed and fast_json is True. 
+
+        The export files already fully loaded are skipped. With resume, the files partially loaded by 
+        an interrupted import are read from the last recorded position. 
         ''' 
         if reset:
             # TBD: we might want to prompt a confirmation, because it might be very destructive!
@@ -74,57 +105,120 @@ class Software_mention_import(Harvester):
 
             self.db.delete_collection('references')
             self.references = self.db.create_collection('references')
+            self.references.add_hash_index(fields=['document.$oid'], unique=False, sparse=False)
+
+            self.db.delete_collection('document_annotations')
+            self.document_annotations = self.db.create_collection('document_annotations')
 
         # import JSON collections
-        for thefile in os.listdir(mongoExportPath):
-            if thefile.find("annotations") != -1:
-                if thefile.endswith(".gz"):
-                    with gzip.open(os.path.join(mongoExportPath, thefile), 'rb') as fjson:
-                        for line in fjson:
-                            self._load_json(line, self.annotations, "annotations", tags=tags)
-                else:
-                    with open(os.path.join(mongoExportPath, thefile)) as fjson:
-                        for line in fjson:
-                            self._load_json(line, self.annotations, "annotations", tags=tags)
-            elif thefile.find("documents") != -1:
-                if thefile.endswith(".gz"):
-                    with gzip.open(os.path.join(mongoExportPath, thefile), 'rb') as fjson:
-                        for line in fjson:
-                            self._load_json(line, self.documents, "documents", tags=tags)
-                else:
-                    with open(os.path.join(mongoExportPath, thefile)) as fjson:
-                        for line in fjson:
-                            self._load_json(line, self.documents, "documents", tags=tags)
-            elif thefile.find("references") != -1:
-                if thefile.endswith(".gz"):
-                    with gzip.open(os.path.join(mongoExportPath, thefile), 'rb') as fjson:
-                        for line in fjson:
-                            self._load_json(line, self.references, "references", tags=tags)
-                else:
-                    with open(os.path.join(mongoExportPath, thefile)) as fjson:
-                        for line in fjson:
-                            self._load_json(line, self.references, "references", tags=tags)
+        paths = []
+        manifests = {}
+        start_offsets = {}
+        # number of lines loaded for each file
+        progress = {}
+        for thefile in sorted(os.listdir(mongoExportPath)):
+            path = os.path.join(mongoExportPath, thefile)
+            if export_collection_name(thefile) is None:
+                print("File skipped:", path)
+                continue
+
+            manifest = ExportManifest(self.manifest_path, path)
+            if reset:
+                manifest.clear()
+            state = manifest.load()
+            if state is not None and state["complete"]:
+                print("File already loaded:", path, "lines:", state["lines"], "tags:", state["tags"])
+                continue
+            if resume and state is not None and state["offset"] > 0:
+                print("Resuming", path, "after", state["lines"], "lines")
+                start_offsets[path] = state["offset"]
+                progress[path] = (state["offset"], state["lines"])
             else:
-                print("File skipped:", os.path.join(mongoExportPath, thefile))
+                progress[path] = (0, 0)
+            manifests[path] = manifest
+            paths.append(path)
+
+        if batch_size is None:
+            batch_size = self.config['arangodb'].get('batch_size', default_batch_size)
+        collections = { "annotations": self.annotations, "documents": self.documents, "references": self.references }
+
+        # documents whose annotation bundle needs to be (re)built
+        touched_documents = set()
+
+        # existing entries are kept as they are
+        with BulkWriter(batch_size=batch_size, on_duplicate="ignore") as writer:
+            nb_chunks = 0
+            for path, collection_name, documents, offset, nb_lines in read_mention_exports(paths, blacklist=self.blacklist, tags=tags, 
+                                                                   nb_workers=nb_workers, fast_json=fast_json, start_offsets=start_offsets):
+                for json_object in documents:
+                    writer.add(collections[collection_name], json_object)
+                    if collection_name == "documents":
+                        touched_documents.add(json_object['_id'][len("documents/"):])
+                    elif "document" in json_object and "$oid" in json_object["document"]:
+                        touched_documents.add(json_object["document"]["$oid"])
+                progress[path] = (offset, progress[path][1] + nb_lines)
+
+                nb_chunks += 1
+                if nb_chunks % self.progress_interval == 0:
+                    # the progress is recorded only when the corresponding entries are written
+                    writer.flush()
+                    for path_in_progress, (path_offset, path_lines) in progress.items():
+                        if path_offset > 0:
+                            manifests[path_in_progress].save(path_offset, path_lines, tags=tags)
+
+        for path, (path_offset, path_lines) in progress.items():
+            manifests[path].save(path_offset, path_lines, tags=tags, complete=True)
+        print("imported entries:", writer.created, "- already present:", writer.ignored, "- errors:", writer.errors)
+
+        if resume:
+            # documents loaded before the interruption might not have their bundle
+            self.build_document_annotations()
+        else:
+            self.build_document_annotations(touched_documents)
+
+    def build_document_annotations(self, document_ids=None):
+        '''
+        Materialize the annotation bundles of the given documents (identifiers without collection 
+        prefix), of all the documents by default. Bundles are built server-side by batches of documents.
+        '''
+        if document_ids is None:
+            cursor = self.db.aql.execute('FOR doc IN documents RETURN doc._key', batch_size=10000, stream=True, ttl=3600)
+            document_ids = cursor
+        batch = []
+        nb_documents = 0
+        for document_id in document_ids:
+            batch.append(document_id)
+            if len(batch) == self.bundle_batch_size:
+                nb_documents += self._build_document_annotations_batch(batch)
+                batch = []
+        if len(batch) > 0:
+            nb_documents += self._build_document_annotations_batch(batch)
+        print("document annotation bundles:", nb_documents)
+
+    def _build_document_annotations_batch(self, document_ids):
+        cursor = self.db.aql.execute(
+            'FOR document_id IN @ids \
+                LET doc = DOCUMENT("documents", document_id) \
+                FILTER doc != null AND HAS(doc, "pages") \
+                LET mentions = (FOR annotation IN annotations FILTER annotation.document["$oid"] == document_id RETURN UNSET(annotation, "document")) \
+                LET refs = (FOR reference IN references FILTER reference.document["$oid"] == document_id RETURN UNSET(reference, "document")) \
+                UPSERT { _key: document_id } \
+                INSERT { _key: document_id, pages: doc.pages, md5: doc.md5, mentions: mentions, references: refs } \
+                REPLACE { pages: doc.pages, md5: doc.md5, mentions: mentions, references: refs } \
+                IN document_annotations \
+                RETURN 1', bind_vars={ "ids": document_ids }, ttl=3600)
+        return len(list(cursor))
 
     def _load_json(self, json_string, collection, collection_name, tags=None):
         '''
         we use "$oid" under _id as key for the entry
         '''
         try:
-            json_object = json.loads(json_string.decode('utf-8'))
-            local_id = json_object['_id']
-            local_id = local_id['$oid']
-            json_object['_id'] = collection_name + "/" + local_id
-            # check blacklist
-            if collection_name == "annotations":
-                if "software-name" in json_object:
-                    term = json_object["software-name"]["normalizedForm"]
-                    if term in self.blacklist or term.find("SARS") != -1 or _is_number(term):
-                        return
+            json_object = decode_mention_line(json_string, collection_name, blacklist=self.blacklist, tags=tags)
+            if json_object is None:
+                return
             # insert
             if not collection.has(json_object['_id']):
-                json_object['tenants'] = tags
                 collection.insert(json_object)
         except Exception as e:
             print("failed to ingest json input:", json_string, e)
@@ -135,6 +229,17 @@ class Software_mention_import(Harvester):
         as what the softcite software mention recognizer is returning and allows to
         visualize the mentions from the KB only. 
         '''
+        bundle = self.document_annotations.get(document_id)
+        if bundle != None:
+            del bundle['_key']
+            del bundle['_id']
+            del bundle['_rev']
+            return bundle
+
+        # no materialized bundle (e.g. import made before the bundles), the annotations are gathered
+        return self._gather_document_annotations(document_id)
+
+    def _gather_document_annotations(self, document_id):
         result = {}
 
         # first get document record for page dimentions
@@ -169,20 +274,17 @@ class Software_mention_import(Harvester):
 
         return result
 
-def _is_number(s):
-    try:
-        float(s)
-        return True
-    except ValueError:
-        return False
-
-
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description = "Import collection of automatically extracted software mention")
-    parser.add_argument("mongoExportPath", default=None, help="path to the directory with MongoDB JSON export containing the software mentions") 
+    parser.add_argument("mongoExportPath", nargs="?", default=None, help="path to the directory with MongoDB JSON export containing the software mentions") 
     parser.add_argument("--config", default="./config.yaml", help="path to the config file, default is ./config.yaml") 
     parser.add_argument("--reset", action="store_true", help="reset existing collections and re-import all software mention records") 
     parser.add_argument("--tag", default=None, nargs='*', help="one or several labels to be associated to the loaded document, e.g. name of collection")
+    parser.add_argument("--nb-workers", type=int, default=None, help="number of processes for decoding the JSON exports, default is the number of CPU")
+    parser.add_argument("--batch-size", type=int, default=None, help="number of entries written per bulk import, default is the config batch_size")
+    parser.add_argument("--resume", action="store_true", help="continue the files partially loaded by an interrupted import")
+    parser.add_argument("--build-annotations", action="store_true", help="only (re)build the per-document annotation bundles of all the imported documents")
+    parser.add_argument("--no-fast-json", action="store_true", help="use the standard json module even if orjson is installed")
 
     args = parser.parse_args()
     config_path = args.config
@@ -190,8 +292,12 @@ if __name__ == "__main__":
     to_reset = args.reset
     tags = args.tag
 
-    if mongoExportPath is not None:
+    if args.build_annotations:
+        local_harvester = Software_mention_import(config_path=config_path)
+        local_harvester.build_document_annotations()
+    elif mongoExportPath is not None:
         local_harvester = Software_mention_import(config_path=config_path)
-        local_harvester.import_mentions(mongoExportPath, reset=to_reset, tags=tags)
+        local_harvester.import_mentions(mongoExportPath, reset=to_reset, tags=tags, nb_workers=args.nb_workers, 
+                                        batch_size=args.batch_size, fast_json=not args.no_fast_json, resume=args.resume)
     else:
         print("No MongoDB export directory path indicated")
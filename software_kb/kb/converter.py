@@ -24,10 +24,27 @@ def convert_to_simple_format(kb, entity):
     canonical English labels, which will make reading much easier 
     '''
     converted = copy.deepcopy(entity)    
+    # missing names are fetched from Wikidata in batch before the conversion
+    wikidata_ids = set()
+    _collect_wikidata_ids(converted, wikidata_ids)
+    kb.prefetch_naming_wikidata(wikidata_ids)
     converted = _convert_to_simple_format_item(kb, converted)
 
     return converted
 
+def _collect_wikidata_ids(item, wikidata_ids):
+    if isinstance(item, str):
+        if (item.startswith("P") or item.startswith("Q")) and item[1:].isdigit():
+            wikidata_ids.add(item)
+    elif isinstance(item, list):
+        for value in item:
+            _collect_wikidata_ids(value, wikidata_ids)
+    elif isinstance(item, dict):
+        for key, value in item.items():
+            if not key.startswith("_"):
+                _collect_wikidata_ids(key, wikidata_ids)
+                _collect_wikidata_ids(value, wikidata_ids)
+
 def _convert_to_simple_format_item(kb, item):
     if item == None:
         return None
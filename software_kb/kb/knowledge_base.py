@@ -9,9 +9,10 @@ import os
 import sys
 import json
 from arango import ArangoClient
-from software_kb.common.arango_common import CommonArangoDB, _get_entity_from_wikidata
+from software_kb.common.arango_common import CommonArangoDB
 from software_kb.merging.populate_staging_area import StagingArea, _project_entity_id_collection
 from software_kb.common.arango_common import simplify_entity
+from software_kb.common.entity_set import load_entity_set, entity_set_path
 import argparse
 from tqdm import tqdm
 import requests
@@ -52,6 +53,8 @@ class knowledgeBase(CommonArangoDB):
         self.config_path = config_path
         self.load_config(config_path)
         self.init_naming()
+        # names are resolved in memory, the converters and the indexer use them for every key and value
+        self.load_naming_cache()
 
         # create database if it doesn't exist
         if not self.sys_db.has_database(self.database_name):
@@ -409,10 +412,7 @@ class knowledgeBase(CommonArangoDB):
         in the import list. 
         '''
 
-        software_list = []
-        with open("data/resources/software.wikidata.entities", "rt") as fp:
-            for line in fp:
-                software_list.append(line.rstrip())
+        software_list = load_entity_set("software")
 
         total_results = self.software.count()
         page_size = 1000
@@ -426,6 +426,8 @@ class knowledgeBase(CommonArangoDB):
                 'FOR doc IN software LIMIT ' + str(page_rank*page_size) + ', ' + str(page_size) + ' RETURN doc', ttl=3600
             )
             
+            # software entities to be completed with a missing Wikidata entity
+            to_complete = []
             for soft in cursor:
                 # get mention count
                 contexts = []
@@ -472,26 +474,27 @@ class knowledgeBase(CommonArangoDB):
 
                 if count > total_mentions/2:
                     # valid entity... keep track of the entity if not imported yet
-                    if not entity_id in software_list:
-                        software_list.append(entity_id)
+                    software_list.add(entity_id)
 
                     # update summary
                     if new_summary != None:
                         soft["summary"] = new_summary
 
-                    # to immediatly integrate this missing entity, we can retrieve it online and merge it 
-                    entity_json = _get_entity_from_wikidata(entity_id)
-                    if entity_json != None:
-                        soft = self.aggregate_with_merge(soft, entity_json)
+                    to_complete.append((soft, entity_id))
 
-                    # finally update the software entity in the KB
-                    self.kb_graph.update_vertex(soft)
+            # to immediatly integrate these missing entities, we retrieve them online (batched requests for the page)
+            # and merge them
+            entities = self.get_wikidata_fetcher().fetch([ entity_id for _, entity_id in to_complete ])
+            for soft, entity_id in to_complete:
+                entity_json = entities.get(entity_id)
+                if entity_json != None:
+                    soft = self.aggregate_with_merge(soft, entity_json)
+
+                # finally update the software entity in the KB
+                self.kb_graph.update_vertex(soft)
 
         # update entity list
-        with open("data/resources/software.wikidata.entities2", "wt") as fp:
-            for wikipedia_entity_id in software_list:
-                fp.write(wikipedia_entity_id)
-                fp.write("\n")
+        software_list.save(entity_set_path("software") + "2")
 
     def get_summary(self, wikidata_id):
         nerd_url = self.config["entity-fishing"]["entity_fishing_protocol"] + "://" + self.config["entity-fishing"]["entity_fishing_host"]
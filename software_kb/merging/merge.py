@@ -343,4 +343,10 @@ if __name__ == "__main__":
 
     stagingArea = StagingArea(config_path=config_path)
     stagingArea.init_merging_collections()
-    merge(stagingArea)
+    stagingArea.load_merging()
+    try:
+        merge(stagingArea)
+    finally:
+        # the merging decisions are written at the end, in one bulk flush, also the ones made before a failure
+        nb_lists = stagingArea.flush_merging()
+        print("\nmerging lists:", nb_lists)
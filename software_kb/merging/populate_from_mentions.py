@@ -52,8 +52,19 @@ def populate_mentions(stagingArea, source_ref):
         cursor = stagingArea.db.aql.execute(
             'FOR doc IN documents LIMIT ' + str(page_rank*page_size) + ', ' + str(page_size) + ' RETURN doc', ttl=3600
         )
+        page_documents = list(cursor)
+
+        # the references cited in the annotations of the page are converted in one batch beforehand, 
+        # with concurrent DOI lookups
+        cursor_tei = stagingArea.db.aql.execute(
+            'FOR annot IN annotations FILTER annot.document.`$oid` IN @keys FILTER annot.references != null \
+                FOR ref IN annot.references LET reference = DOCUMENT("references", ref.reference_id.`$oid`) \
+                FILTER reference != null RETURN DISTINCT { "_key": reference._key, "tei": reference.tei }', 
+            bind_vars={'keys': [ document['_key'] for document in page_documents ]}, ttl=3600
+        )
+        page_references = stagingArea.convert_tei_references(cursor_tei)
 
-        for document in cursor:
+        for document in page_documents:
             # document as document vertex collection
             local_doc = stagingArea.init_entity_from_template("document", source=source_ref)
             if local_doc is None:
@@ -436,14 +447,18 @@ def populate_mentions(stagingArea, source_ref):
                             referenced_document['_key'] = reference["reference_id"]["$oid"]
                             referenced_document['_id'] = "documents/" + reference["reference_id"]["$oid"]
 
-                            # get the metadata from the mentions database
-                            mention_reference = stagingArea.db.collection('references').get({'_key': reference["reference_id"]["$oid"]})
-                            if mention_reference is None:
-                                logging.warning("warning: reference object indicated in an annotation does not exist, _key: " + reference["reference_id"]["$oid"])
-                                continue
-
-                            # document metadata stays as they are (e.g. full CrossRef record)
-                            referenced_document['metadata'] = stagingArea.tei2json(mention_reference['tei'])
+                            if reference["reference_id"]["$oid"] in page_references:
+                                # document metadata stays as they are (e.g. full CrossRef record)
+                                referenced_document['metadata'] = page_references[reference["reference_id"]["$oid"]]
+                            else:
+                                # get the metadata from the mentions database
+                                mention_reference = stagingArea.db.collection('references').get({'_key': reference["reference_id"]["$oid"]})
+                                if mention_reference is None:
+                                    logging.warning("warning: reference object indicated in an annotation does not exist, _key: " + reference["reference_id"]["$oid"])
+                                    continue
+
+                                # document metadata stays as they are (e.g. full CrossRef record)
+                                referenced_document['metadata'] = stagingArea.tei2json(mention_reference['tei'])
 
                             # DOI index
                             if "DOI" in referenced_document['metadata']:
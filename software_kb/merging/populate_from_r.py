@@ -206,12 +206,15 @@ def populate_r(stagingArea, collection, source_ref):
                         maintainer = None
 
         if "References" in package:
-            for reference in package["References"]:
-                stagingArea.process_reference_block(package["References"], software, source_ref)
-                # this will add "references" relation between the software and the referenced documents
+            # this will add "references" relation between the software and the referenced documents, 
+            # as the reference lookups are completed
+            stagingArea.process_reference_block(package["References"], software, source_ref)
 
         pbar.update(1)
     pbar.close()
+
+    # remaining reference lookups
+    stagingArea.add_resolved_references(wait=True)
         
 def set_dependencies(stagingArea, collection, source_ref):
     # we use an AQL query to avoid limited life of cursor that cannot be changed otherwise
@@ -34,19 +34,24 @@ import sys
 import json
 from arango import ArangoClient
 from software_kb.common.arango_common import CommonArangoDB
-import requests 
+from software_kb.common.web_client import WebClient, default_lru_size, cache_key
+from software_kb.common.reference_resolver import ReferenceResolver, query_signature
+from software_kb.common.tei_converter import tei_to_json, convert_teis
+from software_kb.common.merge_registry import MergeRegistry
+from software_kb.common.bulk_writer import BulkWriter, default_batch_size
 import uuid 
-import hashlib
 from pybtex.database import parse_string
 from pybtex import format_from_string
 import pybtex.errors
 pybtex.errors.set_strict_mode(False)
-from lxml import etree 
 import logging
 import logging.handlers
 
 logging.getLogger("pybtex").propagate = False
 
+# time-to-live in seconds of the cached unresolved reference lookups (30 days)
+default_negative_ttl = 30 * 24 * 3600
+
 class StagingArea(CommonArangoDB):
 
     # vertex collections 
@@ -83,6 +88,21 @@ class StagingArea(CommonArangoDB):
         else:
             self.cache = self.db.collection('cache')
 
+        # shared client for the calls to biblio-glutton, Crossref and Unpaywall
+        web_client_config = {}
+        if "web_client" in self.config and self.config["web_client"] != None:
+            web_client_config = self.config["web_client"]
+        self.web_client = WebClient(cache_collection=self.cache, 
+                                    pool_size=web_client_config.get("pool_size", 10),
+                                    timeout=web_client_config.get("timeout", 30),
+                                    max_retries=web_client_config.get("max_retries", 3),
+                                    lru_size=web_client_config.get("lru_size", default_lru_size))
+
+        # reference lookups run concurrently (max_concurrency should not exceed the pool size)
+        self.reference_resolver = ReferenceResolver(self.biblio_glutton_lookup, max_workers=web_client_config.get("max_concurrency", 8))
+        # signature of the looked up references -> _id of the created document, None if not resolved
+        self.reference_documents = {}
+
         if self.db.has_graph(self.graph_name):
             self.staging_graph = self.db.graph(self.graph_name)
         else:
@@ -185,6 +205,8 @@ class StagingArea(CommonArangoDB):
             self.funding = self.staging_graph.edge_collection('funding')
 
         self.init_merging_collections()
+        # merging decisions, kept in memory until flush_merging()
+        self.merge_registry = MergeRegistry()
 
     def reset(self):
         # edge collections
@@ -305,7 +327,7 @@ class StagingArea(CommonArangoDB):
         if self.staging_graph.has_vertex_collection('merging_entities'):
             self.staging_graph.delete_vertex_collection('merging_entities', purge=True)
 
-        self.merging_list = self.staging_graph.create_vertex_collection('merging_lists')
+        self.merging_lists = self.staging_graph.create_vertex_collection('merging_lists')
         self.merging_entities = self.staging_graph.create_vertex_collection('merging_entities')
 
     def init_entity_from_template(self, template="software", source=None):
@@ -334,30 +356,48 @@ class StagingArea(CommonArangoDB):
         if available, return the full agregated biblio_glutton record
         If it's not woring, we use crossref API as fallback, with the idea of covering possible coverage gap in biblio-glutton. 
 
-        The query and result are not cached. 
+        Each call of the cascade is cached by the web client, and the final outcome is cached too under a key 
+        combining all the input identifiers, so that a repeated lookup costs a single cache probe. Unresolved 
+        lookups are cached for negative_ttl seconds (biblio-glutton config), unless a service could not be reached.
+        Once an unresolved outcome has expired, the services are called again without the cache of each call.
         """
+        lookup_params = { "doi": doi, "pmcid": pmcid, "pmid": pmid, "istex_id": istex_id, "raw_ref": raw_ref, 
+            "title": title, "first_author_last_name": first_author_last_name }
+        lookup_key = cache_key("biblio_glutton_lookup", params={ key: value for key, value in lookup_params.items() if value is not None })
+        found, jsonResult, expired = self.web_client.get_value(lookup_key)
+        if found:
+            return jsonResult
+        # the cached responses of the calls are as old as the expired outcome
+        use_cache = not expired
+
         biblio_glutton_url = _biblio_glutton_url(self.config['biblio-glutton']["biblio_glutton_protocol"], self.config['biblio-glutton']["biblio_glutton_host"], self.config['biblio-glutton']["biblio_glutton_port"])
         success = False
         jsonResult = None
+        # status None means that the service could not be reached, the outcome is then not definitive
+        statuses = []
 
         # we first call biblio-glutton with "strong" identifiers
         if doi is not None and len(doi)>0:
-            the_result, success, _ = self.access_web_api_get(biblio_glutton_url, params={'doi': doi})
+            the_result, success, status = self.access_web_api_get(biblio_glutton_url, params={'doi': doi}, use_cache=use_cache)
+            statuses.append(status)
             if success:
                 jsonResult = the_result
 
         if not success and pmid is not None and len(pmid)>0:
-            the_result, success, _ = self.access_web_api_get(biblio_glutton_url, params={'pmid': pmid})
+            the_result, success, status = self.access_web_api_get(biblio_glutton_url, params={'pmid': pmid}, use_cache=use_cache)
+            statuses.append(status)
             if success:
                 jsonResult = the_result  
 
         if not success and pmcid is not None and len(pmcid)>0:
-            the_result, success, _ = self.access_web_api_get(biblio_glutton_url, params={'pmc': pmcid})
+            the_result, success, status = self.access_web_api_get(biblio_glutton_url, params={'pmc': pmcid}, use_cache=use_cache)
+            statuses.append(status)
             if success:
                 jsonResult = the_result
 
         if not success and istex_id is not None and len(istex_id)>0:
-            the_result, success, _ = self.access_web_api_get(biblio_glutton_url, params={'istexid': istex_id})
+            the_result, success, status = self.access_web_api_get(biblio_glutton_url, params={'istexid': istex_id}, use_cache=use_cache)
+            statuses.append(status)
             if success:
                 jsonResult = the_result
         
@@ -366,7 +406,8 @@ class StagingArea(CommonArangoDB):
             # https://api.crossref.org/works/10.1037/0003-066X.59.1.29
             user_agent = {'User-agent': 'Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:68.0) Gecko/20100101 Firefox/68.0 (mailto:' 
                 + self.config['crossref']['crossref_email'] + ')'} 
-            the_result, success, _ = self.access_web_api_get(self.config['crossref']['crossref_base']+"/works/"+doi, headers=user_agent)
+            the_result, success, status = self.access_web_api_get(self.config['crossref']['crossref_base']+"/works/"+doi, headers=user_agent, use_cache=use_cache)
+            statuses.append(status)
             if success:
                 jsonResult = the_result['message']
 
@@ -374,27 +415,35 @@ class StagingArea(CommonArangoDB):
             if raw_ref != None:
                 # call to biblio-glutton with combined raw ref, title and last author first name
                 params = {"biblio": raw_ref, "atitle": title, "firstAuthor": first_author_last_name}
-                the_result, success, _ = self.access_web_api_get(biblio_glutton_url, params=params)
+                the_result, success, status = self.access_web_api_get(biblio_glutton_url, params=params, use_cache=use_cache)
+                statuses.append(status)
                 if success:
                     jsonResult = the_result
             else:
                 # call to biblio-glutton with only title and last author first name
                 params = {"atitle": title, "firstAuthor": first_author_last_name}
-                the_result, success, _ = self.access_web_api_get(biblio_glutton_url, params=params)
+                the_result, success, status = self.access_web_api_get(biblio_glutton_url, params=params, use_cache=use_cache)
+                statuses.append(status)
                 if success:
                     jsonResult = the_result
 
         if not success and raw_ref != None:
             # call to biblio-glutton with only raw ref
             params = {"biblio": raw_ref, "postValidate": "true"}
-            the_result, success, _ = self.access_web_api_get(biblio_glutton_url, data=params)
+            the_result, success, status = self.access_web_api_get(biblio_glutton_url, data=params, use_cache=use_cache)
+            statuses.append(status)
             if success:
                 jsonResult = the_result
 
-        # filter out references if present
+        # filter out references if present (the result is shared with the web client cache, so not modified in place)
         if jsonResult != None:
             if "reference" in jsonResult:
-                del jsonResult["reference"]
+                jsonResult = { key: value for key, value in jsonResult.items() if key != "reference" }
+
+        if jsonResult != None:
+            self.web_client.put_value(lookup_key, jsonResult)
+        elif not None in statuses:
+            self.web_client.put_value(lookup_key, None, ttl=self.config['biblio-glutton'].get("negative_ttl", default_negative_ttl))
 
         return jsonResult
 
@@ -426,6 +475,24 @@ class StagingArea(CommonArangoDB):
         '''
         Process the raw and bibtex references in a reference json list to create fully parsed 
         representations with DOI/PMID/PMCID resolution
+
+        The lookups are submitted to the reference resolver and run concurrently, the document entries
+        and reference relations are created when the lookups are completed: add_resolved_references(wait=True) 
+        must be called at the end of the population to process the remaining ones. 
+        '''
+        for query in self.reference_queries(references_block):
+            signature = query_signature(query)
+            if signature in self.reference_documents:
+                # same reference already looked up in this run
+                if self.reference_documents[signature] != None:
+                    self.add_reference_relation(entity['_id'], entity['_key'], self.reference_documents[signature], source_ref)
+                continue
+            self.reference_resolver.submit(query, context=(entity['_id'], entity['_key'], source_ref))
+        self.add_resolved_references()
+
+    def reference_queries(self, references_block):
+        '''
+        Return the biblio-glutton lookup arguments for the raw and bibtex references in a reference json list
         '''
         has_bibtex = False
         # if we have bibtex entries
@@ -436,10 +503,9 @@ class StagingArea(CommonArangoDB):
 
         # signature for the processed strings, to avoid processing duplicated entries
         signatures = []
+        queries = []
 
         for reference in references_block:
-            glutton_biblio = None
-
             if "bibtex" in reference:
                 bibtex_str = reference["bibtex"]
                 local_signature =  ''.join(e for e in bibtex_str if e.isalnum())
@@ -492,9 +558,9 @@ class StagingArea(CommonArangoDB):
                         res_format_ref = res_format_ref.replace("}", "")
 
                         # we can call biblio-glutton with the available information
-                        glutton_biblio = self.biblio_glutton_lookup(raw_ref=res_format_ref, title=local_title, first_author_last_name=first_author_last_name)
+                        queries.append({"raw_ref": res_format_ref, "title": local_title, "first_author_last_name": first_author_last_name})
 
-            if "raw" in reference and glutton_biblio == None and not has_bibtex:
+            elif "raw" in reference and not has_bibtex:
                 # this can be sent to biblio-glutton
                 res_format_ref = reference["raw"]
                 local_signature =  ''.join(e for e in res_format_ref if e.isalnum())
@@ -504,52 +570,77 @@ class StagingArea(CommonArangoDB):
                 else:
                     signatures.append(local_signature)
 
-                glutton_biblio = stagingArea.biblio_glutton_lookup(raw_ref=reference["raw"])
-
-            if glutton_biblio != None:
-                # we can create a document entry for the referenced document, 
-                # and a reference relation between the given entity and this document
-                local_id = self.get_uid()
-                local_doc = self.init_entity_from_template("document", source=source_ref)
-                if local_doc is None:
-                    raise("cannot init document entity from default template")
-
-                local_doc['_key'] = local_id
-                local_doc['_id'] = "documents/" + local_id
-
-                # document metadata stays as they are (e.g. full CrossRef record)
-                local_doc['metadata'] = glutton_biblio
-
-                # doi index
-                if "DOI" in glutton_biblio:
-                    local_doc["index_doi"] = glutton_biblio["DOI"].lower()
-
-                # title/first author last name index
-                if "title" in glutton_biblio and 'author' in glutton_biblio:
-                    local_key = self.title_author_key(glutton_biblio["title"], glutton_biblio['author'])
-                    if local_key != None:
-                        local_doc["index_title_author"] = local_key
-                                
-
-                if not self.staging_graph.has_vertex(local_doc["_id"]):
-                    self.staging_graph.insert_vertex("documents", local_doc)
-
-                relation = {}
-                relation["claims"] = {}
-                # "P2860" property "cites work "
-                relation["claims"]["P2860"] = []
-                local_value = {}
-                local_value["references"] = []
-                local_value["references"].append(source_ref)
-                relation["claims"]["P2860"].append(local_value)
-
-                relation["_from"] = entity['_id']
-                relation["_to"] = local_doc['_id']
-
-                relation["_key"] = entity["_key"] + "_" + local_doc['_key']
-                relation["_id"] = "references/" + relation["_key"]
-                if not self.staging_graph.has_edge(relation["_id"]):
-                    self.staging_graph.insert_edge("references", edge=relation)
+                queries.append({"raw_ref": res_format_ref})
+
+        return queries
+
+    def add_resolved_references(self, wait=False):
+        '''
+        Create the document entries and reference relations for the completed reference lookups, 
+        with wait, for all the submitted lookups
+        '''
+        for signature, (entity_id, entity_key, source_ref), glutton_biblio in self.reference_resolver.completed(wait=wait):
+            if signature in self.reference_documents:
+                # same reference resolved meanwhile for another entity, we reuse its document entry
+                document_id = self.reference_documents[signature]
+            else:
+                document_id = None
+                if glutton_biblio != None:
+                    document_id = self.add_reference_document(glutton_biblio, source_ref)
+                self.reference_documents[signature] = document_id
+
+            if document_id != None:
+                self.add_reference_relation(entity_id, entity_key, document_id, source_ref)
+
+    def add_reference_relation(self, entity_id, entity_key, document_id, source_ref):
+        '''
+        Reference relation between the given entity and a referenced document
+        '''
+        relation = {}
+        relation["claims"] = {}
+        # "P2860" property "cites work "
+        relation["claims"]["P2860"] = []
+        local_value = {}
+        local_value["references"] = []
+        local_value["references"].append(source_ref)
+        relation["claims"]["P2860"].append(local_value)
+
+        relation["_from"] = entity_id
+        relation["_to"] = document_id
+
+        relation["_key"] = entity_key + "_" + document_id.replace("documents/", "")
+        relation["_id"] = "references/" + relation["_key"]
+        if not self.staging_graph.has_edge(relation["_id"]):
+            self.staging_graph.insert_edge("references", edge=relation)
+
+    def add_reference_document(self, glutton_biblio, source_ref):
+        '''
+        Create a document entry for a referenced document, return its _id
+        '''
+        local_id = self.get_uid()
+        local_doc = self.init_entity_from_template("document", source=source_ref)
+        if local_doc is None:
+            raise("cannot init document entity from default template")
+
+        local_doc['_key'] = local_id
+        local_doc['_id'] = "documents/" + local_id
+
+        # document metadata stays as they are (e.g. full CrossRef record)
+        local_doc['metadata'] = glutton_biblio
+
+        # doi index
+        if "DOI" in glutton_biblio:
+            local_doc["index_doi"] = glutton_biblio["DOI"].lower()
+
+        # title/first author last name index
+        if "title" in glutton_biblio and 'author' in glutton_biblio:
+            local_key = self.title_author_key(glutton_biblio["title"], glutton_biblio['author'])
+            if local_key != None:
+                local_doc["index_title_author"] = local_key
+
+        if not self.staging_graph.has_vertex(local_doc["_id"]):
+            self.staging_graph.insert_vertex("documents", local_doc)
+        return local_doc['_id']
 
     def get_uid(self):
         local_id = uuid.uuid4().hex
@@ -559,195 +650,52 @@ class StagingArea(CommonArangoDB):
 
     def access_web_api_get(self, url, params=None, data=None, headers=None, use_cache=True, json_content=True):
         '''
-        This is a simple GET cached call to a given web service, with response content as JSON or text only
+        This is a simple GET cached call to a given web service, with response content as JSON or text only.
+        The calls share a pooled session, with an in-memory LRU in front of the cache collection (see web_client.py).
         '''
-        response_data = None
-        response_doc = None
-        final_key = None
-
-        if use_cache:
-            # check if cached
-            local_key = url
-            if params != None:
-                for param_key, param_value in params.items():
-                    local_key += "_" + param_key + "_" + param_value
-            if data != None:
-                for param_key, param_value in data.items():
-                    local_key += "_" + param_key + "_" + param_value
-
-            hash_object = hashlib.md5(local_key.encode())
-            final_key = hash_object.hexdigest()
-
-            response_doc = self.cache.get({'_key': final_key})
-
-        if response_doc is None:
-            # not cached, web access
-            if params != None and len(params) > 0:
-                response = requests.get(url, params=params, headers=headers)
-            elif data != None and len(data) > 0:
-                response = requests.get(url, data=data, headers=headers)
-            else:
-                response = requests.get(url, headers=headers)
-
-            status = response.status_code
-            success = (status == 200)
-            if success and json_content:
-                response_data = response.json()
-            elif success:
-                response_data = response.text
-
-            if use_cache and final_key != None:
-                # cache the result for next time
-                local_doc = {}
-                local_doc["data"] = response_data
-                local_doc["success"] = success
-                local_doc["status"] = status
-                local_doc["_key"] = final_key
-                local_doc["_id"] = "cache/" + final_key
-                self.cache.insert(local_doc)
-        else:
-            success = response_doc["success"]
-            status = response_doc["status"]
-            response_data = response_doc["data"]
+        return self.web_client.get(url, params=params, data=data, headers=headers, use_cache=use_cache, json_content=json_content)
 
-        return response_data, success, status
+    def convert_tei_references(self, references, pool=None):
+        '''
+        Convert a list of bibliographical references in TEI (dict with _key and tei) in one batch, with a 
+        multiprocessing pool if given, and resolve the ones with a DOI via concurrent lookups. Return a 
+        dict _key -> JSON metadata, as given by tei2json(), without the invalid TEI.
+        '''
+        keys = []
+        teis = []
+        for reference in references:
+            keys.append(reference["_key"])
+            teis.append(reference["tei"])
+        json_bibs = convert_teis(teis, pool=pool)
+
+        queries = []
+        for json_bib in json_bibs:
+            if json_bib != None and 'DOI' in json_bib and len(json_bib['DOI']) > 0:
+                queries.append({"doi": json_bib['DOI']})
+        self.reference_resolver.prefetch(queries)
+
+        # the lookups of resolve_tei_json() are now served by the web client cache
+        results = {}
+        for key, json_bib in zip(keys, json_bibs):
+            if json_bib != None:
+                results[key] = self.resolve_tei_json(json_bib)
+        return results
 
     def tei2json(self, tei):
         '''
-        Transform a bibliographical reference in TEI into JSON, similar to CrossRef JSON format (but simplified)
+        Transform a bibliographical reference in TEI into JSON, similar to CrossRef JSON format (but simplified),
+        see tei_converter.py. If the reference has a DOI, the CrossRef entry is used instead. 
+        '''
+        return self.resolve_tei_json(tei_to_json(tei))
+
+    def resolve_tei_json(self, json_bib):
+        '''
+        If we have a DOI, we get the CrossRef entry directly, otherwise the JSON converted from TEI is kept
         '''
-        json_bib = {}
-        root = etree.fromstring(tei)
-
-        # xpaths
-        x_title = '/biblStruct/analytic/title[@level="a"]'
-        x_doi = '/biblStruct/analytic/idno[@type="DOI"]' 
-        x_pmid = '/biblStruct/analytic/idno[@type="PMID"]'
-        x_pmcid = '/biblStruct/analytic/idno[@type="PMCID"]'
-        x_oa_link = '/biblStruct/analytic/ptr[@type="open-access"]/@target'
-
-        x_publisher = '/biblStruct/monogr/imprint/publisher'
-        x_journal = '/biblStruct/monogr/title[@level="j"]'
-        x_monograph = '/biblStruct/monogr/title[@level="m"]'
-
-        x_volume = '/biblStruct/monogr/imprint/biblScope[@unit="volume"]'
-        x_issue = '/biblStruct/monogr/imprint/biblScope[@unit="issue"]'
-        x_page_from = '/biblStruct/monogr/imprint/biblScope[@unit="page"]/@from'
-        x_page_to = '/biblStruct/monogr/imprint/biblScope[@unit="page"]/@to'
-        x_pages = '/biblStruct/monogr/imprint/biblScope[@unit="page"]'
-        x_issn = '/biblStruct/monogr/idno[@type="ISSN"]'
-        x_isbn = '/biblStruct/monogr/idno[@type="ISBN"]'
-
-        x_date = '/biblStruct/monogr/imprint/date[@type="published"]'
-        x_url = '/biblStruct/analytic/ptr[not(@type)]'
-
-        x_meeting_title = '/biblStruct/monogr/meeting/title'
-        x_meeting_place = '/biblStruct/monogr/meeting/placeName'
-        x_meeting_start = '/biblStruct/monogr/meeting/date[@type="conferenceStartDate"]'
-        x_meeting_end = '/biblStruct/monogr/meeting/date[@type="conferenceEndDate"]' 
-
-        # authorship
-        x_author_persons = '/biblStruct/analytic/author/persName'
-
-        local_doi = _get_first_value_xpath(root, x_doi)
-        if local_doi != None:
-            json_bib['DOI'] = local_doi
-
-        # if we have a DOI, we get the CrossRef entry directly
         if 'DOI' in json_bib and json_bib['DOI'] is not None and len(json_bib['DOI']) >0:
             result_glutton = self.biblio_glutton_lookup(doi=json_bib['DOI'])
             if result_glutton != None:
                 return result_glutton
-
-        local_pmid = _get_first_value_xpath(root, x_pmid)
-        if local_pmid != None:
-            json_bib["pmid"] = local_pmid
-        
-        local_pmcid = _get_first_value_xpath(root, x_pmcid)
-        if local_pmcid != None:
-            json_bib["pmcid"] = local_pmcid 
-
-        local_url = _get_first_value_xpath(root, x_url)
-        if local_url != None:
-            json_bib['URL'] = local_url
-
-        json_bib['author'] = _get_all_values_authors_xpath(root, x_author_persons)
-
-        local_volume = _get_first_value_xpath(root, x_volume)
-        if local_volume != None:
-            json_bib["volume"] = local_volume
-        local_issn = _get_first_value_xpath(root, x_issn)
-        if local_issn != None:
-            json_bib["ISSN"] = local_issn
-        local_isbn = _get_first_value_xpath(root, x_isbn)
-        if local_isbn != None:
-            json_bib["ISBN"] = local_isbn
-        local_issue = _get_first_value_xpath(root, x_issue)
-        if local_issue != None:
-            json_bib["issue"] = local_issue
-
-        local_oa_link = _get_first_attribute_value_xpath(root, x_oa_link)
-        if local_oa_link != None:
-            json_bib["oaLink"] = local_oa_link
-
-        json_bib["title"] = []
-        local_title = _get_first_value_xpath(root, x_title)
-        if local_title != None:
-            json_bib["title"].append(local_title)
-        local_publisher = _get_first_value_xpath(root, x_publisher) 
-        if local_publisher != None:
-            json_bib["publisher"] = local_publisher
-
-        # date has a strange structure in crossref... we also store the standard ISO 8601 format which is much easier to work with and clear  
-        local_date = _get_date_xpath(root, x_date)
-        if local_date != None:
-            json_bib["date"] = local_date
-
-            parts = []
-            date_parts = local_date.split("-")
-            if len(date_parts) > 0:
-                # year
-                parts.append(date_parts[0])
-            if len(date_parts) > 1:
-                # month
-                parts.append(date_parts[1])
-            if len(date_parts) > 2:
-                # day
-                parts.append(date_parts[2])    
-
-            json_bib["published-online"] = { "date-parts": [ parts ] }    
-            ''' format is:
-            "published-online": {
-              "date-parts": [
-                [
-                  2014,
-                  9,
-                  8
-                ]
-              ]
-            },
-            '''
-        page_from = _get_first_attribute_value_xpath(root, x_page_from)
-        page_to =  _get_first_attribute_value_xpath(root, x_page_to)
-        if page_from is not None and page_to is not None:
-            json_bib["page"] = page_from + '-' + page_to
-        else:
-            local_page_range = _get_first_value_xpath(root, x_pages)
-            if local_page_range != None:
-                json_bib["page"] = local_page_range
-
-        json_bib["container-title"] = []
-        title_journal = _get_first_value_xpath(root, x_journal)
-        if title_journal != None and len(title_journal) > 0:
-            json_bib["container-title"].append(title_journal)
-        title_monograph = _get_first_value_xpath(root, x_monograph)
-        if title_monograph != None and len(title_monograph) > 0:
-            json_bib["container-title"].append(title_monograph)
-
-        event_title = _get_first_value_xpath(root, x_meeting_title)
-        if event_title != None and len(event_title) > 0:
-            json_bib["event"] = { "name": event_title } 
-
         return json_bib
 
     def wiki_biblio2json(self, entity):
@@ -901,179 +849,55 @@ class StagingArea(CommonArangoDB):
         Store a merging decision:
         - create or extend the merging list related to the entities
         - index the merging list for the two entities   
+
+        The decisions are kept in memory in the merge registry (see merge_registry.py) and written in
+        the merging_lists and merging_entities collections by flush_merging(). 
         '''
+        return self.merge_registry.union(entity1['_id'], entity2['_id'])
 
-        # check if merging_entities and merging_lists collections exist, if not create them
+    def load_merging(self):
         '''
-        if not self.staging_graph.has_vertex_collection('merging_entities'):
-            self.merging_entities = self.staging_graph.create_vertex_collection('merging_entities')
-        else:
-            self.merging_entities = self.staging_graph.vertex_collection('merging_entities')
+        Load in the merge registry the merging lists already stored in the staging area, so that the new 
+        decisions extend them
+        '''
+        cursor = self.db.aql.execute('FOR doc IN merging_lists RETURN doc', batch_size=10000, stream=True, ttl=3600)
+        for merging_list_item in cursor:
+            self.merge_registry.load(merging_list_item['_key'], merging_list_item['data'])
 
-        if not self.staging_graph.has_vertex_collection('merging_lists'):
-            self.merging_lists = self.staging_graph.create_vertex_collection('merging_lists')
-        else:
-            self.merging_lists = self.staging_graph.vertex_collection('merging_lists')
+    def flush_merging(self):
         '''
-        
-        # do we have a merging list for one of these entities?
-        merging_list1_id = None
-        if self.staging_graph.has_vertex("merging_entities/" + entity1['_key']):
-            merging_list1_item = self.merging_entities.get("merging_entities/" + entity1['_key'])
-            merging_list1_id = merging_list1_item['list_id']
-
-        merging_list2_id = None    
-        if self.staging_graph.has_vertex("merging_entities/" + entity2['_key']):
-            merging_list2_item = self.merging_entities.get("merging_entities/" + entity2['_key'])
-            merging_list2_id = merging_list2_item['list_id']
-
-        if merging_list1_id != None and merging_list2_id != None and merging_list1_id == merging_list2_id:
-            # entities already registered for merging, nothing to do...
-            return True
-
-        #print(merging_list1_id, merging_list2_id)
-
-        # get the corresponding lists
-        merging_list1 = None
-        if merging_list1_id != None and self.staging_graph.has_vertex(merging_list1_id):
-            merging_list1_item = self.merging_lists.get(merging_list1_id)
-            merging_list1 = merging_list1_item['data']
-
-        merging_list2 = None
-        if merging_list2_id != None and self.staging_graph.has_vertex(merging_list2_id):
-            merging_list2_item = self.merging_lists.get(merging_list2_id)
-            merging_list2 = merging_list2_item['data']
-        
-        if merging_list1 != None and merging_list2 != None:
-            # merge the second list into the first one
-            for local_entity_id in merging_list2:
-                if not local_entity_id in merging_list1:
-                    merging_list1.append(local_entity_id)
-            merging_list1_item['data'] = merging_list1
-
-            # update first list 
-            self.staging_graph.update_vertex(merging_list1_item)
-
-            # update index for all the entities of the second list
-            for local_id in merging_list2:
-                entity_item = self.merging_entities.get(_project_entity_id_collection(local_id, "merging_entities"))
-                entity_item['list_id'] = merging_list1_item['_id']
-                entity_item['collection'] = _get_collection_name(local_id)
-                self.staging_graph.update_vertex(entity_item)
-
-            # remove second list
-            self.staging_graph.delete_vertex(merging_list2_item['_id'])
-
-        if merging_list1 != None and merging_list2 == None:
-            # add entity2 into the first list
-            if entity2['_id'] not in merging_list1:
-                merging_list1.append(entity2['_id'])
-            merging_list1_item['data'] = merging_list1
-
-            # update first list
-            self.staging_graph.update_vertex(merging_list1_item)
-
-            # update index for entity2
-            entity2_item = {}
-            entity2_item['_key'] = entity2['_key']
-            entity2_item['_id'] = "merging_entities/" + entity2['_key']
-            entity2_item['list_id'] = merging_list1_item["_id"]
-            entity2_item['collection'] = _get_collection_name(entity2['_id'])
-            self.staging_graph.insert_vertex('merging_entities', entity2_item)
-
-        elif merging_list1 == None and merging_list2 != None:
-            # add entity1 into the second list
-            if not entity1['_id'] in merging_list2:
-                merging_list2.append(entity1['_id'])
-            merging_list2_item['data'] = merging_list2
-
-            # update second list
-            self.staging_graph.update_vertex(merging_list2_item)
-
-            # update index for entity1
-            entity1_item = {}
-            entity1_item['_key'] = entity1['_key']
-            entity1_item['_id'] = "merging_entities/" + entity1['_key']
-            entity1_item['list_id'] = merging_list2_item["_id"]
-            entity1_item['collection'] = _get_collection_name(entity1['_id'])
-            self.staging_graph.insert_vertex('merging_entities', entity1_item)
-
-        elif merging_list1 == None and merging_list2 == None:
-            # create a new list
-            merging_list = []
-            merging_list.append(entity1['_id'])
-            merging_list.append(entity2['_id'])
-            local_id = self.get_uid()
+        Write all the merging decisions of the merge registry in the merging_lists and merging_entities 
+        collections, with bulk imports. Stored documents are replaced and the merged lists are removed 
+        only once everything is written, so a failure during the flush keeps the previous decisions. 
+        The loaded lists only grow, so no entity of merging_entities is removed.
+        '''
+        batch_size = self.config['arangodb'].get('batch_size', default_batch_size)
+        bulk_writer = BulkWriter(batch_size=batch_size, on_duplicate="replace")
+        for list_key, merging_list in self.merge_registry.lists():
+            if list_key is None:
+                list_key = self.get_uid()
             merging_list_item = {}
-            merging_list_item["_key"] = local_id
-            merging_list_item["_id"] = "merging_lists/" + local_id
+            merging_list_item["_key"] = list_key
             merging_list_item['data'] = merging_list
+            bulk_writer.add(self.merging_lists, merging_list_item)
+
+            # index the list for all its entities
+            for local_id in merging_list:
+                entity_item = {}
+                entity_item['_key'] = local_id[local_id.find("/")+1:]
+                entity_item['list_id'] = "merging_lists/" + list_key
+                entity_item['collection'] = _get_collection_name(local_id)
+                bulk_writer.add(self.merging_entities, entity_item)
+        bulk_writer.flush()
+        if bulk_writer.errors > 0:
+            logging.warning("merging decisions not written: " + str(bulk_writer.errors))
+            return len(self.merge_registry)
+
+        stale_keys = list(self.merge_registry.stale_keys())
+        for batch_start in range(0, len(stale_keys), batch_size):
+            self.merging_lists.delete_many(stale_keys[batch_start:batch_start+batch_size])
+        return len(self.merge_registry)
 
-            # insert the new list
-            self.staging_graph.insert_vertex('merging_lists', merging_list_item)
-
-            # update index for the 2 entities
-            entity1_item = {}
-            entity1_item['_key'] = entity1['_key']
-            entity1_item['_id'] = "merging_entities/" + entity1['_key']
-            entity1_item['list_id'] = merging_list_item["_id"]
-            entity1_item['collection'] = _get_collection_name(entity1['_id'])
-            self.staging_graph.insert_vertex('merging_entities', entity1_item)
-
-            entity2_item = {}
-            entity2_item['_key'] = entity2['_key']
-            entity2_item['_id'] = "merging_entities/" + entity2['_key']
-            entity2_item['list_id'] = merging_list_item["_id"]
-            entity2_item['collection'] = _get_collection_name(entity2['_id'])
-            self.staging_graph.insert_vertex('merging_entities', entity2_item)
-
-        return True
-
-
-def _get_first_value_xpath(node, xpath_exp):
-    values = node.xpath(xpath_exp)
-    value = None
-    if values is not None and len(values)>0:
-        value = values[0].text
-    return value
-
-def _get_first_attribute_value_xpath(node, xpath_exp):
-    values = node.xpath(xpath_exp)
-    value = None
-    if values is not None and len(values)>0:
-        value = values[0]
-    return value
-
-def _get_date_xpath(node, xpath_exp):
-    dates = node.xpath(xpath_exp)
-    date = None
-    if dates is not None and len(dates)>0:
-        date = dates[0].get("when")
-    return date
-
-def _get_all_values_authors_xpath(node, xpath_exp):
-    values = node.xpath(xpath_exp)
-    result = []
-    if values is not None and len(values)>0:
-        for val in values:
-            # each val is a person
-            person = {}
-            fornames = val.xpath('./forename')
-            surname = val.xpath('./surname')
-
-            if surname != None and len(surname)>0 and surname[0].text != None:
-                person['family'] = surname[0].text.strip() 
-
-            if fornames != None:
-                for forname in fornames:
-                    if forname.text != None:
-                        if not 'given' in person:
-                            person['given'] = forname.text.strip()
-                        else:
-                            person['given'] += " " + forname.text
-            result.append(person)
-    # family, given - there is no middle name in crossref, it is just concatenated to "given" without any normalization
-    return result
 
 def _project_entity_id_collection(entity_id, collection_name):
     '''
@@ -0,0 +1,63 @@
+'''
+    Shared test fixtures
+
+    stub_server starts local HTTP servers standing in for the external web services: a test only
+    supplies its request handler (a StubHandler subclass) and the initial state of the server, the
+    servers are shut down at the end of the test.
+
+    Usage:
+
+        def test_service(stub_server):
+            server = stub_server(MyHandler, nb_failures=2)
+            url = "http://127.0.0.1:" + str(server.server_port)
+
+    The test modules run as scripts use stub_servers() the same way:
+
+        with stub_servers() as stub_server:
+            test_service(stub_server)
+'''
+
+import threading
+import contextlib
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+class StubHandler(BaseHTTPRequestHandler):
+    '''
+    Base request handler of the stub servers, without request logging
+    '''
+    def log_message(self, format, *args):
+        pass
+
+def start_stub_server(handler, **state):
+    '''
+    Start a server on a free local port, the received requests are recorded in server.requests by
+    the handler and the given keyword arguments are set as attributes of the server
+    '''
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    server.requests = []
+    for name, value in state.items():
+        setattr(server, name, value)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+@contextlib.contextmanager
+def stub_servers():
+    servers = []
+    def start(handler, **state):
+        server = start_stub_server(handler, **state)
+        servers.append(server)
+        return server
+    try:
+        yield start
+    finally:
+        for server in servers:
+            server.shutdown()
+            server.server_close()
+
+@pytest.fixture
+def stub_server():
+    with stub_servers() as start:
+        yield start
@@ -0,0 +1,47 @@
+import time
+import httpx
+
+from software_kb.importing.async_fetcher import AsyncFetcher
+
+def test_fetch_all():
+    attempts = {}
+    def handler(request):
+        url = str(request.url)
+        attempts[url] = attempts.get(url, 0) + 1
+        # the first request to /flaky fails
+        if request.url.path == "/flaky" and attempts[url] == 1:
+            return httpx.Response(503)
+        if request.url.path == "/missing":
+            return httpx.Response(404)
+        return httpx.Response(200, json={ "path": request.url.path })
+
+    fetcher = AsyncFetcher(max_connections=4, requests_per_second=1000, burst=10, backoff=0.01, transport=httpx.MockTransport(handler))
+    urls = [ "http://cran.test/package" + str(rank) for rank in range(20) ] + ["http://cran.test/flaky", "http://cran.test/missing"]
+    responses = fetcher.fetch_all(urls)
+    # responses in the order of the requests
+    assert [ response.json()["path"] for response in responses[:21] ] == [ "/package" + str(rank) for rank in range(20) ] + ["/flaky"]
+    assert attempts["http://cran.test/flaky"] == 2
+    # client errors are not retried
+    assert responses[21].status_code == 404
+    assert attempts["http://cran.test/missing"] == 1
+    fetcher.close()
+
+def test_rate_limit():
+    def handler(request):
+        return httpx.Response(200, text="ok")
+
+    fetcher = AsyncFetcher(max_connections=8, requests_per_second=20, burst=1, transport=httpx.MockTransport(handler))
+    start = time.time()
+    # 11 requests to the same host: one immediately, then 10 at 20 requests per second
+    fetcher.fetch_all([ "http://cran.test/" + str(rank) for rank in range(11) ])
+    assert time.time() - start >= 0.45
+
+    # another host has its own bucket
+    start = time.time()
+    fetcher.fetch_all([ "http://ropensci.test/", "http://github.test/" ])
+    assert time.time() - start < 0.2
+    fetcher.close()
+
+if __name__ == "__main__":
+    test_fetch_all()
+    test_rate_limit()
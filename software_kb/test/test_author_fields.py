@@ -0,0 +1,86 @@
+import os
+import re
+import json
+import multiprocessing
+
+from software_kb.importing.import_common import process_r_author_field, process_author_field, process_r_author_fields, process_author_fields
+
+resources_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "resources")
+
+def load_expected():
+    '''
+    samples of test_field_processing.py with the persons produced by the former find/slice parsers
+    (see software_kb/benchmark/author_fields.py), the Authors@R persons are normalized
+    '''
+    with open(os.path.join(resources_path, "author_fields_expected.json")) as the_file:
+        return json.load(the_file)
+
+# additional fields where the former parsers fail: no space between the arguments, person( in a comment,
+# persons not separated by "]," or "),"
+extra_r_author_fields = [ 'c(person("Ada", "Lovelace", role = c("aut","cre"),email="ada@example.org",comment=c(ORCID="0000-0001-2345-678X")),person("Charles","Babbage",role="ctb"))',
+                          "person('Grace', 'Hopper', role = 'aut', comment = 'see person(\"x\") in the docs')",
+                          'c(person(given = c("Mary", "Ann"), family = "Smith", role = "aut"),\nperson("R Core Team", role = "cph"))',
+                          'person(given = "Foo", family = "Bar", email = NULL, role = c("aut"))'
+                        ]
+
+extra_author_fields = [ 'Ada Lovelace [aut, cre] (<https://orcid.org/0000-0001-2345-678X>), Charles Babbage [ctb]',
+                        'R Core Team [cph] (the code of (some) functions), Foo Inc.',
+                        'Jane Doe, John Doe and Bob',
+                        'Single Author'
+                      ]
+
+def _normalize_value(value):
+    # the former parser could leave quotes and parenthesis in the vector elements
+    if isinstance(value, list):
+        return [ re.sub(r'["()]', '', val).strip() for val in value ]
+    return value
+
+def normalize_persons(persons):
+    return [ { key: _normalize_value(value) for key, value in person.items() } for person in persons ]
+
+def test_r_author_field_equivalence():
+    for case in load_expected():
+        if case["type"] == "Authors@R":
+            assert normalize_persons(process_r_author_field(case["field"])) == case["persons"]
+
+    # person( inside a string is not a new person
+    persons = process_r_author_field(extra_r_author_fields[1])
+    assert len(persons) == 1
+    assert persons[0] == { "given": "Grace Hopper", "role": "aut", "comment": 'see person("x") in the docs' }
+
+    persons = process_r_author_field(extra_r_author_fields[0])
+    assert persons[0]["orcid"] == "0000-0001-2345-678X"
+    assert persons[0]["comment"] == ["ORCID = 0000-0001-2345-678X"]
+    assert persons[1] == { "given": "Charles Babbage", "role": "ctb" }
+
+def test_author_field_equivalence():
+    for case in load_expected():
+        if case["type"] == "Author":
+            assert process_author_field(case["field"]) == case["persons"]
+
+    persons = process_author_field(extra_author_fields[0])
+    assert persons[0]["roles"] == ["aut", "cre"]
+    assert persons[1] == { "roles": ["ctb"], "full_name": "Charles Babbage" }
+
+    persons = process_author_field(extra_author_fields[1])
+    assert persons[0]["comment"] == "the code of (some) functions"
+    assert persons[1] == { "full_name": "Foo Inc" }
+
+    # the former parser lost the annotations of the last name of a comma separated list
+    persons = process_author_field("Jane Doe, John Doe [aut] (<https://orcid.org/0000-0001-2345-678X>)")
+    assert persons[1] == { "orcid": "0000-0001-2345-678X", "roles": ["aut"], "comment": "<https://orcid.org/0000-0001-2345-678X>", "full_name": "John Doe" }
+
+def test_batch_parsing():
+    r_author_fields = [ case["field"] for case in load_expected() if case["type"] == "Authors@R" ]
+    author_fields = [ case["field"] for case in load_expected() if case["type"] == "Author" ]
+    fields = author_fields + [ None ] + extra_author_fields
+    expected = [ process_author_field(field) if field is not None else None for field in fields ]
+    assert process_author_fields(fields) == expected
+    with multiprocessing.Pool(2) as pool:
+        assert process_author_fields(fields, pool=pool, chunksize=2) == expected
+        assert process_r_author_fields(r_author_fields, pool=pool) == [ process_r_author_field(field) for field in r_author_fields ]
+
+if __name__ == "__main__":
+    test_r_author_field_equivalence()
+    test_author_field_equivalence()
+    test_batch_parsing()
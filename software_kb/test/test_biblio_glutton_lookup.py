@@ -0,0 +1,92 @@
+import json
+from urllib.parse import urlparse, parse_qs
+
+from software_kb.common.web_client import WebClient
+from software_kb.merging.populate_staging_area import StagingArea
+from software_kb.test.test_web_client import DictCollection
+from software_kb.test.conftest import StubHandler, stub_servers
+
+class StubGluttonHandler(StubHandler):
+    '''
+    Local biblio-glutton and Crossref, only the DOI 10.1/found and the PMID 1 are matched, everything
+    else is a 404
+    '''
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        body = None
+        if url.path == "/service/lookup" and (query.get("doi") == ["10.1/found"] or query.get("pmid") == ["1"]):
+            body = json.dumps({ "DOI": "10.1/found", "title": ["Found"], "reference": [ {"key": "ref1"} ] }).encode("utf-8")
+        if body is None:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+def init_staging_area(port, negative_ttl=3600):
+    # no ArangoDB here, only what the lookup needs
+    stagingArea = StagingArea.__new__(StagingArea)
+    stagingArea.config = { "biblio-glutton": { "biblio_glutton_protocol": "http", "biblio_glutton_host": "127.0.0.1",
+                                                "biblio_glutton_port": port, "negative_ttl": negative_ttl },
+                           "crossref": { "crossref_base": "http://127.0.0.1:" + str(port), "crossref_email": "test@example.org" } }
+    stagingArea.web_client = WebClient(cache_collection=DictCollection(), max_retries=0, sleep=lambda delay: None)
+    return stagingArea
+
+def test_cascade_cache(stub_server):
+    server = stub_server(StubGluttonHandler)
+    stagingArea = init_staging_area(server.server_port)
+    collection = stagingArea.web_client.cache_collection
+
+    # DOI not found, then the PMID (reference list filtered out)
+    result = stagingArea.biblio_glutton_lookup(doi="10.1/missing", pmid="1")
+    assert result == { "DOI": "10.1/found", "title": ["Found"] }
+    assert len(server.requests) == 2
+
+    # repeated lookup: a single probe, in memory
+    nb_lru_hits = stagingArea.web_client.lru_hits
+    assert stagingArea.biblio_glutton_lookup(doi="10.1/missing", pmid="1") == result
+    assert stagingArea.web_client.lru_hits == nb_lru_hits + 1
+    assert len(server.requests) == 2
+
+    # unresolved outcome is cached too, with an expiry
+    assert stagingArea.biblio_glutton_lookup(raw_ref="Unknown reference", title="Unknown", first_author_last_name="Nobody") is None
+    nb_requests = len(server.requests)
+    nb_get = collection.nb_get
+    assert stagingArea.biblio_glutton_lookup(raw_ref="Unknown reference", title="Unknown", first_author_last_name="Nobody") is None
+    assert len(server.requests) == nb_requests and collection.nb_get == nb_get
+    assert len([ doc for doc in collection.documents.values() if doc.get("expires") is not None ]) == 1
+
+    # new process: one probe of the cache collection
+    stagingArea.web_client = WebClient(cache_collection=collection)
+    assert stagingArea.biblio_glutton_lookup(doi="10.1/missing", pmid="1") == result
+    assert collection.nb_get == nb_get + 1
+    assert len(server.requests) == nb_requests
+
+    # expired unresolved outcome: the services are queried again (DOI and Crossref steps)
+    stagingArea = init_staging_area(server.server_port, negative_ttl=-1)
+    assert stagingArea.biblio_glutton_lookup(doi="10.1/none") is None
+    nb_requests = len(server.requests)
+    nb_lru_hits = stagingArea.web_client.lru_hits
+    assert stagingArea.biblio_glutton_lookup(doi="10.1/none") is None
+    assert stagingArea.web_client.lru_hits == nb_lru_hits
+    assert len(server.requests) == nb_requests + 2
+    assert server.requests[-2:] == [ "/service/lookup?doi=10.1%2Fnone", "/works/10.1/none" ]
+
+def test_unreachable_not_cached():
+    # nothing listens on this port
+    stagingArea = init_staging_area(9)
+    assert stagingArea.biblio_glutton_lookup(doi="10.1/found") is None
+    assert len(stagingArea.web_client.cache_collection.documents) == 0
+
+if __name__ == "__main__":
+    with stub_servers() as stub_server:
+        test_cascade_cache(stub_server)
+    test_unreachable_not_cached()
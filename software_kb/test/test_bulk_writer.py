@@ -0,0 +1,51 @@
+from software_kb.common.bulk_writer import BulkWriter
+
+class FakeCollection(object):
+    '''
+    Minimal stand-in for an ArangoDB collection, with the import_bulk duplicate semantics
+    '''
+    def __init__(self, name):
+        self.name = name
+        self.documents = {}
+        self.nb_requests = 0
+
+    def import_bulk(self, documents, halt_on_error=True, details=True, on_duplicate=None):
+        self.nb_requests += 1
+        result = { "created": 0, "ignored": 0, "errors": 0 }
+        for document in documents:
+            key = document["_key"] if "_key" in document else document["_id"].split("/")[1]
+            if key in self.documents:
+                if on_duplicate == "ignore":
+                    result["ignored"] += 1
+                else:
+                    result["errors"] += 1
+                continue
+            self.documents[key] = document
+            result["created"] += 1
+        return result
+
+def test_bulk_writer():
+    software = FakeCollection("software")
+    persons = FakeCollection("persons")
+    writer = BulkWriter(batch_size=10)
+
+    for rank in range(25):
+        writer.add(software, { "_id": "software/Q" + str(rank), "rank": rank })
+    # two full batches written, 5 documents still buffered
+    assert software.nb_requests == 2
+    assert len(writer) == 5
+
+    writer.add(persons, { "_id": "persons/Q1" })
+    # first version of a document wins, like with has() then insert()
+    writer.add(software, { "_id": "software/Q3", "rank": -1 })
+    writer.flush()
+    assert len(writer) == 0
+    assert len(software.documents) == 25
+    assert software.documents["Q3"]["rank"] == 3
+    assert len(persons.documents) == 1
+    assert writer.created == 26
+    assert writer.ignored == 1
+    assert writer.errors == 0
+
+if __name__ == "__main__":
+    test_bulk_writer()
@@ -0,0 +1,142 @@
+import os
+import copy
+import time
+import argparse
+import tempfile
+import multiprocessing
+
+from software_kb.importing.cran_parser import extract_package_record, extract_package_record_soup, extract_references, parse_package_pages
+from software_kb.importing.local_cache import LocalCache, open_cached_file
+
+resources_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "resources")
+
+sample_pages = ["CRAN_Package_knitr.html", "CRAN_Package_aaSEA.html", "CRAN_Package_reportROC.html"]
+
+minimal_page = '''<html><body>
+<h2>toypkg: A Toy Package</h2>
+<p>Does   nothing
+useful.</p>
+<table summary="Package toypkg summary">
+<tr><td>Version:</td><td>0.1.2</td></tr>
+<tr><td>Depends:</td><td>R (&ge; 3.5.0)</td></tr>
+<tr><td>License:</td><td>MIT</td></tr>
+<tr><td>URL:</td><td><a href="https://toypkg.test">https://toypkg.test</a>, <a href="https://github.com/toy/toypkg">https://github.com/toy/toypkg</a></td></tr>
+<tr><td>NeedsCompilation:</td><td>no</td></tr>
+</table>
+<table summary="Package toypkg downloads">
+<tr><td>Reference&nbsp;manual:</td><td><a href="toypkg.pdf">toypkg.pdf</a></td></tr>
+</table>
+</body></html>'''
+
+minimal_citation = '''<html><body>
+<blockquote><p>Toy Author (2021). toypkg: A Toy Package.</p></blockquote>
+<pre>@Manual{,
+  title = {toypkg},
+}</pre>
+</body></html>'''
+
+def read_resource(name):
+    with open(os.path.join(resources_path, name), "rb") as the_file:
+        return the_file.read()
+
+def test_extraction_equivalence():
+    # the lxml extractor gives the same raw record as the former BeautifulSoup extraction
+    for name in sample_pages:
+        content_html = read_resource(name)
+        record = extract_package_record(content_html)
+        assert record is not None
+        assert record == extract_package_record_soup(content_html)
+        assert len(record["fields"]) > 0
+        assert record["manual"].endswith(".pdf")
+
+    # removed package page
+    assert extract_package_record(b"<html><body><p>archived</p></body></html>") is None
+
+    references = extract_references(read_resource("knitr_citation.html"))
+    assert len(references) > 0
+    assert "raw" in references[0]
+    assert any("bibtex" in reference for reference in references)
+
+def test_parallel_parsing():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cache = LocalCache(os.path.join(tmp_dir, "cache"), compression="gzip")
+        tasks = []
+        for rank in range(20):
+            page_path = cache.put("https://cran.test/package=toypkg" + str(rank), minimal_page, "html")
+            citation_path = cache.put("https://cran.test/toypkg" + str(rank) + "/citation.html", minimal_citation, "html")
+            tasks.append(({ "Package": "toypkg", "rank": rank }, page_path, citation_path))
+        tasks.append(({ "Package": "missing" }, None, None))
+
+        # the json packages are updated in place in serial mode
+        serial_results = parse_package_pages(copy.deepcopy(tasks))
+        with multiprocessing.Pool(2) as pool:
+            results = parse_package_pages(tasks, pool=pool, chunksize=2)
+        assert results == serial_results
+        assert results[-1] is None
+        assert [ result["rank"] for result in results[:-1] ] == list(range(20))
+
+        json_package = results[0]
+        assert json_package["Title"] == "A Toy Package"
+        assert json_package["Description"] == "Does nothing useful."
+        assert json_package["Version"] == "0.1.2"
+        assert json_package["NeedsCompilation"] == False
+        assert json_package["URL"] == ["https://toypkg.test"]
+        assert json_package["git_repository"] == "https://github.com/toy/toypkg"
+        assert json_package["Manual"] == "https://cran.r-project.org/web/packages/toypkg/toypkg.pdf"
+        assert json_package["References"][0]["raw"] == "Toy Author (2021). toypkg: A Toy Package."
+        assert json_package["References"][1]["bibtex"].startswith("@Manual")
+        cache.close()
+
+def _load_page(path):
+    with open_cached_file(path, "rb") as the_file:
+        return the_file.read()
+
+def _extract_file(path):
+    return extract_package_record(_load_page(path)) is not None
+
+def list_corpus(corpus_path):
+    '''
+    html pages of a directory, e.g. the CRAN download cache data/CRAN/cache
+    '''
+    paths = []
+    for root, dirs, files in os.walk(corpus_path):
+        for name in files:
+            if name.endswith(".html") or name.endswith(".html.gz") or name.endswith(".html.zst"):
+                paths.append(os.path.join(root, name))
+    return sorted(paths)
+
+def benchmark(corpus_path, repeat, max_workers):
+    '''
+    Pages per second of the CRAN package page extraction, BeautifulSoup, lxml and lxml with a process pool
+    '''
+    paths = list_corpus(corpus_path) * repeat
+    print("corpus:", len(paths), "pages")
+    pages = [ _load_page(path) for path in paths ]
+
+    for name, extractor in [("BeautifulSoup", extract_package_record_soup), ("lxml", extract_package_record)]:
+        start = time.time()
+        for page in pages:
+            extractor(page)
+        runtime = time.time() - start
+        print("%s: %.1f pages/s" % (name, len(pages)/runtime))
+
+    nb_workers = 2
+    while nb_workers <= max_workers:
+        start = time.time()
+        with multiprocessing.Pool(nb_workers) as pool:
+            pool.map(_extract_file, paths, chunksize=8)
+        runtime = time.time() - start
+        print("lxml, %d processes from the cache files: %.1f pages/s" % (nb_workers, len(paths)/runtime))
+        nb_workers *= 2
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Benchmark the CRAN package page extraction over a corpus of cached CRAN pages")
+    parser.add_argument("--corpus", default=resources_path, help="directory of html CRAN pages, e.g. data/CRAN/cache, default are the test resources")
+    parser.add_argument("--repeat", type=int, default=50, help="number of times the corpus is parsed")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="maximum number of worker processes")
+
+    args = parser.parse_args()
+
+    test_extraction_equivalence()
+    test_parallel_parsing()
+    benchmark(args.corpus, args.repeat, args.workers)
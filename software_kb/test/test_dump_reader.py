@@ -0,0 +1,271 @@
+import os
+import sys
+import bz2
+import json
+import time
+import tempfile
+import argparse
+
+from software_kb.common.entity_set import WikidataEntitySet
+from software_kb.importing import dump_reader
+from software_kb.importing.dump_reader import read_dump_entities, read_spilled_entities, DumpEntityFilter, DumpSpillIndex, DumpCheckpoint, list_block_segments, raw_entity_id
+
+def _synthetic_entity(rank):
+    return {
+        "id": "Q" + str(rank),
+        "type": "item",
+        "labels": { "en": { "language": "en", "value": "entity " + str(rank) }, "fr": { "language": "fr", "value": "entité " + str(rank) } },
+        "descriptions": { "en": { "language": "en", "value": "a synthetic entity for testing " * (rank % 7 + 1) } },
+        "aliases": {},
+        "claims": {
+            "P31": [ { "mainsnak": { "snaktype": "value", "property": "P31", "datatype": "wikibase-item",
+                "datavalue": { "value": { "entity-type": "item", "numeric-id": 7397, "id": "Q7397" }, "type": "wikibase-entityid" } } } ]
+        },
+        "sitelinks": {},
+        "lastrevid": rank
+    }
+
+def write_synthetic_dump(path, nb_entities, compresslevel=1):
+    '''
+    Write a small dump with the same layout as the Wikidata JSON dump, one entity per line.
+    A low compression level gives smaller bz2 blocks, so more blocks for a given dump size.
+    '''
+    with bz2.open(path, "wt", compresslevel=compresslevel) as dump_file:
+        dump_file.write("[\n")
+        for rank in range(1, nb_entities+1):
+            dump_file.write(json.dumps(_synthetic_entity(rank)))
+            if rank < nb_entities:
+                dump_file.write(",\n")
+            else:
+                dump_file.write("\n")
+        dump_file.write("]\n")
+
+def read_sequential(path, line_processor):
+    # the reference single process reading
+    results = []
+    with bz2.open(path, "rb") as dump_file:
+        for line in dump_file:
+            result = line_processor(line)
+            if result is not None:
+                results.append(result)
+    return results
+
+def test_parallel_reader_order():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        dump_path = os.path.join(tmp_dir, "dump.json.bz2")
+        write_synthetic_dump(dump_path, 20000)
+        assert len(list_block_segments(dump_path)) > 1
+
+        entity_filter = DumpEntityFilter()
+        expected = read_sequential(dump_path, entity_filter)
+        results = list(read_dump_entities(dump_path, entity_filter, nb_workers=2, verbose=False))
+        assert len(results) == 20000
+        assert results == expected
+
+def test_parallel_reader_filter():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        dump_path = os.path.join(tmp_dir, "dump.json.bz2")
+        write_synthetic_dump(dump_path, 5000)
+
+        entity_filter = DumpEntityFilter(wanted=[{"Q1", "Q2500"}, {"Q5000"}])
+        results = list(read_dump_entities(dump_path, entity_filter, nb_workers=2, verbose=False))
+        assert [ entity["id"] for entity in results ] == ["Q1", "Q2500", "Q5000"]
+        # simplified entity
+        assert results[0]["labels"] == "entity 1"
+
+def test_parallel_reader_multistream():
+    # pbzip2-like output: concatenated bz2 streams
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        dump_path = os.path.join(tmp_dir, "dump.json.bz2")
+        lines = [ json.dumps(_synthetic_entity(rank)) for rank in range(1, 101) ]
+        with open(dump_path, "wb") as dump_file:
+            dump_file.write(bz2.compress(("[\n" + ",\n".join(lines[:50]) + ",\n").encode("utf-8")))
+            dump_file.write(bz2.compress((",\n".join(lines[50:]) + "\n]\n").encode("utf-8")))
+
+        results = list(read_dump_entities(dump_path, DumpEntityFilter(simplify=False), nb_workers=2, verbose=False))
+        assert [ entity["id"] for entity in results ] == [ "Q" + str(rank) for rank in range(1, 101) ]
+
+def test_false_end_of_stream():
+    # end-of-stream magic number found by chance in the compressed data of a block
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        dump_path = os.path.join(tmp_dir, "dump.json.bz2")
+        write_synthetic_dump(dump_path, 5000)
+        segments = list_block_segments(dump_path)
+        assert len(segments) > 2
+        real_offsets = dump_reader.find_block_offsets(dump_path)
+        false_marker = (segments[1][0] + 12345, False)
+        find_block_offsets = dump_reader.find_block_offsets
+        dump_reader.find_block_offsets = lambda path: sorted(real_offsets + [false_marker])
+        try:
+            assert list_block_segments(dump_path) == segments
+            results = list(read_dump_entities(dump_path, DumpEntityFilter(), nb_workers=2, verbose=False))
+        finally:
+            dump_reader.find_block_offsets = find_block_offsets
+        assert len(results) == 5000
+
+def test_prefilter():
+    line = json.dumps(_synthetic_entity(42)).encode("utf-8") + b",\n"
+    assert raw_entity_id(line) == "Q42"
+    # a nested "id" is never taken as the entity identifier
+    assert raw_entity_id(b'{"type":"item","labels":{"en":{"value":"x"}},"id":"Q42"}') is None
+
+    wanted = [{"Q42"}]
+    assert DumpEntityFilter(wanted=wanted)(line)["id"] == "Q42"
+    assert DumpEntityFilter(wanted=[{"Q43"}])(line) is None
+
+    # same results with and without pre-filtering
+    lines = [ json.dumps(_synthetic_entity(rank)).encode("utf-8") + b",\n" for rank in range(1, 1000) ]
+    with_prefilter = [ DumpEntityFilter(wanted=[{"Q1", "Q500", "Q999"}])(line) for line in lines ]
+    without_prefilter = [ DumpEntityFilter(wanted=[{"Q1", "Q500", "Q999"}], prefilter=False)(line) for line in lines ]
+    assert with_prefilter == without_prefilter
+
+def test_spill_index():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        dump_path = os.path.join(tmp_dir, "dump.json.bz2")
+        write_synthetic_dump(dump_path, 20000)
+        spill_index = DumpSpillIndex(os.path.join(tmp_dir, "spill"))
+
+        # first pass selecting a few entities, the other ones are spilled
+        entity_filter = DumpEntityFilter(wanted=[{"Q1", "Q10000"}])
+        results = list(read_dump_entities(dump_path, entity_filter, nb_workers=2, verbose=False, spill_index=spill_index))
+        assert [ entity["id"] for entity in results ] == ["Q1", "Q10000"]
+
+        # every line start in any block, including the lines crossing block boundaries and the last one
+        related = set("Q" + str(rank) for rank in range(2, 20001, 7)) | {"Q20000"}
+        related.discard("Q10000")
+        expected = read_sequential(dump_path, DumpEntityFilter(wanted=[related]))
+        results = list(read_spilled_entities(spill_index, DumpEntityFilter(wanted=[related]), related, nb_workers=2))
+        assert len(results) == len(related)
+        assert results == expected
+        # selected entities are not in the spill index
+        assert list(read_spilled_entities(spill_index, DumpEntityFilter(wanted=[{"Q1"}]), {"Q1"}, nb_workers=2)) == []
+
+def test_checkpoint_resume():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        dump_path = os.path.join(tmp_dir, "dump.json.bz2")
+        write_synthetic_dump(dump_path, 20000)
+        entity_filter = DumpEntityFilter(wanted=[set("Q" + str(rank) for rank in range(1, 20001, 3))])
+        expected = [ entity["id"] for entity in read_sequential(dump_path, entity_filter) ]
+
+        # interrupted pass, the checkpoint records the number of results consumed at this point
+        checkpoint = DumpCheckpoint(os.path.join(tmp_dir, "checkpoint"), "test", dump_path, interval=3)
+        related = WikidataEntitySet()
+        results = []
+        saved = []
+        def on_block(tasks, next_block, carry):
+            if checkpoint.should_save(next_block):
+                checkpoint.save(tasks, next_block, carry, { "related": related })
+                saved.append(len(results))
+        for entity in read_dump_entities(dump_path, entity_filter, nb_workers=2, verbose=False, on_block=on_block):
+            results.append(entity["id"])
+            related.add(entity["id"])
+            if len(saved) == 2 and len(results) > saved[-1] + 10:
+                break
+        results = results[:saved[-1]]
+
+        # resume from the checkpoint
+        related = WikidataEntitySet()
+        checkpoint = DumpCheckpoint(os.path.join(tmp_dir, "checkpoint"), "test", dump_path)
+        start_block, carry = checkpoint.load({ "related": related })
+        assert start_block > 0
+        assert list(related) == results
+        for entity in read_dump_entities(dump_path, entity_filter, nb_workers=2, verbose=False, start_block=start_block, carry=carry):
+            results.append(entity["id"])
+        assert results == expected
+
+        checkpoint.clear()
+        assert checkpoint.load() == (0, b'')
+
+def test_spill_index_resume():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        dump_path = os.path.join(tmp_dir, "dump.json.bz2")
+        write_synthetic_dump(dump_path, 20000)
+        entity_filter = DumpEntityFilter(wanted=[{"Q1", "Q10000"}])
+        related = set("Q" + str(rank) for rank in range(2, 20001, 7)) | {"Q20000"}
+        expected = read_sequential(dump_path, DumpEntityFilter(wanted=[related]))
+
+        # interrupted pass, the spill index goes on after the last checkpoint
+        spill_index = DumpSpillIndex(os.path.join(tmp_dir, "spill"))
+        checkpoint = DumpCheckpoint(os.path.join(tmp_dir, "checkpoint"), "test", dump_path, interval=3)
+        saved = []
+        def on_block(tasks, next_block, carry):
+            if checkpoint.should_save(next_block):
+                checkpoint.save(tasks, next_block, carry, spill_length=spill_index.sync())
+                saved.append(next_block)
+        reader = read_dump_entities(dump_path, entity_filter, nb_workers=2, verbose=False, spill_index=spill_index, on_block=on_block)
+        for entity in reader:
+            if entity["id"] == "Q10000":
+                break
+        reader.close()
+        spill_index.close()
+        # torn record at the end of the index
+        with open(spill_index.blocks_path, "ab") as blocks_file:
+            blocks_file.write(b'\x07\x00\x00\x00\xff\xff')
+        assert os.path.getsize(spill_index.blocks_path) > checkpoint.spill_length
+
+        # resume from the checkpoint, the index is cut back to its size at the checkpoint
+        spill_index = DumpSpillIndex(os.path.join(tmp_dir, "spill"))
+        checkpoint = DumpCheckpoint(os.path.join(tmp_dir, "checkpoint"), "test", dump_path)
+        start_block, carry = checkpoint.load()
+        assert start_block == saved[-1] and checkpoint.spill_length > 0
+        results = list(read_dump_entities(dump_path, entity_filter, nb_workers=2, verbose=False, spill_index=spill_index,
+                                          start_block=start_block, carry=carry, spill_length=checkpoint.spill_length))
+        assert [ entity["id"] for entity in results ] == ["Q10000"]
+        assert list(read_spilled_entities(spill_index, DumpEntityFilter(wanted=[related]), related, nb_workers=2)) == expected
+
+def benchmark_prefilter(nb_entities):
+    '''
+    Lines per second of the line filtering with and without the raw identifier pre-filter, 
+    with a small fraction of relevant entities as in the Wikidata dump
+    '''
+    lines = [ json.dumps(_synthetic_entity(rank)).encode("utf-8") + b",\n" for rank in range(1, nb_entities+1) ]
+    wanted = [ set("Q" + str(rank) for rank in range(1, nb_entities+1, 1000)) ]
+
+    for prefilter in [False, True]:
+        entity_filter = DumpEntityFilter(wanted=wanted, prefilter=prefilter)
+        start = time.time()
+        nb_results = 0
+        for line in lines:
+            if entity_filter(line) is not None:
+                nb_results += 1
+        runtime = time.time() - start
+        print("prefilter=%s: %d lines/s (%d relevant entities)" % (prefilter, len(lines)/runtime, nb_results))
+
+def benchmark(nb_entities, max_workers):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        dump_path = os.path.join(tmp_dir, "dump.json.bz2")
+        write_synthetic_dump(dump_path, nb_entities, compresslevel=9)
+        print("synthetic dump:", nb_entities, "entities,", len(list_block_segments(dump_path)), "bz2 blocks")
+
+        entity_filter = DumpEntityFilter()
+        start = time.time()
+        read_sequential(dump_path, entity_filter)
+        reference_time = time.time() - start
+        print("sequential bz2.open: %.2fs" % reference_time)
+
+        nb_workers = 1
+        while nb_workers <= max_workers:
+            start = time.time()
+            for entity in read_dump_entities(dump_path, entity_filter, nb_workers=nb_workers, verbose=False):
+                pass
+            runtime = time.time() - start
+            print("%d workers: %.2fs, speed-up %.2f" % (nb_workers, runtime, reference_time/runtime))
+            nb_workers *= 2
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Benchmark the parallel Wikidata dump reader on a synthetic dump")
+    parser.add_argument("--entities", type=int, default=200000, help="number of entities in the synthetic dump")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="maximum number of worker processes")
+
+    args = parser.parse_args()
+
+    test_parallel_reader_order()
+    test_parallel_reader_filter()
+    test_parallel_reader_multistream()
+    test_false_end_of_stream()
+    test_prefilter()
+    test_spill_index()
+    test_checkpoint_resume()
+    test_spill_index_resume()
+    benchmark_prefilter(args.entities)
+    benchmark(args.entities, args.workers)
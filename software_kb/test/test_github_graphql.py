@@ -0,0 +1,121 @@
+import re
+import json
+import time
+
+from software_kb.importing.github_graphql import GitHubRepositoryFetcher, GitHubTransportError, SessionTransport, parse_github_repository, repository_key
+from software_kb.test.conftest import StubHandler, stub_servers
+
+class StubGraphQLHandler(StubHandler):
+    '''
+    Local GraphQL endpoint answering the batched repository queries, repositories named "missing" are not found,
+    the first server.failures requests fail with server.failure_status (502 by default) and server.failure_headers
+    '''
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length"))))
+        self.server.requests.append(payload)
+        if self.server.failures > 0:
+            self.server.failures -= 1
+            self.send_response(self.server.failure_status)
+            for header, value in self.server.failure_headers.items():
+                self.send_header(header, value)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        variables = payload["variables"]
+        data = {}
+        errors = []
+        for alias in re.findall(r'(r\d+): repository\(', payload["query"]):
+            rank = alias[1:]
+            owner, name = variables["o" + rank], variables["n" + rank]
+            if name == "missing":
+                data[alias] = None
+                errors.append({ "type": "NOT_FOUND", "path": [alias] })
+            else:
+                data[alias] = { "nameWithOwner": owner + "/" + name, "owner": { "login": owner }, "stargazerCount": len(name) }
+        data["rateLimit"] = { "cost": 1, "remaining": self.server.remaining, "resetAt": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(time.time() + 60)) }
+        body = json.dumps({ "data": data, "errors": errors }).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+def test_parse_repository():
+    assert parse_github_repository("https://github.com/softcite/softcite_kb") == ("softcite", "softcite_kb")
+    assert parse_github_repository("http://www.github.com/yihui/knitr.git") == ("yihui", "knitr")
+    assert parse_github_repository("github.com/ropensci/auk/issues") == ("ropensci", "auk")
+    assert parse_github_repository("https://gitlab.com/foo/bar") is None
+    assert parse_github_repository("https://github.com/foo") is None
+    assert repository_key("Yihui", "Knitr") == "yihui:knitr"
+
+def test_batched_fetch(stub_server):
+    server = stub_server(StubGraphQLHandler, failures=0, failure_status=502, failure_headers={}, remaining=5000)
+    delays = []
+    fetcher = GitHubRepositoryFetcher(api_url="http://127.0.0.1:" + str(server.server_port) + "/graphql", batch_size=10,
+                                      transport=SessionTransport(token="test"), sleep=delays.append)
+
+    repositories = [ ("owner" + str(rank), "repo" + str(rank)) for rank in range(25) ]
+    # duplicates (case insensitive) are requested once
+    repositories += [ ("OWNER0", "Repo0"), ("ghost", "missing") ]
+    results = fetcher.fetch(repositories)
+
+    assert len(server.requests) == 3
+    assert len(results) == 26
+    assert results["owner7:repo7"]["nameWithOwner"] == "owner7/repo7"
+    assert results["ghost:missing"] is None
+    assert delays == []
+
+    # low remaining rate limit: wait for the reset before the next query
+    server.remaining = 10
+    fetcher.fetch([("a", "b")])
+    fetcher.fetch([("c", "d")])
+    assert len(delays) == 1 and 50 < delays[0] <= 62
+
+    # server errors are retried
+    server.failures = 2
+    fetcher.min_remaining = 0
+    results = fetcher.fetch([("e", "f")])
+    assert results["e:f"]["owner"]["login"] == "e"
+
+    # a 403 is retried only when rate limited
+    nb_requests = len(server.requests)
+    server.failures = 1
+    server.failure_status = 403
+    assert fetcher.fetch([("g", "h")]) == {}
+    assert len(server.requests) == nb_requests + 1
+    server.failures = 1
+    server.failure_headers = { "X-RateLimit-Remaining": "0", "X-RateLimit-Reset": str(int(time.time()) + 30) }
+    delays.clear()
+    assert fetcher.fetch([("g", "h")])["g:h"]["owner"]["login"] == "g"
+    assert len(server.requests) == nb_requests + 3
+    assert len(delays) == 1 and delays[0] > 0
+
+def test_pluggable_transport():
+    calls = []
+    def failing_transport(url, payload, timeout):
+        calls.append(url)
+        raise GitHubTransportError("Bad credentials", status=401)
+
+    fetcher = GitHubRepositoryFetcher(api_url="stub", transport=failing_transport, sleep=lambda delay: None)
+    results = fetcher.fetch([("a", "b"), ("c", "d")])
+    # not retryable, and the repositories of the failed query are not reported as not found
+    assert calls == ["stub"]
+    assert results == {}
+
+    # an empty response is retried
+    responses = [ None, { "data": { "r0": None, "r1": { "nameWithOwner": "c/d" } } } ]
+    def empty_transport(url, payload, timeout):
+        calls.append(url)
+        return responses.pop(0)
+
+    calls.clear()
+    fetcher = GitHubRepositoryFetcher(api_url="stub", transport=empty_transport, sleep=lambda delay: None)
+    results = fetcher.fetch([("a", "b"), ("c", "d")])
+    assert len(calls) == 2
+    assert results == { "a:b": None, "c:d": { "nameWithOwner": "c/d" } }
+
+if __name__ == "__main__":
+    test_parse_repository()
+    with stub_servers() as stub_server:
+        test_batched_fetch(stub_server)
+    test_pluggable_transport()
@@ -0,0 +1,76 @@
+import os
+import json
+import time
+import tempfile
+
+from software_kb.importing.local_cache import LocalCache, open_cached_file
+
+def test_local_cache():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cache = LocalCache(os.path.join(tmp_dir, "cache"), compression="gzip")
+        url = "https://cran.r-project.org/package=knitr"
+        assert cache.get(url) is None
+
+        html = "<html><body>" + "knitr " * 1000 + "</body></html>"
+        path = cache.put(url, html.encode("utf-8"), "html")
+        # sharded layout and compressed payload
+        assert path.endswith(".html.gz")
+        assert os.path.relpath(path, os.path.join(tmp_dir, "cache")).count(os.sep) == 2
+        assert os.path.getsize(path) < len(html) / 10
+
+        entry = cache.get(url)
+        assert entry["path"] == path
+        with open_cached_file(entry["path"], "rt") as the_file:
+            assert the_file.read() == html
+
+        # JSON is read back transparently
+        json_url = "https://ropensci.test/packages/"
+        cache.put(json_url, json.dumps(["a", "b"]), "json")
+        with open_cached_file(cache.get(json_url)["path"], "rt") as the_file:
+            assert json.load(the_file) == ["a", "b"]
+
+        # binary content is kept as it is
+        binary_path = cache.put("https://cran.test/file.bin", b"\x00\x01", "bin")
+        assert binary_path.endswith(".bin")
+
+        # not available resource
+        assert cache.put("https://cran.test/missing", None, None, 404) is None
+        assert cache.get("https://cran.test/missing") == { "path": None, "extension": None, "status": 404 }
+        cache.close()
+
+def test_local_cache_eviction():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cache = LocalCache(os.path.join(tmp_dir, "cache"), compression="none")
+        for rank in range(10):
+            cache.put("https://cran.test/" + str(rank), b"x" * 100, "bin")
+            time.sleep(0.001)
+        # the first entry is the most recently used one
+        cache.get("https://cran.test/0")
+        cache.evict(500)
+        assert cache.size() == 500
+        assert cache.get("https://cran.test/0") is not None
+        assert cache.get("https://cran.test/1") is None
+        assert cache.get("https://cran.test/9") is not None
+        assert len(os.listdir(os.path.join(tmp_dir, "cache"))) > 0
+
+        # access times are buffered, then written in one batch
+        cache.get("https://cran.test/9")
+        assert len(cache.accessed) > 0
+        cache.evict(400)
+        assert len(cache.accessed) == 0
+        assert cache.get("https://cran.test/0") is not None
+        assert cache.get("https://cran.test/6") is None
+
+        # time-to-live
+        cache.ttl = 0.05
+        time.sleep(0.1)
+        assert cache.get("https://cran.test/9") is None
+        cache.touch("https://cran.test/9")
+        assert cache.get("https://cran.test/9") is not None
+        cache.purge_expired()
+        assert cache.size() == 100
+        cache.close()
+
+if __name__ == "__main__":
+    test_local_cache()
+    test_local_cache_eviction()
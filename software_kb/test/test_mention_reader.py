@@ -0,0 +1,95 @@
+import os
+import gzip
+import json
+import tempfile
+
+from software_kb.importing.mention_reader import read_mention_exports, decode_mention_line, export_collection_name, ExportManifest
+
+def _annotation(rank, name):
+    return { "_id": { "$oid": "a" + str(rank) }, "software-name": { "normalizedForm": name }, "document": { "$oid": "d" + str(rank % 10) } }
+
+def write_exports(tmp_dir, nb_annotations):
+    with gzip.open(os.path.join(tmp_dir, "annotations.json.gz"), "wt") as the_file:
+        for rank in range(nb_annotations):
+            name = "SPSS" if rank % 3 else "ImageJ"
+            if rank % 50 == 7:
+                name = "SARS-CoV-2"
+            the_file.write(json.dumps(_annotation(rank, name)) + "\n")
+        the_file.write("not json\n")
+    with open(os.path.join(tmp_dir, "documents.json"), "w") as the_file:
+        for rank in range(10):
+            the_file.write(json.dumps({ "_id": { "$oid": "d" + str(rank) }, "pages": [] }) + "\n")
+    with open(os.path.join(tmp_dir, "references.json"), "w") as the_file:
+        for rank in range(25):
+            the_file.write(json.dumps({ "_id": { "$oid": "r" + str(rank) }, "document": { "$oid": "d1" } }) + "\n")
+    with open(os.path.join(tmp_dir, "readme.txt"), "w") as the_file:
+        the_file.write("not an export file\n")
+    return [ os.path.join(tmp_dir, name) for name in sorted(os.listdir(tmp_dir)) ]
+
+def test_decode_line():
+    line = json.dumps(_annotation(1, "ImageJ")).encode("utf-8")
+    json_object = decode_mention_line(line, "annotations", blacklist={ "SPSS" }, tags=["cord-19"])
+    assert json_object["_id"] == "annotations/a1"
+    assert json_object["tenants"] == ["cord-19"]
+    assert decode_mention_line(line, "annotations", blacklist={ "ImageJ" }) is None
+    assert decode_mention_line(json.dumps(_annotation(2, "3.5")).encode("utf-8"), "annotations", blacklist=set()) is None
+    assert decode_mention_line(line, "annotations", fast_json=False) == decode_mention_line(line, "annotations")
+    assert export_collection_name("software-mentions.annotations.json.gz") == "annotations"
+    assert export_collection_name("readme.txt") is None
+
+def test_parallel_exports():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        paths = write_exports(tmp_dir, 1000)
+        results = {}
+        for path, collection_name, documents, offset, nb_lines in read_mention_exports(paths, blacklist={ "ImageJ" }, tags=["test"], nb_workers=2, chunk_size=64):
+            results.setdefault(collection_name, []).extend(documents)
+
+        # file order is kept, blacklisted terms and invalid lines are skipped
+        expected = [ "annotations/a" + str(rank) for rank in range(1000) if rank % 3 and rank % 50 != 7 ]
+        assert [ document["_id"] for document in results["annotations"] ] == expected
+        assert [ document["_id"] for document in results["documents"] ] == [ "documents/d" + str(rank) for rank in range(10) ]
+        assert len(results["references"]) == 25
+        assert all(document["tenants"] == ["test"] for document in results["references"])
+
+def test_resume():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        export_dir = os.path.join(tmp_dir, "exports")
+        os.makedirs(export_dir)
+        paths = [ path for path in write_exports(export_dir, 300) if path.find("annotations") != -1 ]
+        path = paths[0]
+        manifest = ExportManifest(os.path.join(tmp_dir, "manifest"), path)
+        assert manifest.load() is None
+
+        # interrupted after the first chunks
+        expected = []
+        offset = 0
+        nb_loaded_lines = 0
+        for _, _, documents, offset, nb_lines in read_mention_exports(paths, nb_workers=1, chunk_size=64):
+            expected.extend(document["_id"] for document in documents)
+            if nb_loaded_lines == 0:
+                nb_loaded = len(expected)
+                nb_loaded_lines = nb_lines
+                manifest.save(offset, nb_loaded_lines, tags=["test"])
+        
+        state = manifest.load()
+        assert state["lines"] == 64 and state["tags"] == ["test"] and not state["complete"]
+
+        # resumed in the middle of the gzipped file
+        resumed = []
+        for _, _, documents, offset, nb_lines in read_mention_exports(paths, nb_workers=1, chunk_size=64, start_offsets={ path: state["offset"] }):
+            resumed.extend(document["_id"] for document in documents)
+        assert resumed == expected[nb_loaded:]
+
+        manifest.save(offset, 301, tags=["test"], complete=True)
+        assert manifest.load()["complete"]
+
+        # the manifest is not valid anymore for a modified export file
+        os.utime(path, (0, 0))
+        assert manifest.load() is None
+        manifest.clear()
+        assert not os.path.isfile(manifest.state_path)
+
+if __name__ == "__main__":
+    test_decode_line()
+    test_parallel_exports()
+    test_resume()
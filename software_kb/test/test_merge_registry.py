@@ -0,0 +1,122 @@
+import os
+import json
+
+from software_kb.common.merge_registry import MergeRegistry
+from software_kb.merging.populate_staging_area import StagingArea
+
+resources_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "resources")
+
+def load_expected():
+    '''
+    random merging decisions with the lists produced by the former StagingArea.register_merging()
+    logic (see software_kb/benchmark/merge_registry.py)
+    '''
+    with open(os.path.join(resources_path, "merge_registry_expected.json")) as the_file:
+        return json.load(the_file)
+
+def test_same_lists_as_legacy():
+    for case in load_expected():
+        registry = MergeRegistry()
+        for entity_id1, entity_id2 in case["decisions"]:
+            assert registry.union(entity_id1, entity_id2)
+        # same lists, with the same order (the first entity is the host of the merging)
+        assert sorted([ members for _, members in registry.lists() ]) == case["lists"]
+        assert len(registry) == len(case["lists"])
+
+def test_registry():
+    registry = MergeRegistry()
+    registry.union("software/a", "software/b")
+    registry.union("software/c", "software/a")
+    registry.union("software/d", "software/e")
+    assert registry.find("software/c") == registry.find("software/b")
+    assert registry.find("software/a") != registry.find("software/d")
+    registry.union("software/e", "software/b")
+    assert list(registry.lists()) == [ (None, ["software/d", "software/e", "software/a", "software/b", "software/c"]) ]
+
+    # path compression
+    registry = MergeRegistry()
+    for rank in range(100):
+        registry.union("persons/" + str(rank), "persons/" + str(rank+1))
+    root = registry.find("persons/100")
+    assert registry.parent["persons/100"] == root
+
+    # loaded lists keep their key, and are extended by the new decisions
+    registry = MergeRegistry()
+    registry.load("list1", ["documents/x", "documents/y"])
+    registry.load("list2", ["documents/z", "documents/w"])
+    registry.union("documents/v", "documents/w")
+    registry.union("documents/y", "documents/z")
+    assert list(registry.lists()) == [ ("list1", ["documents/x", "documents/y", "documents/z", "documents/w", "documents/v"]) ]
+
+class BulkCollection(object):
+    '''
+    In-memory stand-in for a staging area collection written with bulk imports
+    '''
+    def __init__(self, name):
+        self.name = name
+        self.documents = {}
+        self.nb_imports = 0
+
+    def import_bulk(self, documents, halt_on_error=False, details=True, on_duplicate="ignore"):
+        self.nb_imports += 1
+        for document in documents:
+            if on_duplicate == "replace" or not document["_key"] in self.documents:
+                self.documents[document["_key"]] = document
+        return { "created": len(documents) }
+
+    def delete_many(self, keys):
+        for key in keys:
+            del self.documents[key]
+
+class FailingCollection(BulkCollection):
+    def import_bulk(self, documents, halt_on_error=False, details=True, on_duplicate="ignore"):
+        raise ConnectionError("database not reachable")
+
+def test_flush():
+    stagingArea = StagingArea.__new__(StagingArea)
+    stagingArea.config = { "arangodb": { "batch_size": 1000 } }
+    stagingArea.merging_lists = BulkCollection("merging_lists")
+    stagingArea.merging_entities = BulkCollection("merging_entities")
+    stagingArea.merge_registry = MergeRegistry()
+
+    stagingArea.register_merging({ "_id": "software/a", "_key": "a" }, { "_id": "software/b", "_key": "b" })
+    stagingArea.register_merging({ "_id": "software/c", "_key": "c" }, { "_id": "software/b", "_key": "b" })
+    stagingArea.register_merging({ "_id": "persons/p1", "_key": "p1" }, { "_id": "persons/p2", "_key": "p2" })
+    assert stagingArea.flush_merging() == 2
+
+    assert stagingArea.merging_lists.nb_imports == 1 and stagingArea.merging_entities.nb_imports == 1
+    assert sorted([ item["data"] for item in stagingArea.merging_lists.documents.values() ]) == [ ["persons/p1", "persons/p2"], ["software/a", "software/b", "software/c"] ]
+    entity_item = stagingArea.merging_entities.documents["c"]
+    assert entity_item["collection"] == "software"
+    assert stagingArea.merging_lists.documents[entity_item["list_id"].replace("merging_lists/", "")]["data"][0] == "software/a"
+
+    # next run: the stored lists are loaded and extended, a list merged into another one is removed
+    merging_lists = stagingArea.merging_lists
+    stagingArea.merge_registry = MergeRegistry()
+    for key, item in list(merging_lists.documents.items()):
+        stagingArea.merge_registry.load(key, item["data"])
+    software_key = stagingArea.merging_entities.documents["a"]["list_id"].replace("merging_lists/", "")
+    persons_key = stagingArea.merging_entities.documents["p1"]["list_id"].replace("merging_lists/", "")
+    stagingArea.register_merging({ "_id": "software/d", "_key": "d" }, { "_id": "software/a", "_key": "a" })
+    stagingArea.register_merging({ "_id": "software/c", "_key": "c" }, { "_id": "persons/p2", "_key": "p2" })
+    assert stagingArea.merge_registry.stale_keys() == { persons_key }
+
+    # a failure during the flush keeps the stored decisions
+    stagingArea.merging_lists = FailingCollection("merging_lists")
+    try:
+        stagingArea.flush_merging()
+        assert False
+    except ConnectionError:
+        pass
+    stagingArea.merging_lists = merging_lists
+    assert len(merging_lists.documents) == 2
+
+    assert stagingArea.flush_merging() == 1
+    assert list(merging_lists.documents) == [ software_key ]
+    assert merging_lists.documents[software_key]["data"] == ["software/a", "software/b", "software/c", "software/d", "persons/p1", "persons/p2"]
+    assert stagingArea.merging_entities.documents["p1"]["list_id"] == "merging_lists/" + software_key
+
+if __name__ == "__main__":
+    test_same_lists_as_legacy()
+    test_registry()
+    test_flush()
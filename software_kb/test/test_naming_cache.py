@@ -0,0 +1,103 @@
+import os
+import tempfile
+
+from software_kb.common.naming_cache import NamingCache, write_naming_snapshot
+from software_kb.common.arango_common import CommonArangoDB
+
+def test_naming_snapshot():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "naming.snapshot")
+        entries = [ ("Q" + str(rank), "entity " + str(rank)) for rank in range(1000, 0, -1) ]
+        entries += [ ("P31", "instance of"), ("Q42", "Douglas Adams"), ("PA0", "mentions"), ("Q7", "héllo wörld") ]
+        write_naming_snapshot(path, entries, revision="_hW5k9a---")
+
+        cache = NamingCache(path)
+        assert len(cache) == 1002
+        assert cache.revision == "_hW5k9a---"
+        assert cache.get("Q1") == "entity 1"
+        assert cache.get("Q1000") == "entity 1000"
+        # last name wins for a key present twice
+        assert cache.get("Q42") == "Douglas Adams"
+        assert cache.get("P31") == "instance of"
+        assert cache.get("PA0") == "mentions"
+        assert cache.get("Q7") == "héllo wörld"
+        assert cache.get("Q1001") is None
+        assert cache.get("P1") is None
+        assert not cache.contains("Q1001")
+
+        # names added after the snapshot, including unknown names, in the bounded LRU dict
+        cache.lru_size = 2
+        cache.put("Q1001", "new entity")
+        cache.put("Q1002", None)
+        assert cache.contains("Q1002")
+        assert cache.get("Q1001") == "new entity"
+        cache.put("Q1003", "another one")
+        assert not cache.contains("Q1002")
+        assert cache.get("Q1001") == "new entity"
+        cache.close()
+
+class NamingCollection(object):
+    '''
+    In-memory stand-in for the naming_wikidata collection and its database, the revision changes 
+    with every write
+    '''
+    def __init__(self, names):
+        self.names = dict(names)
+        self.nb_writes = 0
+        self.aql = self
+
+    def revision(self):
+        return str(self.nb_writes)
+
+    def count(self):
+        return len(self.names)
+
+    def execute(self, query, **kwargs):
+        return iter([ [key, value] for key, value in self.names.items() ])
+
+    def write(self, key, value):
+        self.names[key] = value
+        self.nb_writes += 1
+
+    def __contains__(self, key):
+        return key in self.names
+
+    def find(self, filters, skip=0, limit=None):
+        raise NotImplementedError()
+
+    def insert(self, document):
+        if " " in document["_key"]:
+            raise ValueError("invalid document key")
+        self.write(document["_key"], document["value"])
+
+def test_snapshot_revision():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        database = CommonArangoDB()
+        database.config = { "naming_cache_path": os.path.join(tmp_dir, "naming.snapshot") }
+        database.naming_wikidata = database.naming_db = NamingCollection({ "Q1": "universe", "Q2": "earth" })
+        assert database.load_naming_cache().get("Q2") == "earth"
+        snapshot_time = os.path.getmtime(database.naming_snapshot_path())
+
+        # same revision: the snapshot is reused
+        database.naming_cache.close()
+        assert database.load_naming_cache().get("Q1") == "universe"
+        assert os.path.getmtime(database.naming_snapshot_path()) == snapshot_time
+
+        # a name replaced, with the same number of names: the snapshot is rebuilt
+        database.naming_wikidata.write("Q2", "Earth")
+        database.naming_cache.close()
+        assert database.load_naming_cache().get("Q2") == "Earth"
+
+        # a name is cached only once stored
+        database.add_naming_wikidata("Q3", "moon")
+        assert database.naming_cache.get("Q3") == "moon"
+        database.add_naming_wikidata("Q 4", "sun")
+        assert database.naming_cache.get("Q 4") is None and not database.naming_cache.contains("Q 4")
+        database.naming_cache.close()
+
+        database.remove_naming_snapshot()
+        assert not os.path.isfile(database.naming_snapshot_path())
+
+if __name__ == "__main__":
+    test_naming_snapshot()
+    test_snapshot_revision()
@@ -0,0 +1,53 @@
+from software_kb.common.naming_loader import NamingBulkLoader
+
+class FakeNamingCollection(object):
+    '''
+    Minimal stand-in for the naming collection, with a unique index on the value
+    '''
+    def __init__(self, name="naming_wikidata"):
+        self.name = name
+        self.documents = {}
+        self.nb_requests = 0
+
+    def import_bulk(self, documents, halt_on_error=True, details=True, on_duplicate=None):
+        self.nb_requests += 1
+        result = { "created": 0, "updated": 0, "errors": 0 }
+        for document in documents:
+            values = { value: key for key, value in self.documents.items() }
+            if document["value"] in values and values[document["value"]] != document["_key"]:
+                result["errors"] += 1
+                continue
+            if document["_key"] in self.documents:
+                result["updated"] += 1
+            else:
+                result["created"] += 1
+            self.documents[document["_key"]] = document["value"]
+        return result
+
+def test_naming_loader():
+    collection = FakeNamingCollection()
+    collection.documents = { "Q1": "universe", "P31": "instance of" }
+
+    loader = NamingBulkLoader(collection, existing=collection.documents.items(), batch_size=100)
+    # already present
+    assert not loader.add("Q1", "universe")
+    # string already used by another identifier
+    assert not loader.add("Q2", "universe")
+    for rank in range(3, 253):
+        assert loader.add("Q" + str(rank), "entity " + str(rank))
+    # new name for an identifier, its previous name can then be used by another one
+    assert loader.add("P31", "is a")
+    assert loader.add("Q1000", "instance of")
+    loader.flush()
+
+    assert collection.nb_requests == 3
+    assert len(collection.documents) == 2 + 250 + 1
+    assert collection.documents["P31"] == "is a"
+    assert collection.documents["Q1000"] == "instance of"
+    assert not "Q2" in collection.documents
+    assert loader.nb_added == 252
+    assert loader.nb_not_unique == 1
+    assert loader.writer.errors == 0
+
+if __name__ == "__main__":
+    test_naming_loader()
@@ -0,0 +1,17 @@
+from software_kb.importing.import_common import diff_package_versions
+
+def test_diff_package_versions():
+    stored_versions = { "knitr": "1.30", "aaSEA": "1.1.0", "reportROC": "3.5", "archived": "0.1" }
+    available_versions = { "knitr": "1.31", "aaSEA": "1.1.0", "reportROC": "3.5", "auk": "0.4.3" }
+    new_packages, changed_packages, removed_packages = diff_package_versions(stored_versions, available_versions)
+    assert new_packages == { "auk" }
+    assert changed_packages == { "knitr" }
+    assert removed_packages == { "archived" }
+
+    # nothing changed upstream
+    assert diff_package_versions(available_versions, available_versions) == (set(), set(), set())
+    # first import
+    assert diff_package_versions({}, available_versions) == (set(available_versions.keys()), set(), set())
+
+if __name__ == "__main__":
+    test_diff_package_versions()
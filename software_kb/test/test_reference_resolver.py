@@ -0,0 +1,102 @@
+import time
+import threading
+
+from software_kb.common.reference_resolver import ReferenceResolver, query_signature
+
+class SlowLookup(object):
+    '''
+    Stand-in for biblio_glutton_lookup with a network latency, recording the calls and the maximum
+    number of concurrent calls. With gates (raw_ref -> threading.Event), the lookup of these references
+    waits for their event instead of the latency.
+    '''
+    def __init__(self, latency=0.05, gates=None):
+        self.latency = latency
+        self.gates = gates or {}
+        self.calls = []
+        self.running = 0
+        self.max_running = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, doi=None, raw_ref=None, title=None, first_author_last_name=None):
+        with self.lock:
+            self.calls.append(doi or raw_ref)
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        if raw_ref in self.gates:
+            assert self.gates[raw_ref].wait(timeout=10)
+        else:
+            time.sleep(self.latency)
+        with self.lock:
+            self.running -= 1
+        if raw_ref == "unknown":
+            return None
+        if raw_ref == "failing":
+            raise ValueError("bad response")
+        return { "title": [ doi or raw_ref ] }
+
+def test_signature():
+    assert query_signature({"raw_ref": "Smith, J. (2020) A tool."}) == query_signature({"raw_ref": "smith J 2020 a tool"})
+    assert query_signature({"raw_ref": "A", "title": None}) == query_signature({"raw_ref": "A"})
+    assert query_signature({"doi": "10.1/a"}) != query_signature({"raw_ref": "10.1/a"})
+
+def test_concurrent_resolution():
+    lookup = SlowLookup()
+    resolver = ReferenceResolver(lookup, max_workers=4)
+
+    for rank in range(8):
+        resolver.submit({"raw_ref": "reference " + str(rank)}, context=rank)
+    # duplicated while in progress: a single lookup
+    resolver.submit({"raw_ref": "Reference 0."}, context="duplicate")
+    resolver.submit({"raw_ref": "unknown"}, context="unknown")
+    resolver.submit({"raw_ref": "failing"}, context="failing")
+
+    results = list(resolver.completed(wait=True))
+    # 10 lookups with 4 workers
+    assert lookup.max_running == 4
+    assert len(lookup.calls) == 10
+    assert resolver.nb_deduplicated == 1
+
+    # handed back in submission order, with the context
+    assert [ context for _, context, _ in results ] == list(range(8)) + ["duplicate", "unknown", "failing"]
+    assert results[8][2] == results[0][2] == { "title": [ "reference 0" ] }
+    assert results[9][2] is None and results[10][2] is None
+
+    # results are released once handed back
+    assert len(resolver.jobs) == 0 and len(resolver.pending) == 0
+    resolver.close()
+
+def test_completed_without_wait():
+    gates = { raw_ref: threading.Event() for raw_ref in ["a", "b", "c"] }
+    lookup = SlowLookup(gates=gates)
+    resolver = ReferenceResolver(lookup, max_workers=1, max_pending=2)
+    signature = resolver.submit({"raw_ref": "a"}, context="a")
+    # not completed yet
+    assert list(resolver.completed()) == []
+    resolver.submit({"raw_ref": "b"}, context="b")
+    resolver.submit({"raw_ref": "c"}, context="c")
+    # too many pending jobs: the oldest one is waited for, the next one is still in progress
+    assert not resolver.jobs[signature][0].done()
+    release = threading.Timer(0.05, gates["a"].set)
+    release.start()
+    assert [ context for _, context, _ in resolver.completed() ] == ["a"]
+    gates["b"].set()
+    gates["c"].set()
+    assert [ context for _, context, _ in resolver.completed(wait=True) ] == ["b", "c"]
+    assert lookup.calls == ["a", "b", "c"]
+    resolver.close()
+
+def test_prefetch():
+    lookup = SlowLookup()
+    resolver = ReferenceResolver(lookup, max_workers=4)
+    resolver.prefetch([ {"doi": "10.1/" + str(rank)} for rank in range(4) ] + [ {"doi": "10.1/0"} ])
+    # already prefetched in this run
+    resolver.prefetch([ {"doi": "10.1/1"}, {"doi": "10.1/4"} ])
+    assert sorted(lookup.calls) == [ "10.1/" + str(rank) for rank in range(5) ]
+    assert resolver.nb_deduplicated == 2
+    resolver.close()
+
+if __name__ == "__main__":
+    test_signature()
+    test_concurrent_resolution()
+    test_completed_without_wait()
+    test_prefetch()
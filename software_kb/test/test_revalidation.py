@@ -0,0 +1,110 @@
+import os
+import time
+import sqlite3
+import tempfile
+
+from software_kb.importing.harvester import Harvester
+from software_kb.importing.local_cache import LocalCache, open_cached_file
+from software_kb.importing.async_fetcher import AsyncFetcher
+from software_kb.test.conftest import StubHandler, stub_servers
+
+class StubResourceHandler(StubHandler):
+    '''
+    Local resource with validators, answers 304 to a conditional request matching the current version
+    '''
+    def do_GET(self):
+        self.server.requests.append((self.path, self.headers.get("If-None-Match"), self.headers.get("If-Modified-Since")))
+        etag = '"v' + str(self.server.version) + '"'
+        last_modified = "Mon, 0" + str(self.server.version) + " Jan 2024 00:00:00 GMT"
+        if self.path == "/no-validator":
+            etag = None
+        elif self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        body = ("<html><body>version " + str(self.server.version) + "</body></html>").encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", str(len(body)))
+        if etag is not None:
+            self.send_header("ETag", etag)
+            self.send_header("Last-Modified", last_modified)
+        self.end_headers()
+        self.wfile.write(body)
+
+def stub_harvester(cache_root):
+    # no database needed, only the cache and the fetcher are used
+    harvester = Harvester.__new__(Harvester)
+    harvester.config = {}
+    harvester.local_cache = LocalCache(cache_root, compression="none")
+    harvester.fetcher = AsyncFetcher(requests_per_second=100, burst=10, backoff=0.01)
+    return harvester
+
+def read(path):
+    with open_cached_file(path, "rt") as the_file:
+        return the_file.read()
+
+def test_revalidation(stub_server):
+    server = stub_server(StubResourceHandler, version=1)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        harvester = stub_harvester(os.path.join(tmp_dir, "cache"))
+        try:
+            url = "http://127.0.0.1:" + str(server.server_port) + "/package"
+            path = harvester.access_file(url)
+            assert "version 1" in read(path)
+            entry = harvester.local_cache.get(url, include_expired=True)
+            assert entry["etag"] == '"v1"'
+            assert entry["last_modified"] == "Mon, 01 Jan 2024 00:00:00 GMT"
+
+            # fresh entry, no request
+            assert harvester.access_file(url) == path
+            assert len(server.requests) == 1
+
+            # forced revalidation, not modified
+            assert harvester.access_file(url, use_cache=False) == path
+            assert server.requests[-1] == ("/package", '"v1"', "Mon, 01 Jan 2024 00:00:00 GMT")
+            assert len(server.requests) == 2
+
+            # expired entry, the resource has changed
+            harvester.local_cache.ttl = 0.05
+            time.sleep(0.1)
+            server.version = 2
+            path = harvester.access_file(url)
+            assert len(server.requests) == 3
+            assert "version 2" in read(path)
+            assert harvester.local_cache.get(url, include_expired=True)["etag"] == '"v2"'
+
+            # expired entry not modified, the cache entry is renewed
+            time.sleep(0.1)
+            assert harvester.access_file(url) == path
+            assert len(server.requests) == 4
+            assert harvester.local_cache.get(url) is not None
+
+            # no validator, the resource is downloaded again without conditional headers
+            no_validator_url = "http://127.0.0.1:" + str(server.server_port) + "/no-validator"
+            harvester.access_file(no_validator_url)
+            harvester.access_file(no_validator_url, use_cache=False)
+            assert server.requests[-1] == ("/no-validator", None, None)
+        finally:
+            harvester.fetcher.close()
+            harvester.local_cache.close()
+
+def test_cache_migration():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # cache index created before the validators were stored
+        os.makedirs(os.path.join(tmp_dir, "cache"))
+        db = sqlite3.connect(os.path.join(tmp_dir, "cache", "index.sqlite"))
+        db.execute('''CREATE TABLE entries (key TEXT PRIMARY KEY, url TEXT NOT NULL, path TEXT, extension TEXT, 
+            status INTEGER, size INTEGER NOT NULL DEFAULT 0, created REAL NOT NULL, accessed REAL NOT NULL)''')
+        db.commit()
+        db.close()
+        cache = LocalCache(os.path.join(tmp_dir, "cache"), compression="none")
+        cache.put("https://cran.test/a", b"a", "bin", etag='"a"')
+        assert cache.get("https://cran.test/a", include_expired=True)["etag"] == '"a"'
+        cache.close()
+
+if __name__ == "__main__":
+    with stub_servers() as stub_server:
+        test_revalidation(stub_server)
+    test_cache_migration()
@@ -0,0 +1,53 @@
+import os
+import json
+import multiprocessing
+
+from software_kb.common.tei_converter import tei_to_json, convert_teis, parse_tei, tei_doi
+from software_kb.test.test_biblio_parsing import tei_str_tests
+
+resources_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "resources")
+
+def load_expected():
+    '''
+    TEI references of the tests with the JSON produced by the former StagingArea.tei2json() conversion
+    (see software_kb/benchmark/tei_converter.py)
+    '''
+    with open(os.path.join(resources_path, "tei_converter_expected.json")) as the_file:
+        return json.load(the_file)
+
+extra_tei_str_tests = [ '<biblStruct xml:id="b3">\n\t<analytic>\n\t\t<title level="a" type="main">A conference paper</title>\n\t\t<author>\n\t\t\t<persName><forename type="first">Jane</forename><forename type="middle">M</forename><surname> Doe </surname></persName>\n\t\t</author>\n\t\t<author>\n\t\t\t<persName><surname>Roe</surname></persName>\n\t\t</author>\n\t\t<ptr>https://example.org/landing</ptr>\n\t\t<ptr target="https://example.org/paper" />\n\t</analytic>\n\t<monogr>\n\t\t<title level="m">Proceedings of a workshop</title>\n\t\t<meeting>\n\t\t\t<title>Workshop on Software Citation</title>\n\t\t\t<placeName>Paris</placeName>\n\t\t</meeting>\n\t\t<idno type="ISBN">978-3-16-148410-0</idno>\n\t\t<imprint>\n\t\t\t<biblScope unit="page">12-18</biblScope>\n\t\t\t<date type="published" when="2019" />\n\t\t</imprint>\n\t</monogr>\n</biblStruct>',
+                        '<biblStruct>\n\t<analytic>\n\t\t<author>\n\t\t\t<persName><forename type="first">A</forename></persName>\n\t\t</author>\n\t</analytic>\n\t<monogr>\n\t\t<title level="j"></title>\n\t\t<imprint>\n\t\t\t<biblScope unit="page" from="5" />\n\t\t\t<date type="published" />\n\t\t</imprint>\n\t</monogr>\n</biblStruct>',
+                        '<biblStruct><monogr><title level="m">Only a monograph</title><imprint><date type="published" when="2020-03" /></imprint></monogr></biblStruct>' ]
+
+def test_equivalence():
+    for case in load_expected():
+        assert tei_to_json(case["tei"]) == case["json"]
+        # same serialization, including the order of the fields
+        assert json.dumps(tei_to_json(case["tei"])) == json.dumps(case["json"])
+
+def test_conversion():
+    json_bib = tei_to_json(tei_str_tests[1])
+    assert json_bib["DOI"] == "10.1101/gad.1729508"
+    assert json_bib["author"][2] == { "family": "Cohen", "given": "S N" }
+    assert json_bib["page"] == "3497-3508"
+    assert json_bib["published-online"] == { "date-parts": [ ["2008", "12", "15"] ] }
+
+    json_bib = tei_to_json(extra_tei_str_tests[0])
+    assert json_bib["URL"] == "https://example.org/landing"
+    assert json_bib["event"] == { "name": "Workshop on Software Citation" }
+    assert json_bib["page"] == "12-18"
+    assert tei_doi(parse_tei(tei_str_tests[0])) == "10.1002/9781118922590.ch15"
+    assert tei_doi(parse_tei(extra_tei_str_tests[2])) is None
+
+def test_batch_conversion():
+    cases = load_expected()
+    teis = [ case["tei"] for case in cases ] + [ None, "<biblStruct><analytic>" ]
+    expected = [ case["json"] for case in cases ] + [ None, None ]
+    assert convert_teis(teis) == expected
+    with multiprocessing.Pool(2) as pool:
+        assert convert_teis(teis, pool=pool, chunksize=2) == expected
+
+if __name__ == "__main__":
+    test_equivalence()
+    test_conversion()
+    test_batch_conversion()
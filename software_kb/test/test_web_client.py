@@ -0,0 +1,110 @@
+import json
+from urllib.parse import urlparse, parse_qs
+
+from software_kb.common.web_client import WebClient, cache_key
+from software_kb.test.conftest import StubHandler, stub_servers
+
+class StubServiceHandler(StubHandler):
+    '''
+    Local JSON web service with keep-alive connections, /missing answers 404, /flaky answers 503 for
+    the first server.nb_failures requests
+    '''
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        self.server.client_ports.add(self.client_address[1])
+        path = urlparse(self.path).path
+        if path == "/missing":
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if path == "/flaky" and self.server.nb_failures > 0:
+            self.server.nb_failures -= 1
+            self.send_response(503)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = json.dumps({ "path": path, "query": parse_qs(urlparse(self.path).query) }).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+class DictCollection(object):
+    '''
+    In-memory stand-in for the ArangoDB cache collection, counting the lookups
+    '''
+    def __init__(self):
+        self.documents = {}
+        self.nb_get = 0
+
+    def get(self, document):
+        self.nb_get += 1
+        return self.documents.get(document['_key'])
+
+    def insert(self, document, overwrite=False, silent=False):
+        self.documents[document['_key']] = document
+        return True
+
+def test_tiered_cache(stub_server):
+    server = stub_server(StubServiceHandler, client_ports=set(), nb_failures=0)
+    base_url = "http://127.0.0.1:" + str(server.server_port)
+    collection = DictCollection()
+    client = WebClient(cache_collection=collection, lru_size=2)
+
+    data, success, status = client.get(base_url + "/lookup", params={"doi": "10.1/a"})
+    assert success and status == 200
+    assert data["query"] == { "doi": ["10.1/a"] }
+    assert cache_key(base_url + "/lookup", params={"doi": "10.1/a"}) in collection.documents
+
+    # repeated call: served by the LRU, no database lookup and no request
+    nb_get = collection.nb_get
+    assert client.get(base_url + "/lookup", params={"doi": "10.1/a"}) == (data, True, 200)
+    assert collection.nb_get == nb_get
+    assert len(server.requests) == 1
+
+    # 404 are cached too
+    assert client.get(base_url + "/missing") == (None, False, 404)
+    assert client.get(base_url + "/missing") == (None, False, 404)
+    assert len(server.requests) == 2
+
+    # evicted from the LRU, found in the cache collection
+    client.get(base_url + "/lookup", params={"doi": "10.1/b"})
+    assert client.get(base_url + "/lookup", params={"doi": "10.1/a"})[0] == data
+    assert client.cache_hits == 1
+    assert len(server.requests) == 3
+
+    # connections are reused
+    for rank in range(5):
+        client.get(base_url + "/lookup", params={"pmid": str(rank)}, use_cache=False)
+    assert len(server.client_ports) == 1
+
+def test_retry(stub_server):
+    server = stub_server(StubServiceHandler, client_ports=set(), nb_failures=2)
+    base_url = "http://127.0.0.1:" + str(server.server_port)
+    delays = []
+    client = WebClient(max_retries=3, sleep=delays.append)
+    data, success, status = client.get(base_url + "/flaky")
+    assert success and data["path"] == "/flaky"
+    assert len(delays) == 2 and len(server.requests) == 3
+
+    # exhausted retries are not cached
+    server.nb_failures = 10
+    client = WebClient(max_retries=1, sleep=delays.append)
+    assert client.get(base_url + "/flaky") == (None, False, None)
+    server.nb_failures = 0
+    assert client.get(base_url + "/flaky")[1]
+
+def test_unreachable_service():
+    client = WebClient(max_retries=1, timeout=1, sleep=lambda delay: None)
+    # nothing listens on this port
+    assert client.get("http://127.0.0.1:9/lookup") == (None, False, None)
+
+if __name__ == "__main__":
+    with stub_servers() as stub_server:
+        test_tiered_cache(stub_server)
+        test_retry(stub_server)
+    test_unreachable_service()
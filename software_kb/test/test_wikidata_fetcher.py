@@ -0,0 +1,102 @@
+import json
+from urllib.parse import urlparse, parse_qs
+
+from software_kb.common.wikidata_fetcher import WikidataEntityFetcher, WikidataTransportError
+from software_kb.common.arango_common import CommonArangoDB
+from software_kb.test.conftest import StubHandler, stub_servers
+
+class StubWikidataHandler(StubHandler):
+    '''
+    Local stand-in for the wbgetentities API, every Q entity exists except Q0, the first requests
+    fail with a 503 when server.nb_failures > 0
+    '''
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        if self.server.nb_failures > 0:
+            self.server.nb_failures -= 1
+            self.send_response(503)
+            self.end_headers()
+            return
+
+        params = parse_qs(urlparse(self.path).query)
+        entities = {}
+        for entity_id in params["ids"][0].split("|"):
+            if entity_id == "Q0":
+                entities[entity_id] = { "id": entity_id, "missing": "" }
+            else:
+                entities[entity_id] = { "id": entity_id, "type": "item",
+                    "labels": { "en": { "language": "en", "value": "label of " + entity_id } } }
+        body = json.dumps({ "entities": entities, "success": 1 }).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+def test_batched_fetch(stub_server):
+    server = stub_server(StubWikidataHandler, nb_failures=0)
+    fetcher = WikidataEntityFetcher(api_url="http://127.0.0.1:" + str(server.server_port) + "/w/api.php", max_concurrency=2)
+    entity_ids = [ "Q" + str(rank) for rank in range(120) ] + ["Q5", "not an id"]
+    entities = fetcher.fetch(entity_ids)
+    # 120 distinct identifiers, so 3 requests of at most 50 identifiers
+    assert len(server.requests) == 3
+    assert len(entities) == 120
+    assert entities["Q0"] is None
+    # simplified entity
+    assert entities["Q42"]["labels"] == "label of Q42"
+
+    labels = fetcher.fetch_labels(["Q42", "P31", "Q0"])
+    assert labels == { "Q42": "label of Q42", "P31": "label of P31", "Q0": None }
+
+def test_retry(stub_server):
+    server = stub_server(StubWikidataHandler, nb_failures=2)
+    fetcher = WikidataEntityFetcher(api_url="http://127.0.0.1:" + str(server.server_port) + "/w/api.php", backoff=0.01)
+    assert fetcher.fetch_entity("Q42")["labels"] == "label of Q42"
+    assert len(server.requests) == 3
+
+def test_pluggable_transport():
+    calls = []
+    def transport(url, params, timeout):
+        calls.append(params["ids"])
+        if "Q1" in params["ids"].split("|"):
+            raise WikidataTransportError("not found", status=404)
+        return { "entities": { entity_id: { "id": entity_id, "labels": {} } for entity_id in params["ids"].split("|") } }
+
+    fetcher = WikidataEntityFetcher(transport=transport, backoff=0.01)
+    # client errors are not retried
+    assert fetcher.fetch_entity("Q1") is None
+    assert fetcher.fetch_entity("Q2", simplify=False) == { "id": "Q2", "labels": {} }
+    assert calls == ["Q1", "Q2"]
+
+    # failed requests are not taken as missing entities
+    assert fetcher.fetch(["Q1", "Q2"]) == {}
+    assert fetcher.fetch_labels(["Q1"]) == {}
+    assert fetcher.fetch_labels(["Q2"]) == { "Q2": None }
+
+    # an empty response is a failed request, retried a bounded number of times
+    calls = []
+    def empty_transport(url, params, timeout):
+        calls.append(params["ids"])
+        return None
+    fetcher = WikidataEntityFetcher(transport=empty_transport, max_retries=2, backoff=0.001)
+    assert fetcher.fetch(["Q1"]) == {}
+    assert len(calls) == 3
+
+def test_fetcher_per_instance():
+    # each database object has its own fetcher, created from its own config
+    first = CommonArangoDB()
+    first.config = { "wikidata": { "wikidata_api_url": "http://127.0.0.1:1/w/api.php", "batch_size": 10 } }
+    second = CommonArangoDB()
+    second.config = { "wikidata": None }
+    assert first.get_wikidata_fetcher() is first.get_wikidata_fetcher()
+    assert first.get_wikidata_fetcher().api_url == "http://127.0.0.1:1/w/api.php"
+    assert first.get_wikidata_fetcher().batch_size == 10
+    assert second.get_wikidata_fetcher().api_url == "https://www.wikidata.org/w/api.php"
+    assert second.get_wikidata_fetcher().batch_size == 50
+
+if __name__ == "__main__":
+    with stub_servers() as stub_server:
+        test_batched_fetch(stub_server)
+        test_retry(stub_server)
+    test_pluggable_transport()
+    test_fetcher_per_instance()